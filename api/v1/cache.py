@@ -0,0 +1,271 @@
+"""
+In-memory caching module.
+
+Defines `AsyncCache`, a read-through cache for service functions: entries
+expire after a TTL, the least recently used ones are evicted past a size
+bound, concurrent misses on the same key share a single load, and entries are
+dropped by tag from the write paths with `invalidate`.
+
+Invalidations are also published on the event broker, so that the caches of
+the other workers drop the same tags. Each invalidation also bumps the version
+of its tags, from which list endpoints build their collection ETags. When the
+connection to the broker is restored, invalidations may have been missed, so
+every cache is cleared and every tag version bumped.
+"""
+
+import asyncio
+import functools
+import inspect
+import json
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Set
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.v1 import events
+from envconfig import EnvFile
+
+INVALIDATION_CHANNEL = "cache-invalidation"
+
+# Identifies this worker in the invalidation messages it publishes
+WORKER_ID = uuid.uuid4().hex
+
+_MISSING = object()
+_caches: List["AsyncCache"] = []
+_versions: Dict[str, int] = {}
+# Bumped when invalidations may have been missed, changing every tag version
+_epoch = 0
+_background: Set[asyncio.Task] = set()
+_listener = None
+
+
+class AsyncCache:
+    """
+    A size-bounded LRU cache whose entries expire `ttl` seconds after being set.
+    A `ttl` of 0 disables caching.
+    """
+
+    def __init__(self, name: str, ttl: float, maxsize: int = None):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize or EnvFile.CACHE_MAX_ENTRIES
+        self._entries: OrderedDict = OrderedDict()
+        self._tags: Dict[str, Set[Hashable]] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # Bumped on invalidation, so loads started before it are not stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        _caches.append(self)
+
+    def get(self, key: Hashable) -> Any:
+        """Returns the cached value of `key`, or `_MISSING`."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value, _ = entry
+        if expires_at < time.monotonic():
+            self._discard(key)
+            return _MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[str] = ()):
+        if self.ttl <= 0:
+            return
+        self._discard(key)
+        tags = tuple(tags)
+        self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._discard(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _discard(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate_tags(self, tags: Iterable[str]):
+        for tag in tags:
+            for key in list(self._tags.get(tag, ())):
+                self._discard(key)
+        self._generation += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._tags.clear()
+        self._generation += 1
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        tags: Iterable[str] = (),
+    ) -> Any:
+        """
+        Returns the cached value of `key`, or loads, caches and returns it.
+
+        While a load is running, other callers asking for the same key wait for
+        its result instead of loading it again.
+        """
+        value = self.get(key)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The caller running the load went away, load it ourselves
+                return await self.get_or_load(key, loader, tags)
+
+        self.misses += 1
+        generation = self._generation
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark it retrieved, waiters (if any) get it from the future
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        future.set_result(value)
+        if generation == self._generation:
+            self.set(key, value, tags)
+        return value
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "name": self.name,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+def cached(cache: AsyncCache, tags: Iterable[str] = ()):
+    """
+    Caches the results of an async service function in `cache`, keyed by its
+    arguments except the database session.
+
+    `tags` may reference the function's arguments, e.g. `"formation:{id}"`.
+    """
+    tags = tuple(tags)
+
+    def decorator(fn):
+        signature = inspect.signature(fn)
+        key_params = [
+            name
+            for name, param in signature.parameters.items()
+            if param.annotation is not AsyncSession and name != "session"
+        ]
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = bound.arguments
+            key = (fn.__name__,) + tuple(arguments[name] for name in key_params)
+            entry_tags = [tag.format(**arguments) for tag in tags]
+            return await cache.get_or_load(key, lambda: fn(*args, **kwargs), entry_tags)
+
+        return wrapper
+
+    return decorator
+
+
+def _drop_tags(tags: Iterable[str]):
+    tags = list(tags)
+    for tag in tags:
+        _versions[tag] = _versions.get(tag, 0) + 1
+    for cache in _caches:
+        cache.invalidate_tags(tags)
+
+
+def tag_version(tag: str) -> str:
+    """
+    Returns the current version of `tag`. It includes the worker id, so versions
+    from before a restart or from another worker never match.
+    """
+    return f"{WORKER_ID[:12]}.{_epoch}.{_versions.get(tag, 0)}"
+
+
+def invalidate(*tags: str):
+    """
+    Drops the entries tagged with any of `tags` from every cache, called by the
+    write paths after a commit. Other workers are told through the broker.
+    """
+    _drop_tags(tags)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    message = json.dumps({"origin": WORKER_ID, "tags": tags})
+    task = loop.create_task(events.broker.publish(INVALIDATION_CHANNEL, message))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+def _on_invalidation(message: str):
+    data = json.loads(message)
+    if data.get("origin") != WORKER_ID:
+        _drop_tags(data.get("tags", ()))
+
+
+def _drop_everything():
+    global _epoch
+    _epoch += 1
+    for cache in _caches:
+        cache.clear()
+
+
+async def start_invalidation_listener():
+    """Applies the invalidations published by the other workers."""
+    global _listener
+    if _listener is None:
+        _listener = asyncio.create_task(
+            events.listen_forever(
+                INVALIDATION_CHANNEL, _on_invalidation, _drop_everything
+            )
+        )
+
+
+async def stop_invalidation_listener():
+    global _listener
+    if _listener is not None:
+        _listener.cancel()
+        _listener = None
+
+
+def cache_metrics() -> List[Dict[str, Any]]:
+    return [cache.metrics() for cache in _caches]
@@ -0,0 +1,215 @@
+"""
+Event broadcasting module.
+
+Defines the in-process `Broadcaster` that fans events out to streaming clients,
+and the brokers it publishes through. `LocalBroker` delivers messages within
+the process and stands in for `RedisBroker` when the application runs as a
+single worker. Channels are listened to with `listen_forever`, which reconnects
+to the broker when the connection is lost.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from envconfig import EnvFile
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - optional dependency
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+CHECKIN_CHANNEL = "checkins"
+LISTEN_RETRY_MIN_DELAY = 1
+LISTEN_RETRY_MAX_DELAY = 30
+
+
+class LocalBroker:
+    """Delivers published messages to the handlers listening in this process."""
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Callable[[str], None]]] = {}
+
+    async def publish(self, channel: str, message: str):
+        for handler in list(self._handlers.get(channel, ())):
+            handler(message)
+
+    async def listen(
+        self,
+        channel: str,
+        handler: Callable[[str], None],
+        on_ready: Optional[Callable[[], None]] = None,
+    ):
+        """
+        Calls `handler` with every message of `channel` until cancelled, and
+        `on_ready` once listening.
+        """
+        self._handlers.setdefault(channel, []).append(handler)
+        if on_ready is not None:
+            on_ready()
+        try:
+            await asyncio.Future()
+        finally:
+            self._handlers[channel].remove(handler)
+
+
+class RedisBroker:
+    """Relays messages through Redis pub/sub, so every worker receives them."""
+
+    def __init__(self, url: str):
+        if aioredis is None:
+            raise RuntimeError("EVENT_BROKER_URL requires redis to be installed.")
+        self._redis = aioredis.from_url(url)
+
+    async def publish(self, channel: str, message: str):
+        await self._redis.publish(channel, message)
+
+    async def listen(
+        self,
+        channel: str,
+        handler: Callable[[str], None],
+        on_ready: Optional[Callable[[], None]] = None,
+    ):
+        """
+        Calls `handler` with every message of `channel` until cancelled or the
+        connection is lost, and `on_ready` once subscribed.
+        """
+        pubsub = self._redis.pubsub()
+        try:
+            await pubsub.subscribe(channel)
+            if on_ready is not None:
+                on_ready()
+            async for item in pubsub.listen():
+                if item["type"] == "message":
+                    data = item["data"]
+                    handler(data.decode() if isinstance(data, bytes) else data)
+        finally:
+            try:
+                await pubsub.unsubscribe(channel)
+            finally:
+                await pubsub.aclose()
+
+
+def make_broker(url: str):
+    return RedisBroker(url) if url else LocalBroker()
+
+
+broker = make_broker(EnvFile.EVENT_BROKER_URL)
+
+
+async def listen_forever(
+    channel: str,
+    handler: Callable[[str], None],
+    on_reconnect: Optional[Callable[[], None]] = None,
+):
+    """
+    Listens to `channel` with `handler` until cancelled. When the connection to
+    the broker is lost, it listens again after a delay doubling up to
+    `LISTEN_RETRY_MAX_DELAY` seconds. Messages published meanwhile are lost, so
+    `on_reconnect` is called once listening again.
+    """
+    delay = LISTEN_RETRY_MIN_DELAY
+    attempts = 0
+
+    def ready():
+        nonlocal delay
+        delay = LISTEN_RETRY_MIN_DELAY
+        if attempts and on_reconnect is not None:
+            on_reconnect()
+
+    while True:
+        try:
+            await broker.listen(channel, handler, ready)
+            logger.warning("Stopped listening to %s, reconnecting.", channel)
+        except Exception:
+            logger.exception(
+                "Listening to %s failed, retrying in %s seconds.", channel, delay
+            )
+        attempts += 1
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, LISTEN_RETRY_MAX_DELAY)
+
+
+class Subscriber:
+    """A streaming client, with its bounded buffer of pending events."""
+
+    def __init__(self, queue_size: int, formation_id: Optional[int] = None):
+        self.formation_id = formation_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    def wants(self, event: Dict[str, Any]) -> bool:
+        if self.formation_id is None:
+            return True
+        return self.formation_id in event.get("formation_ids", ())
+
+
+class Broadcaster:
+    """
+    Fans the events of a broker channel out to the subscribers of this process.
+
+    Each subscriber has a buffer of `queue_size` events. A subscriber whose
+    buffer is full is too slow to keep up: its pending events are discarded and
+    it receives `None`, telling it to disconnect.
+    """
+
+    def __init__(self, channel: str, queue_size: int):
+        self.channel = channel
+        self.queue_size = queue_size
+        self._subscribers: Set[Subscriber] = set()
+        self._listener: Optional[asyncio.Task] = None
+
+    @property
+    def active(self) -> bool:
+        """Whether published events can reach anyone."""
+        return bool(self._subscribers) or not isinstance(broker, LocalBroker)
+
+    def subscribe(self, formation_id: Optional[int] = None) -> Subscriber:
+        subscriber = Subscriber(self.queue_size, formation_id)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+
+    async def publish(self, events: List[Dict[str, Any]]):
+        """Publishes a list of events as a single broker message."""
+        if events:
+            await broker.publish(self.channel, json.dumps(events, default=str))
+
+    def _fan_out(self, message: str):
+        events = json.loads(message)
+        for subscriber in list(self._subscribers):
+            for event in events:
+                if not subscriber.wants(event):
+                    continue
+                try:
+                    subscriber.queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    self._drop(subscriber)
+                    break
+
+    def _drop(self, subscriber: Subscriber):
+        self.unsubscribe(subscriber)
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+        logger.info("Dropped a slow %s subscriber.", self.channel)
+
+    async def start(self):
+        if self._listener is None:
+            self._listener = asyncio.create_task(
+                listen_forever(self.channel, self._fan_out)
+            )
+            # Let the listener register before events are published
+            await asyncio.sleep(0)
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+
+checkins = Broadcaster(CHECKIN_CHANNEL, EnvFile.EVENT_QUEUE_SIZE)
@@ -94,3 +94,27 @@ class UnprocessableEntityException(AppException):
         message="This resource's type or value is incorrect.",
     ):
         super().__init__(message, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+
+class FeatureNotAvailable(AppException):
+    def __init__(
+        self,
+        message="This feature is not available on this server.",
+    ):
+        super().__init__(message, status.HTTP_501_NOT_IMPLEMENTED)
+
+
+class GoneException(AppException):
+    def __init__(
+        self,
+        message="This resource is no longer available.",
+    ):
+        super().__init__(message, status.HTTP_410_GONE)
+
+
+class ForbiddenException(AppException):
+    def __init__(
+        self,
+        message="You are not allowed to access this resource.",
+    ):
+        super().__init__(message, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,179 @@
+"""
+Event loop lag monitor module.
+
+Finds the code blocking the event loop. A heartbeat task wakes up every
+`interval` seconds on the loop and measures how late it is. Meanwhile a
+watchdog thread checks the heartbeat: when it is late by more than
+`threshold`, the loop is stuck in a callback, and the watchdog captures the
+stack of the loop's thread. Once the loop is free again, the heartbeat charges
+the measured lag to that stack.
+
+Blocking sites are aggregated by the innermost application frame of their
+stack and the frame that actually blocked, with their count and blocked time.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional
+
+from envconfig import EnvFile
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MAX_SITES = 100
+STACK_DEPTH = 30
+
+
+def _is_app_frame(filename: str) -> bool:
+    return filename.startswith(ROOT) and "site-packages" not in filename
+
+
+def _describe(frame: traceback.FrameSummary) -> str:
+    filename = frame.filename
+    if filename.startswith(ROOT):
+        filename = os.path.relpath(filename, ROOT)
+    return f"{filename}:{frame.lineno} in {frame.name}"
+
+
+class BlockingSite:
+    def __init__(self, site: str, stack: List[str]):
+        self.site = site
+        self.stack = stack
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_seen: Optional[float] = None
+
+    def add(self, lag: float):
+        self.count += 1
+        self.total_time += lag
+        self.max_time = max(self.max_time, lag)
+        self.last_seen = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "site": self.site,
+            "count": self.count,
+            "total_time": round(self.total_time, 4),
+            "max_time": round(self.max_time, 4),
+            "last_seen": self.last_seen,
+            "stack": self.stack,
+        }
+
+
+class LoopMonitor:
+    def __init__(self, threshold: float, interval: float, log: bool = False):
+        self.threshold = threshold
+        self.interval = interval
+        self.log = log
+        self.sites: Dict[str, BlockingSite] = {}
+        self.episodes = 0
+        self.blocked_time = 0.0
+        self._lock = threading.Lock()
+        self._expected: Optional[float] = None
+        self._captured: Optional[tuple] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    async def start(self):
+        if self._heartbeat is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._stopping.clear()
+        self._expected = time.monotonic() + self.interval
+        self._heartbeat = asyncio.create_task(self._beat())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-monitor", daemon=True
+        )
+        self._watchdog.start()
+
+    async def stop(self):
+        if self._heartbeat is None:
+            return
+        self._heartbeat.cancel()
+        self._heartbeat = None
+        self._stopping.set()
+        self._watchdog.join()
+        self._watchdog = None
+
+    async def _beat(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = now - self._expected
+            self._expected = now + self.interval
+            with self._lock:
+                captured, self._captured = self._captured, None
+            if lag >= self.threshold:
+                self._record(lag, captured)
+
+    def _watch(self):
+        # Checks a few times per threshold, so that the stack is taken while
+        # the loop is still blocked
+        period = min(self.interval, self.threshold) / 2
+        while not self._stopping.wait(period):
+            expected = self._expected
+            if time.monotonic() - expected < self.threshold:
+                continue
+            with self._lock:
+                if self._captured is not None and self._captured[0] == expected:
+                    continue
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    stack = traceback.extract_stack(frame)[-STACK_DEPTH:]
+                    self._captured = (expected, stack)
+                del frame
+
+    def _record(self, lag: float, captured: Optional[tuple]):
+        self.episodes += 1
+        self.blocked_time += lag
+        if captured is None:
+            # The watchdog missed it, the loop was busy on many short callbacks
+            key, stack = "unknown", []
+        else:
+            stack = captured[1]
+            app_frames = [f for f in stack if _is_app_frame(f.filename)]
+            site = _describe(app_frames[-1]) if app_frames else "unknown"
+            key = f"{site} -> {_describe(stack[-1])}"
+            stack = [_describe(f) for f in stack]
+
+        entry = self.sites.get(key)
+        if entry is None:
+            if len(self.sites) >= MAX_SITES:
+                least = min(self.sites.values(), key=lambda s: s.total_time)
+                del self.sites[least.site]
+            entry = self.sites[key] = BlockingSite(key, stack)
+        entry.add(lag)
+
+        if self.log:
+            logger.warning(
+                "Event loop blocked for %.3f s at %s\n%s", lag, key, "\n".join(stack)
+            )
+
+    def report(self) -> Dict[str, Any]:
+        sites = sorted(self.sites.values(), key=lambda s: s.total_time, reverse=True)
+        return {
+            "running": self._heartbeat is not None,
+            "threshold": self.threshold,
+            "episodes": self.episodes,
+            "blocked_time": round(self.blocked_time, 4),
+            "sites": [site.to_dict() for site in sites],
+        }
+
+    def reset(self):
+        self.sites.clear()
+        self.episodes = 0
+        self.blocked_time = 0.0
+
+
+loop_monitor = LoopMonitor(
+    EnvFile.LOOP_LAG_THRESHOLD, EnvFile.LOOP_MONITOR_INTERVAL, EnvFile.LOOP_MONITOR_LOG
+)
@@ -0,0 +1,237 @@
+"""
+Request metrics module.
+
+Holds the figures `MetricsMiddleware` collects and renders them in the
+Prometheus text format:
+
+- request counts, latency histograms and in-flight requests, per route;
+- SQL statement count and DB time per request, from the cursor events of the
+  instrumented engines;
+- connection pool checkout wait, measured by `TimedQueuePool`, and the
+  current pool occupancy.
+
+The per-request DB figures are gathered in a `RequestStats` set in a context
+variable by the middleware. It is only set for sampled requests, so the
+cursor event handlers do nothing for the others.
+"""
+
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+WAIT_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+
+class Histogram:
+    """A cumulative histogram with fixed upper bounds."""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> List[str]:
+        sep = "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+class RequestStats:
+    """The DB figures of a single request."""
+
+    __slots__ = ("queries", "db_time", "pool_wait")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.pool_wait = 0.0
+
+
+current_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "current_stats", default=None
+)
+_in_checkout: ContextVar[bool] = ContextVar("in_checkout", default=False)
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_time = Histogram(LATENCY_BUCKETS)
+        self.pool_wait = Histogram(WAIT_BUCKETS)
+
+
+# Keyed by (method, route, status)
+requests_total: Dict[Tuple[str, str, int], int] = {}
+# Keyed by (method, route)
+routes: Dict[Tuple[str, str], RouteMetrics] = {}
+# Scopes of the requests being served, their route is read at render time
+in_flight: Dict[int, dict] = {}
+checkout_wait = Histogram(WAIT_BUCKETS)
+_engines: List[AsyncEngine] = []
+
+
+def route_label(scope: dict) -> str:
+    """The path template of the route that served `scope`."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def record_request(
+    method: str,
+    route: str,
+    status_code: int,
+    duration: Optional[float] = None,
+    stats: Optional[RequestStats] = None,
+):
+    key = (method, route, status_code)
+    requests_total[key] = requests_total.get(key, 0) + 1
+    if duration is None:
+        return
+    metrics = routes.get((method, route))
+    if metrics is None:
+        metrics = routes[(method, route)] = RouteMetrics()
+    metrics.latency.observe(duration)
+    if stats is not None:
+        metrics.queries.observe(stats.queries)
+        metrics.db_time.observe(stats.db_time)
+        metrics.pool_wait.observe(stats.pool_wait)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    The default pool of async engines, timing how long each checkout waits for
+    a connection (including the time to open a new one).
+    """
+
+    def _do_get(self):
+        # `_do_get` calls itself when it has to retry, only the outer call counts
+        if _in_checkout.get():
+            return super()._do_get()
+        token = _in_checkout.set(True)
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            _in_checkout.reset(token)
+            elapsed = time.perf_counter() - start
+            checkout_wait.observe(elapsed)
+            stats = current_stats.get()
+            if stats is not None:
+                stats.pool_wait += elapsed
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    if current_stats.get() is not None:
+        conn.info["query_start"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    stats = current_stats.get()
+    if stats is None:
+        return
+    start = conn.info.pop("query_start", None)
+    if start is not None:
+        stats.db_time += time.perf_counter() - start
+    stats.queries += 1
+
+
+def instrument_engine(engine: AsyncEngine):
+    """Counts and times the statements of `engine` for the sampled requests."""
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    _engines.append(engine)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _header(name: str, kind: str, help_text: str) -> Iterable[str]:
+    return (f"# HELP {name} {help_text}", f"# TYPE {name} {kind}")
+
+
+def render_metrics() -> str:
+    """Returns every metric in the Prometheus text exposition format."""
+    lines = []
+
+    lines.extend(
+        _header("http_requests_total", "counter", "Requests served, by route.")
+    )
+    for (method, route, code), count in sorted(requests_total.items()):
+        lines.append(
+            f'http_requests_total{{method="{method}",route="{_escape(route)}",'
+            f'status="{code}"}} {count}'
+        )
+
+    lines.extend(_header("http_requests_in_flight", "gauge", "Requests being served."))
+    current: Dict[Tuple[str, str], int] = {}
+    for scope in list(in_flight.values()):
+        key = (scope["method"], route_label(scope))
+        current[key] = current.get(key, 0) + 1
+    for (method, route), count in sorted(current.items()):
+        lines.append(
+            f'http_requests_in_flight{{method="{method}",route="{_escape(route)}"}} '
+            f"{count}"
+        )
+
+    histograms = (
+        ("http_request_duration_seconds", "latency", "Request latency."),
+        ("http_request_db_queries", "queries", "SQL statements per request."),
+        ("http_request_db_seconds", "db_time", "Time spent in SQL per request."),
+        (
+            "http_request_pool_wait_seconds",
+            "pool_wait",
+            "Time spent waiting for pooled connections per request.",
+        ),
+    )
+    for name, attr, help_text in histograms:
+        lines.extend(_header(name, "histogram", help_text + " Sampled requests."))
+        for (method, route), metrics in sorted(routes.items()):
+            labels = f'method="{method}",route="{_escape(route)}"'
+            lines.extend(getattr(metrics, attr).render(name, labels))
+
+    lines.extend(
+        _header(
+            "db_pool_checkout_wait_seconds",
+            "histogram",
+            "Time waited for a pooled connection, all checkouts.",
+        )
+    )
+    lines.extend(checkout_wait.render("db_pool_checkout_wait_seconds", ""))
+
+    gauges = (
+        ("db_pool_size", "size", "Connections the pool keeps open."),
+        ("db_pool_checked_out", "checkedout", "Connections in use."),
+        ("db_pool_overflow", "overflow", "Connections open beyond the pool size."),
+    )
+    for name, method, help_text in gauges:
+        lines.extend(_header(name, "gauge", help_text))
+        for engine in _engines:
+            pool = engine.pool
+            if hasattr(pool, method):
+                value = getattr(pool, method)()
+                lines.append(f'{name}{{engine="{engine.url.username}"}} {value}')
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,254 @@
+"""
+Response compression module.
+
+Defines `CompressionMiddleware`, which compresses responses with the best
+encoding the client accepts among zstd, brotli and gzip. Only bodies of an
+allowed content type and at least `minimum_size` bytes are compressed, and
+bodies above `thread_threshold` bytes are compressed in a worker thread to
+keep the event loop free. Streamed bodies are compressed chunk by chunk.
+
+brotli and zstandard are listed in the requirements. Should either be
+missing, its encoding is simply not offered. Responses that already carry a
+`Content-Encoding` are left untouched.
+"""
+
+import zlib
+from typing import Callable, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+# Compressible content types. Images such as WEBP, PDFs and gzip exports are
+# already compressed, and event streams must reach the client unbuffered.
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/csv",
+    "text/html",
+    "text/plain",
+    "text/css",
+    "text/xml",
+)
+
+
+class _GzipCompressor:
+    def __init__(self):
+        self._obj = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+class _BrotliCompressor:
+    def __init__(self):
+        self._obj = brotli.Compressor(quality=5)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.process(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
+
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+
+class _ZstdCompressor:
+    def __init__(self):
+        self._obj = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+# Encodings in order of preference: (token, compressor)
+ENCODINGS: List[Tuple[str, Callable]] = [
+    *([("zstd", _ZstdCompressor)] if zstandard else []),
+    *([("br", _BrotliCompressor)] if brotli else []),
+    ("gzip", _GzipCompressor),
+]
+
+
+def _quality(params: str) -> float:
+    # Parameters other than `q` may come in any order, e.g. `gzip;foo=1;q=0.5`
+    for param in params.split(";"):
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "q":
+            try:
+                return float(value.strip())
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[Tuple[str, Callable]]:
+    """
+    Returns the encoding the client accepts with the highest quality, ours
+    being preferred in `ENCODINGS` order among equal ones, if any.
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        token, _, params = item.partition(";")
+        accepted[token.strip().lower()] = _quality(params)
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = accepted.get(encoding[0], accepted.get("*", 0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.split(";")[0].strip().lower() in COMPRESSIBLE_TYPES
+
+
+def compress_bytes(data: bytes, compressor_cls: Callable) -> bytes:
+    compressor = compressor_cls()
+    return compressor.compress(data) + compressor.finish()
+
+
+def _weak_etag(headers: MutableHeaders):
+    # The compressed body differs from the identity one, so its ETag is weakened
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["etag"] = f"W/{etag}"
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        thread_threshold: int = 1_000_000,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.thread_threshold = thread_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(
+            send, encoding, self.minimum_size, self.thread_threshold
+        )
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(
+        self,
+        send: Send,
+        encoding: Tuple[str, Callable],
+        minimum_size: int,
+        thread_threshold: int,
+    ):
+        self._send = send
+        self.token, self.compressor_cls = encoding
+        self.minimum_size = minimum_size
+        self.thread_threshold = thread_threshold
+        self.start_message: Optional[Message] = None
+        self.active = False
+        self.compressor = None
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if (
+                message["status"] in (204, 304)
+                or "content-encoding" in headers
+                or not is_compressible(headers.get("content-type", ""))
+            ):
+                await self._send(message)
+                return
+            # Held back until the first body chunk tells whether to compress
+            self.start_message = message
+            return
+
+        if message["type"] != "http.response.body" or self.start_message is None:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        headers = MutableHeaders(raw=self.start_message["headers"])
+
+        if not self.active:
+            if not more_body:
+                # The whole body is known
+                start, self.start_message = self.start_message, None
+                if len(body) < self.minimum_size:
+                    await self._send(start)
+                    await self._send(message)
+                    return
+                if len(body) > self.thread_threshold:
+                    body = await run_in_threadpool(
+                        compress_bytes, body, self.compressor_cls
+                    )
+                else:
+                    body = compress_bytes(body, self.compressor_cls)
+                self._set_headers(headers)
+                headers["content-length"] = str(len(body))
+                await self._send(start)
+                await self._send({"type": "http.response.body", "body": body})
+                return
+
+            # Streamed body, compressed chunk by chunk
+            self.active = True
+            self.compressor = self.compressor_cls()
+            self._set_headers(headers)
+            del headers["content-length"]
+            await self._send(self.start_message)
+
+        if len(body) > self.thread_threshold:
+            chunk = await run_in_threadpool(self._compress_chunk, body, more_body)
+        else:
+            chunk = self._compress_chunk(body, more_body)
+        await self._send(
+            {"type": "http.response.body", "body": chunk, "more_body": more_body}
+        )
+
+    def _compress_chunk(self, body: bytes, more_body: bool) -> bytes:
+        data = self.compressor.compress(body)
+        return data + (
+            self.compressor.flush() if more_body else self.compressor.finish()
+        )
+
+    def _set_headers(self, headers: MutableHeaders):
+        headers["content-encoding"] = self.token
+        headers.add_vary_header("Accept-Encoding")
+        _weak_etag(headers)
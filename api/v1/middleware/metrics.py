@@ -0,0 +1,72 @@
+"""
+Request metrics middleware module.
+
+Defines `MetricsMiddleware`, which counts every request and tracks the ones
+in flight. A `sample_rate` share of the requests is also timed, with the SQL
+statements and pool waits they caused, into the histograms of
+`api.v1.metrics`.
+"""
+
+import random
+import time
+
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.v1 import metrics
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp, sample_rate: float = 0.1):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        stats = token = None
+        if sampled:
+            stats = metrics.RequestStats()
+            token = metrics.current_stats.set(stats)
+            start = time.perf_counter()
+
+        key = id(scope)
+        metrics.in_flight[key] = scope
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            del metrics.in_flight[key]
+            route = metrics.route_label(scope)
+            if sampled:
+                metrics.current_stats.reset(token)
+                metrics.record_request(
+                    scope["method"],
+                    route,
+                    status_code,
+                    time.perf_counter() - start,
+                    stats,
+                )
+            else:
+                metrics.record_request(scope["method"], route, status_code)
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    """
+    Serves the collected metrics to Prometheus. Mounted behind `require_admin`,
+    the scrape config has to send the `X-Admin-Token` header.
+    """
+    return Response(metrics.render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
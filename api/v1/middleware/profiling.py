@@ -0,0 +1,63 @@
+"""
+Request profiling middleware module.
+
+Defines `ProfilingMiddleware`, only installed when `PROFILING_ENABLED` is set,
+so it costs nothing otherwise. It profiles the requests sending an `X-Profile`
+header, either set to `1` along with a valid `X-Admin-Token`, or holding a
+signature from `sign_profile_request`. The profile id is returned in the
+`X-Profile-Id` response header, see `api.v1.profiling`.
+"""
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.v1 import profiling
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        signature = headers.get("x-profile")
+        if signature is None or not profiling.profile_allowed(
+            scope["method"],
+            scope["path"],
+            signature,
+            headers.get("x-admin-token"),
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        if profiling.profile_lock.locked():
+            # Another request is being profiled, serve this one as usual
+            await self.app(scope, receive, self._with_header(send, "busy"))
+            return
+
+        async with profiling.profile_lock:
+            profile_id = profiling.new_profile_id(scope["method"], scope["path"])
+            profiler = profiling.RequestProfiler()
+            profiler.start()
+            try:
+                await self.app(scope, receive, self._with_header(send, profile_id))
+            finally:
+                profiler.stop()
+                await run_in_threadpool(
+                    profiler.save, profiling.profile_path(profile_id)
+                )
+                await run_in_threadpool(profiling.prune_profiles)
+
+    @staticmethod
+    def _with_header(send: Send, profile_id: str) -> Send:
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Profile-Id"] = profile_id
+            await send(message)
+
+        return send_wrapper
@@ -0,0 +1,30 @@
+"""
+Query budget middleware module.
+
+Defines `QueryBudgetMiddleware`, meant for development and CI only. It records
+the statements of every request and reports repeated queries and exceeded
+route budgets, see `api.v1.query_budget`.
+"""
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from api.v1 import query_budget
+from api.v1.metrics import route_label
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with query_budget.track_queries() as trace:
+            await self.app(scope, receive, send)
+
+        found = query_budget.check_trace(trace, scope["method"], route_label(scope))
+        for finding in found:
+            query_budget.logger.warning(finding)
+        query_budget.violations.extend(found)
@@ -0,0 +1,38 @@
+"""
+Batch Request Model
+
+Defines a read operation of the `/batch` endpoint.
+"""
+
+import json
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic import BaseModel, Field, model_validator
+
+MAX_BATCH_OPERATIONS = 100
+
+
+class BatchOperation(BaseModel):
+    resource: str
+    id: Optional[int] = None
+    params: Dict[str, Any] = Field(default_factory=dict)
+
+    @model_validator(mode="after")
+    @classmethod
+    def validate(self, m: "BatchOperation") -> "BatchOperation":
+        """
+        Validates that `resource` is not empty.
+        """
+        if not m.resource:
+            raise ValueError("Missing required fields: resource")
+        return m
+
+    def key(self) -> Tuple[str, Optional[int], str]:
+        """
+        Identifies the operation, identical operations share the same key.
+        """
+        return (
+            self.resource,
+            self.id,
+            json.dumps(self.params, sort_keys=True, default=str),
+        )
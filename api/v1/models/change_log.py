@@ -0,0 +1,38 @@
+"""
+Change Log Table Model
+
+Defines the append-only `ChangeLog` table. Every insert, update and delete of
+a synced entity adds a row to it from the service layer, in the same
+transaction, and the auto-incremented `version` orders the changes.
+
+Payments and enrollments are tracked per student: a `payment` or `enrollment`
+change of id N means the payments or enrollments of student N changed, an
+`update`, or were all removed along with the student, a `delete`.
+
+Versions are assigned at insert but become visible at commit, so a version
+can appear before a lower one still in an open transaction. `created_at`
+tells readers how long such a gap has been open, see `get_changes`, and
+changes older than `CHANGE_RETENTION_DAYS` are pruned, see `prune_change_log`.
+"""
+
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Column, DateTime, Index, func
+from sqlmodel import SQLModel, Field
+
+CHANGE_OPS = ("insert", "update", "delete")
+CHANGE_ENTITIES = ("student", "teacher", "formation", "payment", "enrollment")
+
+
+class ChangeLog(SQLModel, table=True):
+    __tablename__ = "change_log"
+    __table_args__ = (Index("ix_change_log_entity_version", "entity", "version"),)
+    version: Optional[int] = Field(default=None, primary_key=True)
+    entity: str = Field(nullable=False, max_length=16)
+    entity_id: int = Field(nullable=False)
+    op: str = Field(nullable=False, max_length=6)
+    created_at: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(DateTime, nullable=False, server_default=func.now()),
+    )
@@ -0,0 +1,36 @@
+"""
+Dashboard Stats Table Models
+
+Defines the small rollup tables the admin dashboard figures are read from:
+
+- `MonthStats`: revenue and unpaid student count of each month;
+- `DayStats`: check-ins of each day;
+- `StatsCounter`: named totals, such as the student count.
+
+They are kept up to date by the write paths and the statistics reconciler,
+see `api.v1.services.rollup_service`.
+"""
+
+from datetime import date
+
+from sqlmodel import SQLModel, Field
+
+
+class MonthStats(SQLModel, table=True):
+    __tablename__ = "month_stats"
+    year: int = Field(primary_key=True)
+    month: int = Field(primary_key=True)
+    revenue: float = Field(default=0, nullable=False)
+    unpaid_count: int = Field(default=0, nullable=False)
+
+
+class DayStats(SQLModel, table=True):
+    __tablename__ = "day_stats"
+    day: date = Field(primary_key=True)
+    checkins: int = Field(default=0, nullable=False)
+
+
+class StatsCounter(SQLModel, table=True):
+    __tablename__ = "stats_counter"
+    name: str = Field(primary_key=True, max_length=32)
+    value: int = Field(default=0, nullable=False)
@@ -5,6 +5,7 @@ Defines the `Attendance` table using SQLModel.
 """
 
 from datetime import date
+from typing import List, Optional
 
 from fastapi.openapi.models import Contact
 from pydantic import BaseModel, field_validator, model_validator
@@ -39,6 +40,36 @@ class EnrollmentModel(BaseModel):
         return m
 
 
+class BulkEnrollmentModel(BaseModel):
+    pairs: Optional[List[EnrollmentModel]] = None
+    formation_id: Optional[int] = None
+    student_ids: Optional[List[int]] = None
+
+    @model_validator(mode="after")
+    @classmethod
+    def validate(self, m: "BulkEnrollmentModel") -> "BulkEnrollmentModel":
+        """
+        Validates that exactly one of these is given:
+        - `pairs` of (student, formation)
+        - One `formation_id` with many `student_ids`
+        """
+        by_pairs = m.pairs is not None
+        by_formation = m.formation_id is not None or m.student_ids is not None
+
+        if by_pairs == by_formation:
+            raise ValueError(
+                "Give either `pairs` or `formation_id` with `student_ids`."
+            )
+        if by_formation and (m.formation_id is None or m.student_ids is None):
+            raise ValueError("Missing required fields: formation_id, student_ids")
+        return m
+
+    def to_pairs(self) -> List[tuple]:
+        if self.pairs is not None:
+            return [(p.student_id, p.formation_id) for p in self.pairs]
+        return [(student_id, self.formation_id) for student_id in self.student_ids]
+
+
 class Enrollment(SQLModel, table=True):
     student_id: int = Field(
         sa_column=Column(
@@ -0,0 +1,58 @@
+"""
+Kiosk Table Model
+
+Defines the `KioskCursor` table, which keeps the highest replayed sequence
+number of each scan kiosk, and the model of a kiosk log entry.
+"""
+
+from datetime import date
+from typing import Optional
+
+from pydantic import BaseModel, field_validator, model_validator
+from sqlmodel import SQLModel, Field
+
+from api.v1.utils import valid_date
+
+MAX_KIOSK_ID_LENGTH = 64
+
+
+class KioskLogEntry(BaseModel):
+    kiosk_id: str
+    seq: int
+    attend_date: date
+    student_id: Optional[int] = None
+    qr: Optional[str] = None
+
+    @field_validator("attend_date", mode="before")
+    @classmethod
+    def _parse_attend_date(cls, v):
+        if isinstance(v, str):
+            # throw error if the format is wrong
+            return date.fromisoformat(v)
+        return v
+
+    @model_validator(mode="after")
+    @classmethod
+    def validate(self, m: "KioskLogEntry") -> "KioskLogEntry":
+        """
+        Validates that:
+        - `kiosk_id` is not empty and not too long
+        - `seq` is positive
+        - `attend_date` meets the format requirements
+        - Either `student_id` or `qr` is given
+        """
+        if not m.kiosk_id or len(m.kiosk_id) > MAX_KIOSK_ID_LENGTH:
+            raise ValueError("Kiosk id is not valid.")
+        if m.seq < 1:
+            raise ValueError(f"Sequence number must be positive: {m.seq}")
+        if not valid_date(m.attend_date):
+            raise ValueError(f"Date is not valid: {m.attend_date}")
+        if m.student_id is None and not m.qr:
+            raise ValueError("Missing required fields: student_id or qr")
+        return m
+
+
+class KioskCursor(SQLModel, table=True):
+    __tablename__ = "kiosk_cursor"
+    kiosk_id: str = Field(primary_key=True, max_length=MAX_KIOSK_ID_LENGTH)
+    last_seq: int = Field(default=0, nullable=False)
@@ -0,0 +1,23 @@
+"""
+Student Month Stats Table Model
+
+Defines the `StudentMonthStats` rollup table, holding the number of attended
+days of each student per month. It is kept up to date by the attendance write
+paths and can be rebuilt from the `Attendance` table.
+"""
+
+from sqlalchemy import Column
+from sqlmodel import SQLModel, Field, ForeignKey
+
+
+class StudentMonthStats(SQLModel, table=True):
+    __tablename__ = "student_month_stats"
+    student_id: int = Field(
+        sa_column=Column(
+            ForeignKey("student.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+    )
+    year: int = Field(primary_key=True)
+    month: int = Field(primary_key=True)
+    attended_days: int = Field(default=0, nullable=False)
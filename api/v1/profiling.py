@@ -0,0 +1,153 @@
+"""
+On-demand request profiling module.
+
+Profiles single requests that ask for it, see `ProfilingMiddleware`, and keeps
+their profiles in `PROFILE_DIR` as pstats files, to be downloaded through the
+admin routes and opened with `pstats`, snakeviz or gprof2dot.
+
+yappi, listed in the requirements, is used: it follows coroutines across
+awaits and profiles the threads of the thread pool, such as
+`run_in_threadpool` work. Should it be missing, cProfile profiles the event
+loop's thread only.
+
+A request is allowed to be profiled by the admin token, or by a signature made
+with `sign_profile_request`, which can be handed out for one method and path
+until it expires.
+"""
+
+import asyncio
+import cProfile
+import hashlib
+import hmac
+import io
+import os
+import pstats
+import re
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from api.v1.exceptions import NotFoundException
+from api.v1.utils import is_admin_token
+from envconfig import EnvFile
+
+try:
+    import yappi
+except ImportError:  # pragma: no cover - optional dependency
+    yappi = None
+
+PROFILE_EXTENSION = ".pstats"
+
+# Only one request is profiled at a time, as profilers are process-wide
+profile_lock = asyncio.Lock()
+
+
+def sign_profile_request(method: str, path: str, expires: int) -> str:
+    """
+    Returns the `X-Profile` header value allowing to profile `method path`
+    until the `expires` timestamp.
+    """
+    message = f"{method.upper()} {path} {expires}".encode()
+    digest = hmac.new(EnvFile.ADMIN_TOKEN.encode(), message, hashlib.sha256)
+    return f"{expires}.{digest.hexdigest()}"
+
+
+def profile_allowed(
+    method: str,
+    path: str,
+    signature: Optional[str],
+    admin_token: Optional[str],
+) -> bool:
+    """Whether a request carries a valid admin token or profile signature."""
+    if not EnvFile.ADMIN_TOKEN:
+        return False
+    if is_admin_token(admin_token):
+        return True
+    expires, _, _ = (signature or "").partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    expected = sign_profile_request(method, path, int(expires))
+    return hmac.compare_digest(signature.encode(), expected.encode())
+
+
+class RequestProfiler:
+    """Profiles everything run in the process between `start` and `stop`."""
+
+    def start(self):
+        if yappi is not None:
+            yappi.clear_stats()
+            yappi.set_clock_type("wall")
+            yappi.start(builtins=False, profile_threads=True)
+        else:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self):
+        # cProfile must be disabled from the thread that enabled it
+        if yappi is not None:
+            yappi.stop()
+        else:
+            self._profile.disable()
+
+    def save(self, path: str):
+        """Writes the profile, blocking, so meant for a worker thread."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if yappi is not None:
+            yappi.get_func_stats().save(path, type="pstat")
+            yappi.clear_stats()
+        else:
+            self._profile.dump_stats(path)
+
+
+def new_profile_id(method: str, path: str) -> str:
+    route = re.sub(r"[^A-Za-z0-9-]+", "_", path.strip("/"))[:60] or "root"
+    return f"{int(time.time())}-{method.lower()}-{route}-{uuid.uuid4().hex[:8]}"
+
+
+def profile_path(profile_id: str) -> str:
+    return os.path.join(EnvFile.PROFILE_DIR, profile_id + PROFILE_EXTENSION)
+
+
+def prune_profiles():
+    """Deletes the oldest profiles beyond `PROFILE_KEEP`."""
+    profiles = list_profiles()
+    for profile in profiles[EnvFile.PROFILE_KEEP :]:
+        try:
+            os.remove(profile_path(profile["id"]))
+        except FileNotFoundError:
+            pass
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Returns the stored profiles, newest first."""
+    if not os.path.isdir(EnvFile.PROFILE_DIR):
+        return []
+    profiles = []
+    for entry in os.scandir(EnvFile.PROFILE_DIR):
+        if entry.name.endswith(PROFILE_EXTENSION):
+            stat = entry.stat()
+            profiles.append(
+                {
+                    "id": entry.name[: -len(PROFILE_EXTENSION)],
+                    "size": stat.st_size,
+                    "created": stat.st_mtime,
+                }
+            )
+    profiles.sort(key=lambda p: p["created"], reverse=True)
+    return profiles
+
+
+def get_profile_path(profile_id: str) -> str:
+    # Ids are file names, never paths
+    path = profile_path(os.path.basename(profile_id))
+    if not os.path.isfile(path):
+        raise NotFoundException("Profile not found.")
+    return path
+
+
+def profile_summary(profile_id: str, limit: int = 50) -> str:
+    """Returns the `limit` most time consuming functions of a profile."""
+    out = io.StringIO()
+    stats = pstats.Stats(get_profile_path(profile_id), stream=out)
+    stats.sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
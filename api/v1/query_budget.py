@@ -0,0 +1,163 @@
+"""
+Query budget module.
+
+Development and CI tooling that records the SQL statements a request or a
+test runs, and reports:
+
+- statements of the same shape run `N_PLUS_ONE_THRESHOLD` times or more with
+  different parameters, the signature of a query issued in a loop (N+1);
+- statements run twice with the same parameters, typically a primary-key
+  fetch of a row the request already loaded;
+- routes running more statements than their budget in `QUERY_BUDGETS`.
+
+`QueryBudgetMiddleware` checks every request when `QUERY_DETECTOR_ENABLED` is
+set, logging the findings and keeping the latest `MAX_VIOLATIONS` of them in
+`violations`. Tests use `assert_query_budget` to fail when a block of code
+exceeds its budget, see `tests/test_query_budgets.py`.
+"""
+
+import logging
+import re
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+N_PLUS_ONE_THRESHOLD = 3
+
+# Maximum statements per request, keyed by (method, route). Enrollment and
+# student writes include the refresh of the dashboard rollups and their change
+# log rows.
+QUERY_BUDGETS: Dict[Tuple[str, str], int] = {
+    ("POST", "/api/v1/students/{student_id}/enroll/{formation_id}"): 4,
+    ("DELETE", "/api/v1/students/{student_id}/enrollments/{formation_id}/remove"): 4,
+    ("DELETE", "/api/v1/students/{id}/delete"): 11,
+    ("PATCH", "/api/v1/formations/assign/{teacher_id}"): 2,
+    ("PATCH", "/api/v1/formations/unassign/{teacher_id}"): 2,
+}
+
+MAX_VIOLATIONS = 1000
+
+# Latest findings of the requests checked by the middleware
+violations: Deque[str] = deque(maxlen=MAX_VIOLATIONS)
+
+_PLACEHOLDER_LIST = re.compile(r"%s(?:\s*,\s*%s)+")
+_VALUES_LIST = re.compile(r"(\(%s[^)]*\))(?:\s*,\s*\(%s[^)]*\))+")
+_SPACES = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(statement: str) -> str:
+    """
+    Returns the shape of `statement`: whitespace is collapsed, and `IN` lists
+    and multi-row `VALUES` of any length are reduced to one item.
+    """
+    statement = _SPACES.sub(" ", statement).strip()
+    statement = _VALUES_LIST.sub(r"\1, ...", statement)
+    return _PLACEHOLDER_LIST.sub("%s, ...", statement)
+
+
+class QueryTrace:
+    """The statements run within a request or a tracked block."""
+
+    def __init__(self):
+        self.statements: List[Tuple[str, str]] = []
+        self._seen: Dict[Tuple[str, str], int] = {}
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def add(self, statement: str, parameters, many: bool):
+        shape = fingerprint(statement)
+        # Parameters of an executemany are one batch, never a duplicate
+        params = "many" if many else repr(parameters)
+        self.statements.append((shape, params))
+        self._seen[(shape, params)] = self._seen.get((shape, params), 0) + 1
+
+    def findings(self) -> List[str]:
+        found = []
+        shapes: Dict[str, int] = {}
+        for (shape, params), times in self._seen.items():
+            shapes[shape] = shapes.get(shape, 0) + 1
+            if times > 1 and params != "many":
+                found.append(f"same statement run {times} times: {shape} {params}")
+        for shape, variants in shapes.items():
+            if variants >= N_PLUS_ONE_THRESHOLD:
+                found.append(f"possible N+1, run with {variants} parameters: {shape}")
+        return found
+
+    def report(self) -> str:
+        lines = [f"{self.count} statements:"]
+        lines.extend(f"  {shape} {params}" for shape, params in self.statements)
+        return "\n".join(lines)
+
+
+current_trace: ContextVar[Optional[QueryTrace]] = ContextVar(
+    "current_trace", default=None
+)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(statement, parameters, many)
+
+
+def watch_engine(engine: AsyncEngine):
+    """Records the statements of `engine` in the current trace."""
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryTrace]:
+    """Records the statements run within the block."""
+    trace = QueryTrace()
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+
+
+def check_trace(trace: QueryTrace, method: str, route: str) -> List[str]:
+    """Returns the findings of a request, including an exceeded budget."""
+    found = [f"{method} {route}: {finding}" for finding in trace.findings()]
+    budget = QUERY_BUDGETS.get((method, route))
+    if budget is not None and trace.count > budget:
+        found.append(
+            f"{method} {route}: {trace.count} statements, budget is {budget}.\n"
+            f"{trace.report()}"
+        )
+    return found
+
+
+@contextmanager
+def assert_query_budget(
+    budget: Optional[int] = None, method: str = "GET", route: Optional[str] = None
+) -> Iterator[QueryTrace]:
+    """
+    Fails with `QueryBudgetExceeded` when the block runs more than `budget`
+    statements, or more than the budget of `route` in `QUERY_BUDGETS`.
+
+        with assert_query_budget(method="POST", route=ENROLL_ROUTE):
+            client.post(f"/api/v1/students/{s}/enroll/{f}")
+    """
+    if budget is None:
+        budget = QUERY_BUDGETS[(method, route)]
+    with track_queries() as trace:
+        yield trace
+    if trace.count > budget:
+        raise QueryBudgetExceeded(
+            f"{trace.count} statements, budget is {budget}.\n{trace.report()}"
+        )
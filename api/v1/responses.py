@@ -0,0 +1,39 @@
+"""
+Response classes module.
+
+Defines `FastJSONResponse`, which encodes plain rows (dicts, lists, dates)
+with orjson when it is installed, and with the standard json module
+otherwise. It is meant for trusted rows selected by the services, returned
+without going through response-model validation and `jsonable_encoder`.
+"""
+
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def _default(obj: Any):
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(
+                content, default=_default, option=orjson.OPT_NON_STR_KEYS
+            )
+        return json.dumps(
+            content, default=_default, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
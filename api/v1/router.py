@@ -13,6 +13,11 @@ from api.v1.routes import (
     payment_routes,
     teacher_routes,
     formation_routes,
+    export_routes,
+    stats_routes,
+    batch_routes,
+    change_routes,
+    admin_routes,
 )
 
 router = APIRouter(prefix="/api/v1")
@@ -23,3 +28,8 @@ router.include_router(attendance_routes.router)
 router.include_router(payment_routes.router)
 router.include_router(teacher_routes.router)
 router.include_router(formation_routes.router)
+router.include_router(export_routes.router)
+router.include_router(stats_routes.router)
+router.include_router(batch_routes.router)
+router.include_router(change_routes.router)
+router.include_router(admin_routes.router)
@@ -0,0 +1,73 @@
+"""
+Admin route definition module.
+
+Diagnostics for the maintainers of the server, guarded by the admin token.
+"""
+
+from fastapi import APIRouter, Depends, Query
+from starlette import status
+from starlette.responses import FileResponse, PlainTextResponse
+
+from api.v1.loop_monitor import loop_monitor
+from api.v1.profiling import get_profile_path, list_profiles, profile_summary
+from api.v1.slow_queries import clear_slow_queries, get_slow_queries
+from api.v1.utils import require_admin
+
+router = APIRouter(
+    prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)]
+)
+
+
+@router.get("/slow-queries", status_code=status.HTTP_200_OK)
+async def slow_queries():
+    """
+    Returns the statements slower than the threshold, the most time consuming
+    first, with their parameter shapes and execution plan.
+    """
+    return get_slow_queries()
+
+
+@router.delete("/slow-queries", status_code=status.HTTP_200_OK)
+async def reset_slow_queries():
+    clear_slow_queries()
+    return {"Success": "Slow-query log cleared."}
+
+
+@router.get("/loop-lag", status_code=status.HTTP_200_OK)
+async def loop_lag():
+    """
+    Returns the code sites that blocked the event loop, the most time consuming
+    first, with their count, blocked time and stack.
+    """
+    return loop_monitor.report()
+
+
+@router.delete("/loop-lag", status_code=status.HTTP_200_OK)
+async def reset_loop_lag():
+    loop_monitor.reset()
+    return {"Success": "Event loop lag report cleared."}
+
+
+@router.get("/profiles", status_code=status.HTTP_200_OK)
+async def profiles():
+    """
+    Lists the stored request profiles, newest first.
+    """
+    return list_profiles()
+
+
+@router.get("/profiles/{profile_id}", status_code=status.HTTP_200_OK)
+async def profile(
+    profile_id: str, format: str = Query("pstats", pattern="^(pstats|text)$")
+):
+    """
+    Downloads a request profile as a pstats file, or as a text summary of its
+    most time consuming functions.
+    """
+    if format == "text":
+        return PlainTextResponse(profile_summary(profile_id))
+    return FileResponse(
+        get_profile_path(profile_id),
+        media_type="application/octet-stream",
+        filename=f"{profile_id}.pstats",
+    )
@@ -4,9 +4,10 @@ Attendance route definition module.
 All routes that are associated with student's attendance records are here.
 """
 
-from typing import List
+from datetime import date
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, UploadFile, File, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
@@ -15,7 +16,11 @@ from api.v1.services.attendance_service import (
     add_attendance,
     get_attendances,
     delete_attendance,
+    ingest_kiosk_log,
+    get_attendance_summary,
+    stream_checkins,
 )
+from api.v1.utils import encode_cursor
 from db.session import get_session
 
 router = APIRouter(prefix="/attendances", tags=["Attendance"])
@@ -28,13 +33,61 @@ async def add(
     return await add_attendance(attendance, session)
 
 
+@router.post("/kiosk/ingest", status_code=status.HTTP_200_OK)
+async def kiosk_ingest(
+    log: UploadFile = File(...),
+    batch_size: Optional[int] = Query(None, ge=1, le=10000),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Replays a kiosk's offline check-in log (NDJSON, optionally gzip-compressed).
+    """
+    return await ingest_kiosk_log(log, session, batch_size)
+
+
+@router.get("/stream", status_code=status.HTTP_200_OK)
+async def stream(formation_id: Optional[int] = Query(None)):
+    """
+    Pushes check-ins as they are recorded, as Server-Sent Events, optionally
+    only those of a formation's students.
+    """
+    return await stream_checkins(formation_id)
+
+
 @router.get(
     "/{student_id}",
     response_model=List[str],
     status_code=status.HTTP_200_OK,
 )
-async def get(student_id: int, session: AsyncSession = Depends(get_session)):
-    return await get_attendances(student_id, session)
+async def get(
+    student_id: int,
+    response: Response,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = Query(None),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Returns a student's attendance dates, newest first. When a page is full, the
+    cursor of the next page is sent in the `X-Next-Cursor` header.
+    """
+    dates = await get_attendances(
+        student_id, session, date_from, date_to, limit, cursor
+    )
+    if limit and len(dates) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(dates[-1])
+    return dates
+
+
+@router.get("/{student_id}/summary", status_code=status.HTTP_200_OK)
+async def get_summary(
+    student_id: int,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    session: AsyncSession = Depends(get_session),
+):
+    return await get_attendance_summary(student_id, session, date_from, date_to)
 
 
 @router.delete("/delete", status_code=status.HTTP_200_OK)
@@ -0,0 +1,24 @@
+"""
+Batch route definition module.
+
+Serves many read operations in a single request.
+"""
+
+from typing import List
+
+from fastapi import APIRouter
+from starlette import status
+
+from api.v1.models.batch import BatchOperation
+from api.v1.services.batch_service import run_batch
+
+router = APIRouter(prefix="/batch", tags=["Batch"])
+
+
+@router.post("", status_code=status.HTTP_200_OK)
+async def batch(operations: List[BatchOperation]):
+    """
+    Executes a list of read operations and returns their results in the same
+    order.
+    """
+    return await run_batch(operations)
@@ -0,0 +1,30 @@
+"""
+Change feed route definition module.
+
+Lets clients sync incrementally by asking what changed since their last call.
+"""
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from api.v1.services.change_service import get_changes
+from db.session import get_session
+
+router = APIRouter(prefix="/changes", tags=["Changes"])
+
+
+@router.get("", status_code=status.HTTP_200_OK)
+async def changes(
+    since: Optional[str] = Query(None),
+    limit: int = Query(1000, ge=1, le=10000),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Returns the students, teachers, formations, payments and enrollments
+    changed since the `since` token. Answers 410 when the token is older than
+    the change log retention.
+    """
+    return await get_changes(session, since, limit)
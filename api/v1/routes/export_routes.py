@@ -0,0 +1,47 @@
+"""
+Export route definition module.
+
+All routes that stream full-history exports are here.
+"""
+
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Query
+from starlette import status
+
+from api.v1.services.export_service import (
+    export_students,
+    export_payments,
+    export_attendance,
+)
+
+router = APIRouter(prefix="/export", tags=["Export"])
+
+
+@router.get("/students", status_code=status.HTTP_200_OK)
+async def students(
+    format: str = Query("csv"),
+    gzip: bool = Query(False),
+):
+    return export_students(format, gzip)
+
+
+@router.get("/payments", status_code=status.HTTP_200_OK)
+async def payments(
+    format: str = Query("csv"),
+    gzip: bool = Query(False),
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+):
+    return export_payments(format, gzip, date_from, date_to)
+
+
+@router.get("/attendance", status_code=status.HTTP_200_OK)
+async def attendance(
+    format: str = Query("csv"),
+    gzip: bool = Query(False),
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+):
+    return export_attendance(format, gzip, date_from, date_to)
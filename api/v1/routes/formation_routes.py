@@ -4,9 +4,10 @@ Formation route definition module.
 All routes that are associated with formations are here.
 """
 
-from typing import List
+from datetime import date
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
@@ -25,15 +26,34 @@ from api.v1.services.formation_services import (
     assign_formation,
     get_formation_students,
     get_formation_details,
+    copy_formation_enrollments,
+    get_formation_attendance_matrix,
 )
+from api.v1.utils import collection_not_modified
 from db.session import get_session
 
 router = APIRouter(prefix="/formations")
 
 
 @router.get("/", status_code=status.HTTP_200_OK)
-async def get(session: AsyncSession = Depends(get_session)):
-    return await get_formations(session)
+async def get(
+    request: Request,
+    response: Response,
+    with_stats: bool = Query(False),
+    since: Optional[str] = Query(None),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Lists formations, with their enrolled headcount and next session date when
+    `with_stats` is set, and only the ones changed after the `since` change
+    feed token when given.
+    """
+    # The next session dates move on with the date alone
+    today = date.today().isoformat() if with_stats else ""
+    not_modified = collection_not_modified("formations", request, response, today)
+    if not_modified:
+        return not_modified
+    return await get_formations(session, with_stats, since)
 
 
 @router.post("/add", status_code=status.HTTP_201_CREATED)
@@ -102,6 +122,20 @@ async def get_students_enrolled(id: int, session: AsyncSession = Depends(get_ses
     return await get_formation_students(session, formation_id=id)
 
 
+@router.post("/{id}/enrollments/copy/{target_id}", status_code=status.HTTP_200_OK)
+async def copy_enrollments(
+    id: int, target_id: int, session: AsyncSession = Depends(get_session)
+):
+    return await copy_formation_enrollments(id, target_id, session)
+
+
 @router.get("/{id}/details")
 async def get_details(id: int, session: AsyncSession = Depends(get_session)):
     return await get_formation_details(id, session)
+
+
+@router.get("/{id}/attendance-matrix", status_code=status.HTTP_200_OK)
+async def get_attendance_matrix(
+    id: int, month: str = Query(...), session: AsyncSession = Depends(get_session)
+):
+    return await get_formation_attendance_matrix(id, month, session)
@@ -4,7 +4,9 @@ Image route definition module.
 All routes that are associated with student's images are here.
 """
 
-from fastapi import APIRouter, UploadFile, File
+from typing import Optional
+
+from fastapi import APIRouter, UploadFile, File, Header
 from fastapi import BackgroundTasks
 from fastapi.params import Depends
 from sqlmodel.ext.asyncio.session import AsyncSession
@@ -22,11 +24,15 @@ router = APIRouter(tags=["images"])
 
 
 @router.get("/{student_id}/image")
-async def get(student_id: int, session: AsyncSession = Depends(get_session)):
+async def get(
+    student_id: int,
+    if_none_match: Optional[str] = Header(None),
+    session: AsyncSession = Depends(get_session),
+):
     """
     Fetches a student's image by his id
     """
-    return await get_image(student_id, session)
+    return await get_image(student_id, session, if_none_match)
 
 
 @router.post("/{student_id}/image/upload", status_code=status.HTTP_201_CREATED)
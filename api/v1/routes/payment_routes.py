@@ -4,9 +4,10 @@ Payment route definition module.
 All routes that are associated with student's payment records are here.
 """
 
-from typing import List
+from datetime import date
+from typing import List, Dict, Any, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, UploadFile, File, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
@@ -17,7 +18,11 @@ from api.v1.services.payment_service import (
     get_payment_status,
     edit_payment,
     delete_payment,
+    add_payments_bulk,
+    import_payments_csv,
+    get_payment_report,
 )
+from api.v1.utils import encode_cursor
 from db.session import get_session
 
 router = APIRouter(prefix="/payments", tags=["Payments"])
@@ -28,13 +33,83 @@ async def add(payment: PaymentModel, session: AsyncSession = Depends(get_session
     return await add_payment(payment, session)
 
 
+@router.post("/bulk", status_code=status.HTTP_200_OK)
+async def add_bulk(
+    payments: List[Dict[str, Any]], session: AsyncSession = Depends(get_session)
+):
+    return await add_payments_bulk(payments, session)
+
+
+@router.post("/import", status_code=status.HTTP_200_OK)
+async def import_csv(
+    file: UploadFile = File(...), session: AsyncSession = Depends(get_session)
+):
+    return await import_payments_csv(file, session)
+
+
+@router.get("/report", status_code=status.HTTP_200_OK)
+async def report(
+    from_month: Optional[int] = Query(None),
+    from_year: Optional[int] = Query(None),
+    to_month: Optional[int] = Query(None),
+    to_year: Optional[int] = Query(None),
+    formation_id: Optional[int] = Query(None),
+    payment_status: Optional[str] = Query(None, alias="status"),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Returns the payment status of all students over a month range, column by column.
+    Defaults to the current month.
+    """
+    # Explicit zeros are left to be rejected by the service
+    today = date.today()
+    if from_month is None:
+        from_month = today.month
+    if from_year is None:
+        from_year = today.year
+    if to_month is None:
+        to_month = from_month
+    if to_year is None:
+        to_year = from_year
+    return await get_payment_report(
+        session,
+        from_month,
+        from_year,
+        to_month,
+        to_year,
+        formation_id,
+        payment_status,
+    )
+
+
 @router.get(
     "/{student_id}",
     response_model=List[PaymentDates],
     status_code=status.HTTP_200_OK,
 )
-async def get(student_id: int, session: AsyncSession = Depends(get_session)):
-    return await get_payments(student_id, session)
+async def get(
+    student_id: int,
+    response: Response,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = Query(None),
+    since: Optional[str] = Query(None),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Returns a student's payments, most recent first. When a page is full, the
+    cursor of the next page is sent in the `X-Next-Cursor` header.
+    """
+    payments = await get_payments(
+        student_id, session, date_from, date_to, limit, cursor, since
+    )
+    if limit and len(payments) == limit:
+        last = payments[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            last["payment_date"], last["year"], last["month"]
+        )
+    return payments
 
 
 @router.get("/status/{student_id}", status_code=status.HTTP_200_OK)
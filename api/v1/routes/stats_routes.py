@@ -0,0 +1,40 @@
+"""
+Statistics route definition module.
+
+All routes that serve the admin dashboard figures are here.
+"""
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from api.v1.cache import cache_metrics
+from api.v1.services.stats_service import get_stats
+from api.v1.utils import require_admin
+from db.session import get_session
+
+router = APIRouter(prefix="/stats", tags=["Statistics"])
+
+
+@router.get("", status_code=status.HTTP_200_OK)
+async def get(
+    months: int = Query(12, ge=1, le=60),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Returns the dashboard figures and the revenue of the last `months` months.
+    """
+    return await get_stats(session, months)
+
+
+@router.get(
+    "/cache",
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(require_admin)],
+)
+async def cache():
+    """
+    Returns the size, hits, misses and evictions of each in-memory cache.
+    Requires the admin token.
+    """
+    return cache_metrics()
@@ -4,23 +4,31 @@ Module for defining the `/users/` endpoints: Creation, Fetching, Deletion and Mo
 
 from typing import List, Optional
 
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, UploadFile, File, Header, Request, Response
 from fastapi import BackgroundTasks
 from fastapi.params import Depends
 from sqlmodel.ext.asyncio.session import AsyncSession
 from starlette import status
 
+from api.v1.models.enrollment import BulkEnrollmentModel
 from api.v1.models.student import StudentCreate, StudentRead
 from api.v1.services.student_service import (
     add_student,
+    import_students,
     get_student_by_id,
     delete_student,
     update_student,
     get_all_students,
     get_qr_code,
     enroll,
+    enroll_bulk,
     remove_enrollment_from_student,
+    get_students_without_qrcode,
+    regenerate_missing_qrcodes,
 )
+from api.v1.responses import FastJSONResponse
+from api.v1.services.profile_service import get_student_profile
+from api.v1.utils import collection_not_modified
 from db.session import get_session
 from . import image_routes
 from ..services.formation_services import (
@@ -39,14 +47,23 @@ router.include_router(image_routes.router)
     tags=["Students"],
 )
 async def get_all(
+    request: Request,
+    response: Response,
     order_by: Optional[str] = Query(None),
     name_search: Optional[str] = Query(None),
+    since: Optional[str] = Query(None),
     session: AsyncSession = Depends(get_session),
 ):
     """
-    Returns all students in the database.
+    Returns all students in the database, or with `since` only the ones changed
+    after that change feed token.
     """
-    return await get_all_students(session, order_by, name_search)
+    not_modified = collection_not_modified("students", request, response)
+    if not_modified:
+        return not_modified
+    rows = await get_all_students(session, order_by, name_search, since, as_rows=True)
+    # Trusted rows of the `StudentRead` columns, encoded without re-validation
+    return FastJSONResponse(rows, headers={"ETag": response.headers["etag"]})
 
 
 @router.get("/{id}", response_model=StudentRead, tags=["Students"])
@@ -57,6 +74,14 @@ async def get(id: int, session: AsyncSession = Depends(get_session)):
     return await get_student_by_id(id, session)
 
 
+@router.get("/{id}/profile", status_code=status.HTTP_200_OK, tags=["Students"])
+async def get_profile(id: int):
+    """
+    Returns everything a student's profile page shows in a single document.
+    """
+    return await get_student_profile(id)
+
+
 @router.post("/add", status_code=status.HTTP_201_CREATED, tags=["Students"])
 async def add(
     student: StudentCreate,
@@ -69,6 +94,38 @@ async def add(
     return await add_student(student, session, bgtask)
 
 
+@router.post("/import", status_code=status.HTTP_200_OK, tags=["Students"])
+async def import_file(
+    bgtask: BackgroundTasks,
+    file: UploadFile = File(...),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Handles the import of students from a CSV or NDJSON file.
+    """
+    return await import_students(file, session, bgtask)
+
+
+@router.get("/qrcodes/missing", status_code=status.HTTP_200_OK, tags=["Students"])
+async def missing_qrcodes(session: AsyncSession = Depends(get_session)):
+    """
+    Returns the ids of the students without a QR Code.
+    """
+    return await get_students_without_qrcode(session)
+
+
+@router.post(
+    "/qrcodes/regenerate", status_code=status.HTTP_202_ACCEPTED, tags=["Students"]
+)
+async def regenerate_qrcodes(
+    bgtask: BackgroundTasks, session: AsyncSession = Depends(get_session)
+):
+    """
+    Generates the missing QR Codes in the background.
+    """
+    return await regenerate_missing_qrcodes(session, bgtask)
+
+
 @router.delete("/{id}/delete", status_code=status.HTTP_200_OK, tags=["Students"])
 async def delete(id: int, session: AsyncSession = Depends(get_session)):
     """
@@ -88,11 +145,15 @@ async def update(
 
 
 @router.get("/{id}/code", status_code=status.HTTP_200_OK, tags=["Students"])
-async def get_code(id: int, session: AsyncSession = Depends(get_session)):
+async def get_code(
+    id: int,
+    if_none_match: Optional[str] = Header(None),
+    session: AsyncSession = Depends(get_session),
+):
     """
     Handles the retrieval of a student's QR Code.
     """
-    return await get_qr_code(id, session)
+    return await get_qr_code(id, session, if_none_match)
 
 
 @router.post("/{student_id}/enroll/{formation_id}", status_code=status.HTTP_201_CREATED)
@@ -102,6 +163,16 @@ async def enroll_student(
     return await enroll(student_id, formation_id, session)
 
 
+@router.post("/enroll/bulk", status_code=status.HTTP_200_OK)
+async def enroll_students_bulk(
+    data: BulkEnrollmentModel, session: AsyncSession = Depends(get_session)
+):
+    """
+    Handles the enrollment of many students at once.
+    """
+    return await enroll_bulk(data, session)
+
+
 @router.delete(
     "/{student_id}/enrollments/{formation_id}/remove",
     status_code=status.HTTP_200_OK,
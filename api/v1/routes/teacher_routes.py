@@ -1,12 +1,14 @@
+from datetime import date
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, BackgroundTasks, UploadFile
+from fastapi import APIRouter, Depends, BackgroundTasks, UploadFile, Response, Request
 from fastapi.params import Query, File
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.status import HTTP_201_CREATED, HTTP_200_OK
 
 from api.v1.models.sessions import SessionModel
 from api.v1.models.teacher import TeacherModel, Teacher
+from api.v1.responses import FastJSONResponse
 from api.v1.services.cvfile_services import (
     upload_teacher_cv,
     retrieve_cv,
@@ -20,9 +22,12 @@ from api.v1.services.teacher_service import (
     update_teacher,
     get_teacher_by_id,
     get_sessions,
+    get_sessions_summary,
+    get_teacher_activity,
     add_session,
     remove_session,
 )
+from api.v1.utils import encode_cursor, collection_not_modified
 from db.session import get_session
 
 router = APIRouter(prefix="/teachers", tags=["Teacher"])
@@ -35,11 +40,27 @@ async def add(teacher: TeacherModel, session: AsyncSession = Depends(get_session
 
 @router.get("/", status_code=HTTP_200_OK, response_model=List[Teacher])
 async def get(
+    request: Request,
+    response: Response,
     search: Optional[str] = Query(None),
     order_by: Optional[str] = Query(None),
+    since: Optional[str] = Query(None),
     session: AsyncSession = Depends(get_session),
 ):
-    return await get_teachers(session, search, order_by)
+    not_modified = collection_not_modified("teachers", request, response)
+    if not_modified:
+        return not_modified
+    rows = await get_teachers(session, search, order_by, since, as_rows=True)
+    return FastJSONResponse(rows, headers={"ETag": response.headers["etag"]})
+
+
+@router.get("/activity", status_code=HTTP_200_OK)
+async def get_activity(
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    session: AsyncSession = Depends(get_session),
+):
+    return await get_teacher_activity(session, date_from, date_to)
 
 
 @router.delete("/delete/{teacher_id}", status_code=HTTP_200_OK)
@@ -80,13 +101,38 @@ async def delete_cv(id: int, session: AsyncSession = Depends(get_session)):
 
 
 @router.get("/{id}/formations", status_code=HTTP_200_OK)
-async def get_formations(id: int, session: AsyncSession = Depends(get_session)):
-    return await get_formations_by_teacher(id, session)
+async def get_formations(
+    id: int,
+    with_stats: bool = Query(False),
+    session: AsyncSession = Depends(get_session),
+):
+    return await get_formations_by_teacher(id, session, with_stats)
 
 
 @router.get("/{id}/sessions", status_code=HTTP_200_OK)
-async def get_teacher_sessions(id: int, session: AsyncSession = Depends(get_session)):
-    return await get_sessions(id, session)
+async def get_teacher_sessions(
+    id: int,
+    response: Response,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = Query(None),
+    session: AsyncSession = Depends(get_session),
+):
+    dates = await get_sessions(id, session, date_from, date_to, limit, cursor)
+    if limit and len(dates) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(dates[-1])
+    return dates
+
+
+@router.get("/{id}/sessions/summary", status_code=HTTP_200_OK)
+async def get_teacher_sessions_summary(
+    id: int,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    session: AsyncSession = Depends(get_session),
+):
+    return await get_sessions_summary(id, session, date_from, date_to)
 
 
 @router.post("/sessions/add", status_code=HTTP_201_CREATED)
@@ -1,9 +1,40 @@
+import asyncio
+import gzip
+import io
+import json
+import zlib
+from datetime import date
+from typing import Dict, List, Optional, Tuple, Any
+
+from fastapi import UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import func, tuple_
+from sqlalchemy.dialects.mysql import insert
 from sqlmodel import select, and_
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from api.v1.exceptions import AlreadyExists, NotFoundException
+from api.v1.events import checkins
+from api.v1.exceptions import (
+    AlreadyExists,
+    NotFoundException,
+    UnprocessableEntityException,
+)
 from api.v1.models.attendance import Attendance, AttendanceModel
+from api.v1.models.enrollment import Enrollment
+from api.v1.models.kiosk import KioskCursor, KioskLogEntry
 from api.v1.models.student import Student
+from api.v1.models.student_month_stats import StudentMonthStats
+from api.v1.services.qrcode_service import decrypt
+from api.v1.services.rollup_service import (
+    record_checkins,
+    refresh_attendance_rollups,
+)
+from api.v1.services.stats_service import invalidate_stats
+from api.v1.utils import decode_cursor
+from envconfig import EnvFile
+
+GZIP_MAGIC = b"\x1f\x8b"
 
 
 async def add_attendance(attendance_model: AttendanceModel, session: AsyncSession):
@@ -20,24 +51,152 @@ async def add_attendance(attendance_model: AttendanceModel, session: AsyncSessio
     att = Attendance.model_validate(attendance_model)
 
     session.add(att)
+    await session.flush()
+    await record_checkins(session, [(att.student_id, att.attend_date)])
     await session.commit()
+    invalidate_stats()
+    await publish_checkins([(att.student_id, att.attend_date)], "manual", session)
     return {"success": "Attendance added successfully."}
 
 
-async def get_attendances(student_id: int, session: AsyncSession):
-    stmt = (
-        select(Attendance)
-        .where(Attendance.student_id == student_id)
-        .order_by(Attendance.attend_date.desc())
+async def publish_checkins(
+    rows: List[Tuple[int, date]], source: str, session: AsyncSession
+):
+    """
+    Publishes a check-in event for each recorded (student_id, attend_date) row,
+    carrying the student's formations for subscribers to filter on.
+    """
+    if not rows or not checkins.active:
+        return
+
+    res = await session.execute(
+        select(Enrollment.student_id, Enrollment.formation_id).where(
+            Enrollment.student_id.in_({student_id for student_id, _ in rows})
+        )
+    )
+    formations: Dict[int, List[int]] = {}
+    for student_id, formation_id in res.all():
+        formations.setdefault(student_id, []).append(formation_id)
+
+    await checkins.publish(
+        [
+            {
+                "student_id": student_id,
+                "attend_date": attend_date,
+                "formation_ids": formations.get(student_id, []),
+                "source": source,
+            }
+            for student_id, attend_date in rows
+        ]
+    )
+
+
+async def stream_checkins(formation_id: Optional[int] = None) -> StreamingResponse:
+    """
+    Streams check-in events as Server-Sent Events, only the ones of students
+    enrolled in `formation_id` when given.
+
+    A comment is sent every `SSE_HEARTBEAT_INTERVAL` seconds of silence to keep
+    the connection open. A client too slow to drain its buffer is disconnected.
+    """
+    subscriber = checkins.subscribe(formation_id)
+
+    async def events():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        subscriber.queue.get(), EnvFile.SSE_HEARTBEAT_INTERVAL
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield f"event: checkin\ndata: {json.dumps(event)}\n\n"
+        finally:
+            checkins.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
+
+
+async def get_attendances(
+    student_id: int,
+    session: AsyncSession,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+):
+    """
+    Returns a student's attendance dates, newest first.
+
+    Only the date column is read, scanning the (student_id, attend_date) primary
+    key between `date_from` and `date_to`. With `limit`, pages are chained by
+    passing the cursor of the last returned date.
+    """
+    stmt = select(Attendance.attend_date).where(Attendance.student_id == student_id)
+    if date_from:
+        stmt = stmt.where(Attendance.attend_date >= date_from)
+    if date_to:
+        stmt = stmt.where(Attendance.attend_date <= date_to)
+    if cursor:
+        (last_date,) = decode_cursor(cursor, 1)
+        try:
+            last_date = date.fromisoformat(last_date)
+        except ValueError:
+            raise UnprocessableEntityException("Invalid cursor.")
+        stmt = stmt.where(Attendance.attend_date < last_date)
+    stmt = stmt.order_by(Attendance.attend_date.desc())
+    if limit:
+        stmt = stmt.limit(limit)
+
     res = await session.execute(stmt)
     attendances = res.scalars().all()
 
-    if not attendances:
+    if not attendances and not cursor:
         raise NotFoundException("No attendances found for this student.")
 
     # Convert dates to string
-    return [att.attend_date.isoformat() for att in attendances]
+    return [att.isoformat() for att in attendances]
+
+
+async def get_attendance_summary(
+    student_id: int,
+    session: AsyncSession,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+):
+    """
+    Returns a student's attended days per month, newest first, from the monthly
+    rollup.
+    """
+    stmt = select(
+        StudentMonthStats.year,
+        StudentMonthStats.month,
+        StudentMonthStats.attended_days,
+    ).where(
+        StudentMonthStats.student_id == student_id,
+        StudentMonthStats.attended_days > 0,
+    )
+    if date_from:
+        stmt = stmt.where(
+            tuple_(StudentMonthStats.year, StudentMonthStats.month)
+            >= (date_from.year, date_from.month)
+        )
+    if date_to:
+        stmt = stmt.where(
+            tuple_(StudentMonthStats.year, StudentMonthStats.month)
+            <= (date_to.year, date_to.month)
+        )
+    stmt = stmt.order_by(StudentMonthStats.year.desc(), StudentMonthStats.month.desc())
+
+    res = await session.execute(stmt)
+    return [dict(r) for r in res.mappings().all()]
 
 
 async def delete_attendance(attendance_model: AttendanceModel, session: AsyncSession):
@@ -52,5 +211,186 @@ async def delete_attendance(attendance_model: AttendanceModel, session: AsyncSes
     if not result:
         raise NotFoundException("No attendances found for this student on this date.")
     await session.delete(result)
+    await session.flush()
+    await record_checkins(session, [(result.student_id, result.attend_date)], -1)
     await session.commit()
+    invalidate_stats()
     return {"success": "Attendance deleted successfully."}
+
+
+def _open_kiosk_log(file: UploadFile):
+    """
+    Opens an uploaded kiosk log as a text stream, decompressing it on the fly
+    when it is gzip-compressed. Lines are read one at a time.
+    """
+    raw = file.file
+    raw.seek(0)
+    magic = raw.read(2)
+    raw.seek(0)
+    if magic == GZIP_MAGIC:
+        raw = gzip.GzipFile(fileobj=raw, mode="rb")
+    return io.TextIOWrapper(raw, encoding="utf-8", errors="replace")
+
+
+def _resolve_student_id(entry: KioskLogEntry) -> int:
+    if entry.student_id is not None:
+        return entry.student_id
+    try:
+        return int(decrypt(entry.qr))
+    except Exception:
+        raise ValueError("QR payload could not be decrypted.")
+
+
+async def _flush_kiosk_batch(
+    batch: List[Tuple[int, int, Any, str, int]],
+    blocked: Dict[str, int],
+    session: AsyncSession,
+) -> Tuple[int, int, List[int]]:
+    """
+    Inserts a batch of (line, student_id, attend_date, kiosk_id, seq) rows in
+    one statement and moves the kiosks' high-water marks forward in the same
+    transaction.
+
+    A line whose student does not exist may be replayed once the student is
+    created, so a kiosk's mark stops below its first such line, recorded in
+    `blocked` for the following batches.
+
+    Returns the number of inserted rows, the number of duplicates and the lines
+    whose student does not exist.
+    """
+    existing = set()
+    if batch:
+        student_ids = {student_id for _, student_id, _, _, _ in batch}
+        res = await session.execute(
+            select(Student.id).where(Student.id.in_(student_ids))
+        )
+        existing = set(res.scalars().all())
+
+    rows = []
+    unknown = []
+    for line_no, student_id, attend_date, kiosk_id, seq in batch:
+        if student_id in existing:
+            rows.append({"student_id": student_id, "attend_date": attend_date})
+        else:
+            unknown.append(line_no)
+            blocked[kiosk_id] = min(seq, blocked.get(kiosk_id, seq))
+
+    hwm_updates: Dict[str, int] = {}
+    for _, _, _, kiosk_id, seq in batch:
+        if kiosk_id in blocked and seq >= blocked[kiosk_id]:
+            continue
+        if seq > hwm_updates.get(kiosk_id, 0):
+            hwm_updates[kiosk_id] = seq
+
+    inserted = 0
+    new_rows = []
+    if rows:
+        # Only rows not already recorded count in the rollups and are
+        # announced as check-ins
+        keys = {(row["student_id"], row["attend_date"]) for row in rows}
+        res = await session.execute(
+            select(Attendance.student_id, Attendance.attend_date).where(
+                tuple_(Attendance.student_id, Attendance.attend_date).in_(keys)
+            )
+        )
+        new_rows = list(keys - {tuple(r) for r in res.all()})
+
+        stmt = insert(Attendance).prefix_with("IGNORE").values(rows)
+        result = await session.execute(stmt)
+        inserted = result.rowcount
+        if inserted == len(new_rows):
+            await record_checkins(session, new_rows)
+        else:
+            # Some rows were recorded concurrently since they were read
+            await refresh_attendance_rollups(
+                session,
+                {row["student_id"] for row in rows},
+                min(row["attend_date"] for row in rows),
+                max(row["attend_date"] for row in rows),
+            )
+
+    if hwm_updates:
+        cursor_stmt = insert(KioskCursor).values(
+            [{"kiosk_id": k, "last_seq": seq} for k, seq in hwm_updates.items()]
+        )
+        cursor_stmt = cursor_stmt.on_duplicate_key_update(
+            last_seq=func.greatest(KioskCursor.last_seq, cursor_stmt.inserted.last_seq)
+        )
+        await session.execute(cursor_stmt)
+
+    await session.commit()
+    invalidate_stats()
+    await publish_checkins(new_rows, "kiosk", session)
+    return inserted, len(rows) - inserted, unknown
+
+
+async def ingest_kiosk_log(
+    file: UploadFile, session: AsyncSession, batch_size: Optional[int] = None
+):
+    """
+    Replays an offline kiosk log (NDJSON, optionally gzip-compressed).
+
+    Each line holds `kiosk_id`, `seq`, `attend_date` and either `student_id` or
+    the scanned `qr` payload. Lines at or below the kiosk's stored high-water
+    mark were already replayed and are skipped without touching the database.
+    The remaining rows are inserted in batches of `batch_size`, each batch being
+    committed together with the new high-water marks so an interrupted upload
+    can simply be re-sent. Lines are expected in `seq` order for each kiosk.
+    """
+    batch_size = batch_size or EnvFile.KIOSK_INGEST_BATCH_SIZE
+
+    res = await session.execute(select(KioskCursor.kiosk_id, KioskCursor.last_seq))
+    high_water_marks: Dict[str, int] = {k: seq for k, seq in res.all()}
+
+    batch: List[Tuple[int, int, Any, str, int]] = []
+    # Lowest seq of each kiosk whose student does not exist
+    blocked: Dict[str, int] = {}
+    errors: List[Dict[str, Any]] = []
+    inserted = duplicates = skipped = 0
+
+    try:
+        stream = _open_kiosk_log(file)
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = KioskLogEntry.model_validate(json.loads(line))
+                if entry.seq <= high_water_marks.get(entry.kiosk_id, 0):
+                    skipped += 1
+                    continue
+                student_id = _resolve_student_id(entry)
+            except (ValueError, ValidationError) as exc:
+                errors.append({"line": line_no, "error": str(exc)})
+                continue
+
+            batch.append(
+                (line_no, student_id, entry.attend_date, entry.kiosk_id, entry.seq)
+            )
+
+            if len(batch) >= batch_size:
+                ins, dup, unknown = await _flush_kiosk_batch(batch, blocked, session)
+                inserted += ins
+                duplicates += dup
+                errors.extend(
+                    {"line": n, "error": "This student was not found."} for n in unknown
+                )
+                batch = []
+    except (OSError, EOFError, zlib.error):
+        raise UnprocessableEntityException("The kiosk log could not be read.")
+
+    if batch:
+        ins, dup, unknown = await _flush_kiosk_batch(batch, blocked, session)
+        inserted += ins
+        duplicates += dup
+        errors.extend(
+            {"line": n, "error": "This student was not found."} for n in unknown
+        )
+
+    return {
+        "success": "Kiosk log ingested.",
+        "inserted": inserted,
+        "duplicates": duplicates,
+        "skipped": skipped,
+        "errors": errors,
+    }
@@ -0,0 +1,262 @@
+import asyncio
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Type
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from api.v1.exceptions import (
+    AppException,
+    NotFoundException,
+    UnprocessableEntityException,
+)
+from api.v1.models.batch import BatchOperation, MAX_BATCH_OPERATIONS
+from api.v1.models.formation import Formation
+from api.v1.models.formation_type import FormationType
+from api.v1.models.student import Student
+from api.v1.models.teacher import Teacher
+from api.v1.services.attendance_service import get_attendances, get_attendance_summary
+from api.v1.services.formation_services import (
+    get_formations,
+    get_formation_types,
+    get_formations_by_teacher,
+    get_student_enrolled_formations,
+    get_available_formations_for_student,
+    get_formation_students,
+)
+from api.v1.services.payment_service import get_payment_status, get_payments
+from api.v1.services.stats_service import get_stats
+from api.v1.services.teacher_service import get_sessions, get_sessions_summary
+from db.session import async_session
+from envconfig import EnvFile
+
+
+async def _load_students(session: AsyncSession, ids: List[int]) -> Dict[int, Any]:
+    stmt = select(
+        Student.id,
+        Student.name,
+        Student.birth_date,
+        Student.tel1,
+        Student.tel2,
+        Student.email,
+    ).where(Student.id.in_(ids))
+    res = await session.execute(stmt)
+    return {row["id"]: dict(row) for row in res.mappings()}
+
+
+async def _load_teachers(session: AsyncSession, ids: List[int]) -> Dict[int, Any]:
+    res = await session.execute(select(Teacher).where(Teacher.id.in_(ids)))
+    return {teacher.id: teacher for teacher in res.scalars()}
+
+
+async def _load_formations(session: AsyncSession, ids: List[int]) -> Dict[int, Any]:
+    stmt = (
+        select(
+            Formation.id,
+            Formation.formation_type.label("formation_type_id"),
+            Formation.start_date,
+            Teacher.name.label("teacher_name"),
+            FormationType.label.label("type_label"),
+        )
+        .join(FormationType, Formation.formation_type == FormationType.id)
+        .outerjoin(Teacher, Formation.teacher_id == Teacher.id)
+        .where(Formation.id.in_(ids))
+    )
+    res = await session.execute(stmt)
+    return {row["id"]: dict(row) for row in res.mappings()}
+
+
+# Entities read by id: every id requested in a batch is loaded with one `IN`
+# query per entity, then each operation picks its row.
+LOADERS: Dict[str, Callable[[AsyncSession, List[int]], Awaitable[Dict[int, Any]]]] = {
+    "student": _load_students,
+    "teacher": _load_teachers,
+    "formation": _load_formations,
+}
+
+LOADER_NOT_FOUND = {
+    "student": "This student was not found.",
+    "teacher": "Teacher not found.",
+    "formation": "Formation not found.",
+}
+
+
+class _NoParams(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+
+class _RangeParams(_NoParams):
+    date_from: Optional[date] = Field(None, alias="from")
+    date_to: Optional[date] = Field(None, alias="to")
+
+
+class _HistoryParams(_RangeParams):
+    limit: Optional[int] = Field(None, ge=1, le=1000)
+    cursor: Optional[str] = None
+
+
+class _ListingParams(_NoParams):
+    with_stats: bool = False
+
+
+class _StatsParams(_NoParams):
+    months: int = Field(12, ge=1, le=60)
+
+
+class Resource:
+    """
+    A read operation callable from the batch endpoint.
+
+    `call` receives the session, the operation's id and its validated params.
+    """
+
+    def __init__(
+        self,
+        call: Callable[..., Awaitable[Any]],
+        params: Type[BaseModel] = _NoParams,
+        needs_id: bool = True,
+    ):
+        self.call = call
+        self.params = params
+        self.needs_id = needs_id
+
+
+RESOURCES: Dict[str, Resource] = {
+    "student_enrollments": Resource(
+        lambda s, id, p: get_student_enrolled_formations(s, id)
+    ),
+    "student_available_formations": Resource(
+        lambda s, id, p: get_available_formations_for_student(s, id)
+    ),
+    "payment_status": Resource(lambda s, id, p: get_payment_status(id, s)),
+    "payments": Resource(lambda s, id, p: get_payments(id, s, **p), _HistoryParams),
+    "attendances": Resource(
+        lambda s, id, p: get_attendances(id, s, **p), _HistoryParams
+    ),
+    "attendance_summary": Resource(
+        lambda s, id, p: get_attendance_summary(id, s, **p), _RangeParams
+    ),
+    "formations": Resource(
+        lambda s, id, p: get_formations(s, **p), _ListingParams, needs_id=False
+    ),
+    "formation_types": Resource(
+        lambda s, id, p: get_formation_types(s), needs_id=False
+    ),
+    "formation_students": Resource(lambda s, id, p: get_formation_students(s, id)),
+    "teacher_formations": Resource(
+        lambda s, id, p: get_formations_by_teacher(id, s, **p), _ListingParams
+    ),
+    "teacher_sessions": Resource(
+        lambda s, id, p: get_sessions(id, s, **p), _HistoryParams
+    ),
+    "teacher_sessions_summary": Resource(
+        lambda s, id, p: get_sessions_summary(id, s, **p), _RangeParams
+    ),
+    "stats": Resource(lambda s, id, p: get_stats(s, **p), _StatsParams, needs_id=False),
+}
+
+
+async def _limited(semaphore: asyncio.Semaphore, fn, *args):
+    """
+    Runs `fn(session, *args)` on its own session once a connection slot is free.
+    """
+    async with semaphore:
+        async with async_session() as session:
+            return await fn(session, *args)
+
+
+def _prepare(op: BatchOperation):
+    """
+    Checks an operation, returning the resource to call and its parameters.
+    """
+    if op.resource in LOADERS:
+        if op.params:
+            raise UnprocessableEntityException(f"{op.resource} takes no params.")
+        if op.id is None:
+            raise UnprocessableEntityException(f"{op.resource} requires an id.")
+        return None, None
+
+    resource = RESOURCES.get(op.resource)
+    if not resource:
+        raise NotFoundException(f"Unknown resource: {op.resource}")
+    if resource.needs_id and op.id is None:
+        raise UnprocessableEntityException(f"{op.resource} requires an id.")
+    try:
+        params = resource.params.model_validate(op.params).model_dump()
+    except ValidationError as e:
+        raise UnprocessableEntityException(
+            f"Invalid params for {op.resource}: {e.errors()[0]['msg']}"
+        )
+    return resource, params
+
+
+def _error(exc: AppException) -> Dict[str, Any]:
+    return {"status": exc.status_code, "error": exc.message}
+
+
+async def run_batch(operations: List[BatchOperation]) -> List[Dict[str, Any]]:
+    """
+    Executes a list of read operations and returns their results in order.
+
+    Identical operations are executed once. Operations on the same entity are
+    answered by a single `IN` query, and the remaining ones run concurrently,
+    never holding more than `BATCH_MAX_CONNECTIONS` connections at once.
+    Each result is `{"status", "data"}`, or `{"status", "error"}` when the
+    operation failed.
+    """
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise UnprocessableEntityException(
+            f"A batch holds at most {MAX_BATCH_OPERATIONS} operations."
+        )
+
+    semaphore = asyncio.Semaphore(max(1, EnvFile.BATCH_MAX_CONNECTIONS))
+    outcomes: Dict[tuple, Dict[str, Any]] = {}
+    pending: Dict[tuple, Awaitable] = {}
+    entity_ids: Dict[str, Dict[int, None]] = {}
+
+    for op in operations:
+        key = op.key()
+        if key in outcomes or key in pending:
+            continue
+        try:
+            resource, params = _prepare(op)
+        except AppException as e:
+            outcomes[key] = _error(e)
+            continue
+
+        if resource is None:
+            entity_ids.setdefault(op.resource, {})[op.id] = None
+            outcomes[key] = None  # filled once the entity is loaded
+        else:
+            pending[key] = _limited(semaphore, resource.call, op.id, params)
+
+    for name, ids in entity_ids.items():
+        pending[("load", name)] = _limited(semaphore, LOADERS[name], list(ids))
+
+    results = await asyncio.gather(*pending.values(), return_exceptions=True)
+
+    loaded: Dict[str, Any] = {}
+    for key, result in zip(pending.keys(), results):
+        if isinstance(result, BaseException) and not isinstance(result, AppException):
+            raise result
+        if key[0] == "load":
+            loaded[key[1]] = result
+        elif isinstance(result, AppException):
+            outcomes[key] = _error(result)
+        else:
+            outcomes[key] = {"status": 200, "data": result}
+
+    response = []
+    for op in operations:
+        outcome = outcomes[op.key()]
+        if outcome is None:
+            rows = loaded[op.resource]
+            if isinstance(rows, AppException):
+                outcome = _error(rows)
+            elif op.id in rows:
+                outcome = {"status": 200, "data": rows[op.id]}
+            else:
+                outcome = _error(NotFoundException(LOADER_NOT_FOUND[op.resource]))
+        response.append(outcome)
+    return response
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, func, literal
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from api.v1.exceptions import GoneException, UnprocessableEntityException
+from api.v1.models.change_log import ChangeLog
+from api.v1.utils import encode_cursor, decode_cursor
+from db.session import async_session
+from envconfig import EnvFile
+
+logger = logging.getLogger(__name__)
+
+PRUNE_CHUNK_SIZE = 10000
+
+
+def record_change(session: AsyncSession, entity: str, entity_id: int, op: str):
+    """
+    Adds a change of one row to the session, to be committed with the write
+    it describes.
+    """
+    session.add(ChangeLog(entity=entity, entity_id=entity_id, op=op))
+
+
+async def record_changes(
+    session: AsyncSession, entity: str, entity_ids: Iterable[int], op: str
+):
+    """
+    Records the same change for many rows with one `executemany`.
+    """
+    rows = [{"entity": entity, "entity_id": i, "op": op} for i in entity_ids]
+    if rows:
+        await session.execute(insert(ChangeLog), rows)
+
+
+async def record_changes_from(session: AsyncSession, entity: str, ids_stmt, op: str):
+    """
+    Records the same change for every id selected by `ids_stmt`, with a single
+    `INSERT ... SELECT`.
+    """
+    await session.execute(
+        insert(ChangeLog).from_select(
+            ["entity", "entity_id", "op"],
+            select(literal(entity), ids_stmt.subquery().c[0], literal(op)),
+        )
+    )
+
+
+def since_version(since: Optional[str]) -> int:
+    """
+    Decodes a sync token into the change log version it stands for.
+    """
+    if not since:
+        return 0
+    (version,) = decode_cursor(since, 1)
+    if not version.isdigit():
+        raise UnprocessableEntityException("Invalid cursor.")
+    return int(version)
+
+
+async def check_since(session: AsyncSession, since: Optional[str]) -> int:
+    """
+    Decodes a sync token, raising `GoneException` when changes after it were
+    pruned, see `prune_change_log`: the client has to sync again from scratch.
+    """
+    version = since_version(since)
+    if since:
+        res = await session.execute(select(func.min(ChangeLog.version)))
+        oldest = res.scalar()
+        if oldest is not None and version < oldest - 1:
+            raise GoneException("This sync token has expired, sync from scratch.")
+    return version
+
+
+def changed_since(entity: str, since: Optional[str]):
+    """
+    Returns a subquery of the ids of `entity` changed after the `since` token,
+    for list queries to filter on.
+    """
+    return select(ChangeLog.entity_id).where(
+        ChangeLog.entity == entity, ChangeLog.version > since_version(since)
+    )
+
+
+def _age():
+    """Seconds since a change was inserted, by the database's clock."""
+    return func.unix_timestamp() - func.unix_timestamp(ChangeLog.created_at)
+
+
+async def _visible_head(session: AsyncSession) -> int:
+    """
+    Returns a version every lower change of which is committed or abandoned:
+    the latest one older than `CHANGE_GAP_TIMEOUT`.
+    """
+    res = await session.execute(
+        select(func.max(ChangeLog.version)).where(_age() >= EnvFile.CHANGE_GAP_TIMEOUT)
+    )
+    return res.scalar() or 0
+
+
+async def _safe_upper_bound(session: AsyncSession, version: int, limit: int):
+    """
+    Returns the version up to which changes after `version` can be handed out,
+    and whether more changes follow it.
+
+    A missing version followed by a recent one may belong to a transaction
+    that has not committed yet, so the bound stops before it. Once the version
+    after a gap is older than `CHANGE_GAP_TIMEOUT`, the transaction holding the
+    missing one is assumed to have rolled back.
+    """
+    res = await session.execute(
+        select(ChangeLog.version, _age().label("age"))
+        .where(ChangeLog.version > version)
+        .order_by(ChangeLog.version)
+        .limit(limit + 1)
+    )
+    rows = res.all()
+
+    upper = version
+    for row in rows[:limit]:
+        if row.version != upper + 1 and row.age < EnvFile.CHANGE_GAP_TIMEOUT:
+            return upper, False
+        upper = row.version
+    return upper, len(rows) > limit
+
+
+async def get_changes(session: AsyncSession, since: Optional[str], limit: int):
+    """
+    Returns the rows changed after the `since` token, as columns of entity, id,
+    op and version, oldest first.
+
+    Only the latest change of each row is returned, so a row updated many times
+    is listed once. `next` is the token to pass on the following call, and
+    `more` tells whether the limit cut the list short. Without `since`, only the
+    token of the current head is returned, to start syncing from.
+
+    Tokens never move past a change that may still be committed, so changes
+    are delivered once visible even when transactions commit out of order.
+    Tokens older than the retention raise `GoneException`, see `check_since`.
+    """
+    if not since:
+        return {"next": encode_cursor(await _visible_head(session)), "more": False}
+
+    version = await check_since(session, since)
+    upper, more = await _safe_upper_bound(session, version, limit)
+    if upper == version:
+        return {
+            "entity": [],
+            "id": [],
+            "op": [],
+            "version": [],
+            "next": encode_cursor(version),
+            "more": False,
+        }
+
+    latest = (
+        select(func.max(ChangeLog.version).label("version"))
+        .where(ChangeLog.version > version, ChangeLog.version <= upper)
+        .group_by(ChangeLog.entity, ChangeLog.entity_id)
+        .subquery("latest")
+    )
+    stmt = (
+        select(ChangeLog.entity, ChangeLog.entity_id, ChangeLog.op, ChangeLog.version)
+        .join(latest, latest.c.version == ChangeLog.version)
+        .order_by(ChangeLog.version)
+    )
+    res = await session.execute(stmt)
+    rows = res.all()
+
+    return {
+        "entity": [r.entity for r in rows],
+        "id": [r.entity_id for r in rows],
+        "op": [r.op for r in rows],
+        "version": [r.version for r in rows],
+        "next": encode_cursor(upper),
+        "more": more,
+    }
+
+
+async def prune_change_log(session: AsyncSession) -> int:
+    """
+    Deletes the changes older than `CHANGE_RETENTION_DAYS`, by chunks of
+    `PRUNE_CHUNK_SIZE`, and returns their count. The latest change is kept, so
+    tokens older than the retention can still be told apart, see `check_since`.
+    """
+    res = await session.execute(select(func.max(ChangeLog.version)))
+    head = res.scalar()
+    if head is None:
+        return 0
+
+    pruned = 0
+    while True:
+        res = await session.execute(
+            delete(ChangeLog)
+            .where(
+                ChangeLog.version < head,
+                _age() >= EnvFile.CHANGE_RETENTION_DAYS * 86400,
+            )
+            .with_dialect_options(mysql_limit=PRUNE_CHUNK_SIZE)
+        )
+        await session.commit()
+        pruned += res.rowcount
+        if res.rowcount < PRUNE_CHUNK_SIZE:
+            return pruned
+
+
+async def run_change_log_pruner(interval: float):
+    """Runs `prune_change_log` every `interval` seconds until cancelled."""
+    while True:
+        try:
+            async with async_session() as session:
+                await prune_change_log(session)
+        except Exception:
+            logger.exception("Change log pruning failed.")
+        await asyncio.sleep(interval)
@@ -10,9 +10,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select
 from starlette.responses import FileResponse
 
+from api.v1.cache import invalidate
 from api.v1.exceptions import NotFoundException, UnprocessableEntityException
 from api.v1.models.cvfile import CVFile
 from api.v1.models.teacher import Teacher  # adjust path if needed
+from api.v1.services.change_service import record_change
+from api.v1.services.teacher_service import invalidate_teacher_activity
 from envconfig import EnvFile
 
 
@@ -91,7 +94,10 @@ async def upload_teacher_cv(
         teacher.cv = new_cv.id
         session.add(teacher)
 
+    record_change(session, "teacher", teacher_id, "update")
     await session.commit()
+    invalidate("teachers")
+    invalidate_teacher_activity()
 
     return {"Successfully uploaded CV."}
 
@@ -125,7 +131,10 @@ async def delete_teacher_cv(teacher_id: int, session: AsyncSession):
 
     teacher.cv = None
     session.add(teacher)
+    record_change(session, "teacher", teacher_id, "update")
     await session.commit()
+    invalidate("teachers")
+    invalidate_teacher_activity()
 
     await session.delete(cv)
     await session.commit()
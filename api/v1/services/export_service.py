@@ -0,0 +1,212 @@
+"""
+Module for streaming full-history exports of students, payments and attendance.
+
+Rows are read through a server-side cursor one partition at a time and encoded
+as they arrive, so memory use does not depend on the size of the table.
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import date
+from typing import AsyncIterator, Optional, List, Tuple
+
+from sqlmodel import select
+from starlette.responses import StreamingResponse
+
+from api.v1.exceptions import FeatureNotAvailable, UnprocessableEntityException
+from api.v1.models.attendance import Attendance
+from api.v1.models.payment import Payment
+from api.v1.models.student import Student
+from db.session import async_session
+from envconfig import EnvFile
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pq = None
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# Column name and Arrow type of each export
+STUDENT_COLUMNS = [
+    ("id", "int64"),
+    ("name", "string"),
+    ("birth_date", "date32"),
+    ("tel1", "string"),
+    ("tel2", "string"),
+    ("email", "string"),
+]
+PAYMENT_COLUMNS = [
+    ("student_id", "int64"),
+    ("month", "int64"),
+    ("year", "int64"),
+    ("payment_date", "date32"),
+    ("amount", "float64"),
+]
+ATTENDANCE_COLUMNS = [
+    ("student_id", "int64"),
+    ("attend_date", "date32"),
+]
+
+
+def _encode_csv(columns: List[Tuple[str, str]]):
+    header_sent = False
+
+    def encode(rows) -> bytes:
+        nonlocal header_sent
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        if not header_sent:
+            writer.writerow([name for name, _ in columns])
+            header_sent = True
+        writer.writerows(
+            [v.isoformat() if isinstance(v, date) else v for v in row] for row in rows
+        )
+        return buf.getvalue().encode("utf-8")
+
+    return encode, lambda: b""
+
+
+def _encode_ndjson(columns: List[Tuple[str, str]]):
+    names = [name for name, _ in columns]
+
+    def encode(rows) -> bytes:
+        return "".join(
+            json.dumps(dict(zip(names, row)), default=str) + "\n" for row in rows
+        ).encode("utf-8")
+
+    return encode, lambda: b""
+
+
+class _DrainableSink(io.RawIOBase):
+    """A write-only file whose content is handed over and cleared on drain()."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _encode_parquet(columns: List[Tuple[str, str]]):
+    schema = pa.schema([(name, getattr(pa, type_)()) for name, type_ in columns])
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema)
+
+    def encode(rows) -> bytes:
+        # Each partition becomes one row group
+        data = list(zip(*rows)) if rows else [[] for _ in columns]
+        writer.write_table(pa.table(data, schema=schema))
+        return sink.drain()
+
+    def close() -> bytes:
+        writer.close()
+        return sink.drain()
+
+    return encode, close
+
+
+ENCODERS = {
+    "csv": _encode_csv,
+    "ndjson": _encode_ndjson,
+    "parquet": _encode_parquet,
+}
+
+
+async def _stream_rows(stmt, columns, fmt: str, compress: bool) -> AsyncIterator[bytes]:
+    encode, close = ENCODERS[fmt](columns)
+    gz = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+
+    async with async_session() as session:
+        result = await session.stream(
+            stmt.execution_options(yield_per=EnvFile.EXPORT_PARTITION_SIZE)
+        )
+        async for partition in result.partitions():
+            data = encode(partition)
+            if gz:
+                data = gz.compress(data)
+            if data:
+                yield data
+
+    data = close()
+    if gz:
+        data = gz.compress(data) + gz.flush()
+    if data:
+        yield data
+
+
+def _export_response(
+    name: str, stmt, columns, fmt: str, compress: bool
+) -> StreamingResponse:
+    if fmt not in EXPORT_FORMATS:
+        raise UnprocessableEntityException(
+            f"Export format must be one of: {', '.join(EXPORT_FORMATS)}"
+        )
+    if fmt == "parquet" and pa is None:
+        raise FeatureNotAvailable("Parquet exports require pyarrow to be installed.")
+
+    media_type, extension = EXPORT_FORMATS[fmt]
+    filename = f"{name}.{extension}"
+    if compress:
+        media_type = "application/gzip"
+        filename += ".gz"
+
+    return StreamingResponse(
+        _stream_rows(stmt, columns, fmt, compress),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def export_students(fmt: str, compress: bool = False) -> StreamingResponse:
+    stmt = select(*(getattr(Student, name) for name, _ in STUDENT_COLUMNS)).order_by(
+        Student.id
+    )
+    return _export_response("students", stmt, STUDENT_COLUMNS, fmt, compress)
+
+
+def export_payments(
+    fmt: str,
+    compress: bool = False,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> StreamingResponse:
+    stmt = select(*(getattr(Payment, name) for name, _ in PAYMENT_COLUMNS))
+    if date_from:
+        stmt = stmt.where(Payment.payment_date >= date_from)
+    if date_to:
+        stmt = stmt.where(Payment.payment_date <= date_to)
+    stmt = stmt.order_by(Payment.payment_date)
+    return _export_response("payments", stmt, PAYMENT_COLUMNS, fmt, compress)
+
+
+def export_attendance(
+    fmt: str,
+    compress: bool = False,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> StreamingResponse:
+    stmt = select(*(getattr(Attendance, name) for name, _ in ATTENDANCE_COLUMNS))
+    if date_from:
+        stmt = stmt.where(Attendance.attend_date >= date_from)
+    if date_to:
+        stmt = stmt.where(Attendance.attend_date <= date_to)
+    stmt = stmt.order_by(Attendance.attend_date)
+    return _export_response("attendance", stmt, ATTENDANCE_COLUMNS, fmt, compress)
@@ -1,15 +1,86 @@
+import calendar
+from datetime import date
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import exists, literal, func, update
+from sqlalchemy.dialects.mysql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select, and_
 
-from api.v1.exceptions import AlreadyExists, NotFoundException
+from api.v1.cache import AsyncCache, cached, invalidate
+from api.v1.exceptions import (
+    AlreadyExists,
+    NotFoundException,
+    UnprocessableEntityException,
+)
+from api.v1.models.attendance import Attendance
 from api.v1.models.enrollment import Enrollment
 from api.v1.models.formation import FormationModel, Formation
 from api.v1.models.formation_type import FormationType, FormationTypeModel
+from api.v1.models.sessions import Session
 from api.v1.models.student import Student
 from api.v1.models.teacher import Teacher
+from api.v1.services.change_service import (
+    record_change,
+    record_changes_from,
+    changed_since,
+    check_since,
+)
+from api.v1.services.rollup_service import refresh_stats_counters
+from api.v1.services.stats_service import invalidate_stats
+from api.v1.services.teacher_service import invalidate_teacher_activity
+from envconfig import EnvFile
+
+formations_cache = AsyncCache("formations", EnvFile.FORMATIONS_CACHE_TTL)
 
 
-async def get_formations(session: AsyncSession):
+def _with_listing_stats(stmt):
+    """
+    Adds the enrolled headcount and the teacher's next session date to a
+    formation listing, each computed by a grouped subquery.
+    """
+    enrolled = (
+        select(Enrollment.formation_id, func.count().label("enrolled"))
+        .group_by(Enrollment.formation_id)
+        .subquery("enrolled")
+    )
+    next_sessions = (
+        select(Session.teacher_id, func.min(Session.session_date).label("next_session"))
+        .where(Session.session_date >= date.today())
+        .group_by(Session.teacher_id)
+        .subquery("next_sessions")
+    )
+    return (
+        stmt.add_columns(
+            func.coalesce(enrolled.c.enrolled, 0).label("enrolled"),
+            next_sessions.c.next_session,
+        )
+        .outerjoin(enrolled, enrolled.c.formation_id == Formation.id)
+        .outerjoin(next_sessions, next_sessions.c.teacher_id == Formation.teacher_id)
+    )
+
+
+async def get_formations(
+    session: AsyncSession, with_stats: bool = False, since: Optional[str] = None
+):
+    """
+    Lists formations, or with `since` only the ones changed after that change
+    feed token.
+    """
+    if since:
+        return await _list_formations(session, with_stats, since)
+    # The next session dates change with the date
+    return await formations_cache.get_or_load(
+        ("all", with_stats, date.today() if with_stats else None),
+        lambda: _list_formations(session, with_stats),
+        tags=("formations",),
+    )
+
+
+async def _list_formations(
+    session: AsyncSession, with_stats: bool, since: Optional[str] = None
+):
     stmt = (
         select(
             Formation.id,
@@ -21,20 +92,27 @@ async def get_formations(session: AsyncSession):
         .join(FormationType, Formation.formation_type == FormationType.id)
         .outerjoin(Teacher, Formation.teacher_id == Teacher.id)
     )
+    if with_stats:
+        stmt = _with_listing_stats(stmt)
+    if since:
+        await check_since(session, since)
+        stmt = stmt.where(Formation.id.in_(changed_since("formation", since)))
 
     result = await session.execute(stmt)
     rows = []
     # result returns rows that can be unpacked in the same order as the select()
-    for id_, start_date, formation_type, label, teacher_name in result:
-        rows.append(
-            {
-                "id": id_,
-                "formation_type": formation_type,
-                "label": label,
-                "start_date": start_date,
-                "teacher_name": teacher_name,  # will be None when no teacher is assigned
-            }
-        )
+    for id_, start_date, formation_type, label, teacher_name, *stats in result:
+        row = {
+            "id": id_,
+            "formation_type": formation_type,
+            "label": label,
+            "start_date": start_date,
+            "teacher_name": teacher_name,  # will be None when no teacher is assigned
+        }
+        if with_stats:
+            row["enrolled"], row["next_session"] = stats
+        rows.append(row)
+
     return rows
 
 
@@ -63,7 +141,13 @@ async def add_formation(formation: FormationModel, session: AsyncSession):
 
     f: Formation = Formation.model_validate(formation)
     session.add(f)
+    await session.flush()
+    record_change(session, "formation", f.id, "insert")
+    await refresh_stats_counters(session)
     await session.commit()
+    invalidate("formations")
+    invalidate_teacher_activity()
+    invalidate_stats()
     return {"id": f.id}
 
 
@@ -73,7 +157,12 @@ async def delete_formation(id: int, session: AsyncSession):
         raise NotFoundException("No formation with this id found.")
 
     await session.delete(formation)
+    record_change(session, "formation", id, "delete")
+    await refresh_stats_counters(session)
     await session.commit()
+    invalidate("formations")
+    invalidate_teacher_activity()
+    invalidate_stats()
     return "Formation deleted."
 
 
@@ -96,10 +185,16 @@ async def update_formation(id: int, data: FormationModel, session: AsyncSession)
     else:
         formation.teacher_id = None
 
+    record_change(session, "formation", id, "update")
+    await refresh_stats_counters(session)
     await session.commit()
+    invalidate("formations")
+    invalidate_teacher_activity()
+    invalidate_stats()
     return "Formation updated."
 
 
+@cached(formations_cache, tags=("formation_types",))
 async def get_formation_types(session: AsyncSession):
     stmt = select(FormationType)
     result = await session.execute(stmt)
@@ -115,6 +210,7 @@ async def add_formation_type(data: FormationTypeModel, session: AsyncSession):
     ftype = FormationType.model_validate(data)
     session.add(ftype)
     await session.commit()
+    invalidate("formation_types")
     return {"id": ftype.id}
 
 
@@ -123,8 +219,16 @@ async def delete_formation_type(id: int, session: AsyncSession):
     if not ft:
         raise NotFoundException("No formation type with this id found.")
 
+    # Formations of this type are deleted along with it
+    await record_changes_from(
+        session,
+        "formation",
+        select(Formation.id).where(Formation.formation_type == id),
+        "delete",
+    )
     await session.delete(ft)
     await session.commit()
+    invalidate("formations", "formation_types")
     return "Formation type deleted."
 
 
@@ -141,48 +245,87 @@ async def rename_formation_type(
         if res.scalars().first():
             raise AlreadyExists("A formation type with this label already exists.")
         ft.label = data.label.title()
+        await record_changes_from(
+            session,
+            "formation",
+            select(Formation.id).where(Formation.formation_type == id),
+            "update",
+        )
         await session.commit()
+        invalidate("formations", "formation_types")
 
     return "Formation type renamed."
 
 
-async def get_formations_by_teacher(id: int, session: AsyncSession):
+@cached(formations_cache, tags=("formations",))
+async def get_formations_by_teacher(
+    id: int, session: AsyncSession, with_stats: bool = False
+):
     teacher = await session.get(Teacher, id)
     if not teacher:
         raise NotFoundException("Teacher not found.")
 
-    stmt = select(Formation).where(Formation.teacher_id == id)
+    stmt = select(
+        Formation.id,
+        Formation.formation_type,
+        Formation.start_date,
+        Formation.teacher_id,
+    ).where(Formation.teacher_id == id)
+    if with_stats:
+        stmt = _with_listing_stats(stmt).add_columns(
+            literal(teacher.name).label("teacher_name")
+        )
+
     query = await session.execute(stmt)
-    return query.scalars().all()
+    rows = [dict(r) for r in query.mappings().all()]
+    return rows
 
 
-async def unassign_formation(teacher_id: int, formation_id: int, session: AsyncSession):
-    t = await session.get(Teacher, teacher_id)
-    if not t:
-        raise NotFoundException("Teacher not found.")
+async def _set_formation_teacher(
+    teacher_id: int, formation_id: int, value: Optional[int], session: AsyncSession
+):
+    """
+    Sets the teacher of a formation to `value` with one `UPDATE`, guarded by the
+    existence of teacher `teacher_id`. Only when no row matched is the cause
+    looked up.
+    """
+    res = await session.execute(
+        update(Formation)
+        .where(Formation.id == formation_id, exists().where(Teacher.id == teacher_id))
+        .values(teacher_id=value)
+        .execution_options(synchronize_session=False)
+    )
+    if res.rowcount:
+        return
 
-    f = await session.get(Formation, formation_id)
-    if not f:
+    res = await session.execute(
+        select(
+            exists().where(Teacher.id == teacher_id),
+            exists().where(Formation.id == formation_id),
+        )
+    )
+    teacher_exists, formation_exists = res.one()
+    if not teacher_exists:
+        raise NotFoundException("Teacher not found.")
+    if not formation_exists:
         raise NotFoundException("Formation not found.")
 
-    f.teacher_id = None
-    session.add(f)
+
+async def unassign_formation(teacher_id: int, formation_id: int, session: AsyncSession):
+    await _set_formation_teacher(teacher_id, formation_id, None, session)
+    record_change(session, "formation", formation_id, "update")
     await session.commit()
+    invalidate("formations")
+    invalidate_teacher_activity()
     return "Formation unassigned."
 
 
 async def assign_formation(teacher_id: int, formation_id: int, session: AsyncSession):
-    t = await session.get(Teacher, teacher_id)
-    if not t:
-        raise NotFoundException("Teacher not found.")
-
-    f = await session.get(Formation, formation_id)
-    if not f:
-        raise NotFoundException("Formation not found.")
-
-    f.teacher_id = teacher_id
-    session.add(f)
+    await _set_formation_teacher(teacher_id, formation_id, teacher_id, session)
+    record_change(session, "formation", formation_id, "update")
     await session.commit()
+    invalidate("formations")
+    invalidate_teacher_activity()
     return "Formation assigned."
 
 
@@ -276,6 +419,46 @@ async def get_formation_students(session: AsyncSession, formation_id: int):
     return students
 
 
+async def copy_formation_enrollments(
+    source_id: int, target_id: int, session: AsyncSession
+):
+    """
+    Enrolls every student of formation `source_id` into formation `target_id`
+    with a single `INSERT ... SELECT`; students already enrolled are skipped.
+    """
+    res = await session.execute(
+        select(Formation.id).where(Formation.id.in_((source_id, target_id)))
+    )
+    found = set(res.scalars().all())
+    if source_id not in found or target_id not in found:
+        raise NotFoundException("Formation not found.")
+
+    stmt = (
+        insert(Enrollment)
+        .prefix_with("IGNORE")
+        .from_select(
+            ["student_id", "formation_id"],
+            select(Enrollment.student_id, literal(target_id)).where(
+                Enrollment.formation_id == source_id
+            ),
+        )
+    )
+    result = await session.execute(stmt)
+    await record_changes_from(
+        session,
+        "enrollment",
+        select(Enrollment.student_id).where(Enrollment.formation_id == source_id),
+        "update",
+    )
+    await refresh_stats_counters(session)
+    await session.commit()
+    invalidate("formations")
+    invalidate_teacher_activity()
+    invalidate_stats()
+    return {"Success": "Enrollments copied", "created": result.rowcount}
+
+
+@cached(formations_cache, tags=("formations",))
 async def get_formation_details(id: int, session: AsyncSession):
     formation = await session.get(Formation, id)
     if not formation:
@@ -303,3 +486,72 @@ async def get_formation_details(id: int, session: AsyncSession):
         "teacher_name": (f"{teacher.name}" if teacher else None),
         "type_label": formation_type.label,
     }
+
+
+async def get_formation_attendance_matrix(id: int, month: str, session: AsyncSession):
+    """
+    Builds the attendance grid of a formation's roster for one month (`YYYY-MM`).
+
+    Each student's presence is returned as an integer bitmask where bit `d - 1`
+    is set when the student attended on day `d`, along with per-student and
+    per-day totals.
+    """
+    try:
+        year, month_number = (int(part) for part in month.split("-"))
+        start = date(year, month_number, 1)
+    except ValueError:
+        raise UnprocessableEntityException("Month must be in the YYYY-MM format.")
+    days = calendar.monthrange(year, month_number)[1]
+    end = (
+        date(year + 1, 1, 1) if month_number == 12 else date(year, month_number + 1, 1)
+    )
+
+    formation = await session.get(Formation, id)
+    if not formation:
+        raise NotFoundException("Formation not found.")
+
+    stmt = (
+        select(Student.id, Student.name, Attendance.attend_date)
+        .select_from(Enrollment)
+        .join(Student, Student.id == Enrollment.student_id)
+        .outerjoin(
+            Attendance,
+            and_(
+                Attendance.student_id == Enrollment.student_id,
+                Attendance.attend_date >= start,
+                Attendance.attend_date < end,
+            ),
+        )
+        .where(Enrollment.formation_id == id)
+        .order_by(Student.name, Student.id)
+    )
+    result = await session.execute(stmt)
+
+    student_ids = []
+    names = []
+    rows = []
+    cols = []
+    index = {}
+    for student_id, name, attend_date in result:
+        if student_id not in index:
+            index[student_id] = len(student_ids)
+            student_ids.append(student_id)
+            names.append(name)
+        if attend_date is not None:
+            rows.append(index[student_id])
+            cols.append(attend_date.day - 1)
+
+    grid = np.zeros((len(student_ids), days), dtype=bool)
+    grid[rows, cols] = True
+    masks = grid.astype(np.int64) @ (np.int64(1) << np.arange(days, dtype=np.int64))
+
+    return {
+        "formation_id": id,
+        "month": f"{year:04d}-{month_number:02d}",
+        "days": days,
+        "student_ids": student_ids,
+        "names": names,
+        "masks": masks.tolist(),
+        "student_totals": grid.sum(axis=1).tolist(),
+        "day_totals": grid.sum(axis=0).tolist(),
+    }
@@ -2,13 +2,13 @@ import io
 import os
 import time
 from os.path import exists
+from typing import Optional
 
 from PIL import Image as PILImage
 from fastapi import UploadFile, HTTPException, BackgroundTasks
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 from starlette import status
-from starlette.responses import FileResponse
 
 from api.v1.exceptions import NotFoundException
 from api.v1.exceptions import (
@@ -17,7 +17,7 @@ from api.v1.exceptions import (
 )
 from api.v1.models.image import Image
 from api.v1.models.student import Student
-from api.v1.utils import StudentImageSaveError, compress_img
+from api.v1.utils import StudentImageSaveError, compress_img, cached_file_response
 from envconfig import EnvFile
 
 
@@ -32,9 +32,12 @@ def background_img_save(image, output_path):
     os.remove(temp_path)
 
 
-async def get_image(student: int, session: AsyncSession):
+async def get_image(
+    student: int, session: AsyncSession, if_none_match: Optional[str] = None
+):
     """
-    Handles the fetching of a student's image from the database
+    Handles the fetching of a student's image from the database.
+    Answers 304 when `if_none_match` holds the image's current ETag.
     """
     student = await session.get(Student, student)
     if not student:
@@ -45,11 +48,7 @@ async def get_image(student: int, session: AsyncSession):
     if not img:
         raise NotFoundException("The student's image was not found.")
 
-    return FileResponse(
-        status_code=status.HTTP_200_OK,
-        media_type="image/webp",
-        path=img.url,
-    )
+    return cached_file_response(img.url, "image/webp", if_none_match)
 
 
 async def upload_image(
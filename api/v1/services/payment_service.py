@@ -1,13 +1,39 @@
-from typing import List, Dict, Any, Tuple
+import csv
+import io
+from datetime import date
+from typing import List, Dict, Any, Tuple, Iterable, Optional
 
-from sqlalchemy import func
-from sqlmodel import select, extract
+from fastapi import UploadFile
+from pydantic import ValidationError
+from sqlalchemy import func, tuple_, literal, union_all, true
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from api.v1.exceptions import AlreadyExists, NotFoundException
-from api.v1.models.attendance import Attendance
+from api.v1.exceptions import (
+    AlreadyExists,
+    NotFoundException,
+    AppException,
+    UnprocessableEntityException,
+)
+from api.v1.models.enrollment import Enrollment
 from api.v1.models.payment import PaymentModel, Payment
 from api.v1.models.student import Student
+from api.v1.models.student_month_stats import StudentMonthStats
+from api.v1.services.change_service import (
+    record_change,
+    record_changes,
+    changed_since,
+    check_since,
+)
+from api.v1.services.rollup_service import record_payments, record_revenue
+from api.v1.services.stats_service import invalidate_stats
+from api.v1.utils import valid_month, valid_year, decode_cursor
+
+PAYMENT_INSERT_CHUNK = 1000
+ER_DUP_ENTRY = 1062
+MAX_REPORT_MONTHS = 36
 
 
 async def add_payment(payment_model: PaymentModel, session: AsyncSession):
@@ -23,21 +49,209 @@ async def add_payment(payment_model: PaymentModel, session: AsyncSession):
 
     att = Payment.model_validate(payment_model)
 
+    await record_payments(session, [(att.student_id, att.year, att.month, att.amount)])
     session.add(att)
+    await session.flush()
+    record_change(session, "payment", payment_model.student_id, "update")
     await session.commit()
+    invalidate_stats()
     return {"success": "Payment added successfully."}
 
 
-async def get_payments(student_id: int, session: AsyncSession):
-    stmt = (
-        select(Payment)
-        .where(Payment.student_id == student_id)
-        .order_by(Payment.payment_date.desc())
+def _validate_payment_rows(
+    rows: Iterable[Dict[str, Any]],
+) -> Tuple[List[Tuple[int, PaymentModel]], List[Dict[str, Any]]]:
+    """
+    Validates every row with `PaymentModel` in a single pass, before any query
+    is run. Returns the valid (row, model) pairs and the per-row errors.
+    """
+    valid: List[Tuple[int, PaymentModel]] = []
+    errors: List[Dict[str, Any]] = []
+    for row_no, row in enumerate(rows, start=1):
+        # `csv.DictReader` puts the fields beyond the header under None
+        if None in row:
+            errors.append({"row": row_no, "error": "Too many fields."})
+            continue
+        try:
+            valid.append((row_no, PaymentModel.model_validate(row)))
+        except ValidationError as exc:
+            errors.append({"row": row_no, "error": exc.errors()[0]["msg"]})
+        except AppException as exc:
+            errors.append({"row": row_no, "error": exc.message})
+    return valid, errors
+
+
+def _integrity_error(exc: IntegrityError) -> str:
+    if exc.orig.args and exc.orig.args[0] == ER_DUP_ENTRY:
+        return "Student already paid for this month."
+    return "Student not found."
+
+
+async def add_payments_bulk(rows: Iterable[Dict[str, Any]], session: AsyncSession):
+    """
+    Records many payments at once.
+
+    Student existence and already recorded (student, month, year) keys are
+    checked with one set-based query each, then the accepted rows are written
+    with a multi-row insert. Rejected rows are reported with their row number,
+    including the ones that a concurrent write made fail at insert time.
+    """
+    valid, errors = _validate_payment_rows(rows)
+
+    student_ids = {m.student_id for _, m in valid}
+    keys = {(m.student_id, m.month, m.year) for _, m in valid}
+
+    existing_students = set()
+    existing_keys = set()
+    if valid:
+        res = await session.execute(
+            select(Student.id).where(Student.id.in_(student_ids))
+        )
+        existing_students = set(res.scalars().all())
+
+        res = await session.execute(
+            select(Payment.student_id, Payment.month, Payment.year).where(
+                tuple_(Payment.student_id, Payment.month, Payment.year).in_(keys)
+            )
+        )
+        existing_keys = {tuple(r) for r in res.all()}
+
+    to_insert = []
+    seen = set()
+    for row_no, m in valid:
+        key = (m.student_id, m.month, m.year)
+        if m.student_id not in existing_students:
+            errors.append({"row": row_no, "error": "Student not found."})
+        elif key in existing_keys or key in seen:
+            errors.append(
+                {"row": row_no, "error": "Student already paid for this month."}
+            )
+        else:
+            seen.add(key)
+            to_insert.append((row_no, m.model_dump()))
+
+    # Counted in the rollups before the insert, see `record_payments`, and
+    # taken back for the rows that fail
+    await record_payments(
+        session,
+        [
+            (data["student_id"], data["year"], data["month"], data["amount"])
+            for _, data in to_insert
+        ],
+    )
+    inserted: List[Dict[str, Any]] = []
+    failed: List[Dict[str, Any]] = []
+    for i in range(0, len(to_insert), PAYMENT_INSERT_CHUNK):
+        chunk = to_insert[i : i + PAYMENT_INSERT_CHUNK]
+        try:
+            async with session.begin_nested():
+                await session.execute(
+                    insert(Payment).values([data for _, data in chunk])
+                )
+            inserted.extend(data for _, data in chunk)
+        except IntegrityError:
+            # Some rows were recorded, or their student deleted, concurrently
+            # since the checks above: insert them one by one to tell which
+            for row_no, data in chunk:
+                try:
+                    async with session.begin_nested():
+                        await session.execute(insert(Payment).values(data))
+                    inserted.append(data)
+                except IntegrityError as exc:
+                    errors.append({"row": row_no, "error": _integrity_error(exc)})
+                    failed.append(data)
+    await record_payments(
+        session,
+        [
+            (row["student_id"], row["year"], row["month"], row["amount"])
+            for row in failed
+        ],
+        -1,
+    )
+    await record_changes(
+        session, "payment", {row["student_id"] for row in inserted}, "update"
     )
+    await session.commit()
+    invalidate_stats()
+
+    errors.sort(key=lambda e: e["row"])
+    return {
+        "success": "Payments recorded.",
+        "inserted": len(inserted),
+        "errors": errors,
+    }
+
+
+async def import_payments_csv(file: UploadFile, session: AsyncSession):
+    """
+    Imports a cash-book CSV export with the header
+    `student_id,month,year,payment_date,amount`.
+    """
+    try:
+        stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+        reader = csv.DictReader(stream)
+        missing = set(PaymentModel.model_fields) - set(reader.fieldnames or [])
+        if missing:
+            raise UnprocessableEntityException(
+                f"Missing CSV columns: {', '.join(sorted(missing))}"
+            )
+        rows = [
+            {
+                k: (v.strip() or None) if isinstance(v, str) else v
+                for k, v in row.items()
+            }
+            for row in reader
+        ]
+    except (UnicodeDecodeError, csv.Error):
+        raise UnprocessableEntityException("The CSV file could not be read.")
+
+    return await add_payments_bulk(rows, session)
+
+
+async def get_payments(
+    student_id: int,
+    session: AsyncSession,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+):
+    """
+    Returns a student's payments, most recent first.
+
+    Only the payment date and period columns are read. With `limit`, pages are
+    chained by passing the cursor of the last returned payment. With `since`,
+    nothing is returned unless the student's payments changed after that change
+    feed token.
+    """
+    stmt = select(Payment.payment_date, Payment.year, Payment.month).where(
+        Payment.student_id == student_id
+    )
+    if since:
+        await check_since(session, since)
+        stmt = stmt.where(Payment.student_id.in_(changed_since("payment", since)))
+    if date_from:
+        stmt = stmt.where(Payment.payment_date >= date_from)
+    if date_to:
+        stmt = stmt.where(Payment.payment_date <= date_to)
+    if cursor:
+        last_date, last_year, last_month = decode_cursor(cursor, 3)
+        try:
+            key = (date.fromisoformat(last_date), int(last_year), int(last_month))
+        except ValueError:
+            raise UnprocessableEntityException("Invalid cursor.")
+        stmt = stmt.where(
+            tuple_(Payment.payment_date, Payment.year, Payment.month) < key
+        )
+    stmt = stmt.order_by(
+        Payment.payment_date.desc(), Payment.year.desc(), Payment.month.desc()
+    )
+    if limit:
+        stmt = stmt.limit(limit)
+
     res = await session.execute(stmt)
-    if not res:
-        raise NotFoundException("No payments found for this student.")
-    return res.scalars().all()
+    return [dict(r) for r in res.mappings().all()]
 
 
 async def get_payment_status(student_id: int, session: AsyncSession):
@@ -46,18 +260,14 @@ async def get_payment_status(student_id: int, session: AsyncSession):
     where `paid` is True if there's at least one payment for that month/year and
     `attended_days` is the total attendance rows for that month (0 if none).
     """
-    # get attendance in (month,year) pairs with counts
-    att_stmt = (
-        select(
-            extract("month", Attendance.attend_date).label("month"),
-            extract("year", Attendance.attend_date).label("year"),
-            func.count(Attendance.attend_date).label("attended_days"),
-        )
-        .where(Attendance.student_id == student_id)
-        .group_by(
-            extract("month", Attendance.attend_date),
-            extract("year", Attendance.attend_date),
-        )
+    # get attendance in (month,year) pairs with counts from the monthly rollup
+    att_stmt = select(
+        StudentMonthStats.month.label("month"),
+        StudentMonthStats.year.label("year"),
+        StudentMonthStats.attended_days.label("attended_days"),
+    ).where(
+        StudentMonthStats.student_id == student_id,
+        StudentMonthStats.attended_days > 0,
     )
     att_result = await session.execute(att_stmt)
     att_rows = (
@@ -125,20 +335,174 @@ async def get_payment_status(student_id: int, session: AsyncSession):
     return results
 
 
+def _month_range(
+    from_month: int, from_year: int, to_month: int, to_year: int
+) -> List[Tuple[int, int]]:
+    for m in (from_month, to_month):
+        if not valid_month(m):
+            raise UnprocessableEntityException(f"Invalid month: {m}")
+    for y in (from_year, to_year):
+        if not valid_year(y):
+            raise UnprocessableEntityException(f"Invalid year: {y}")
+
+    months = []
+    year, month = from_year, from_month
+    while (year, month) <= (to_year, to_month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    if not months:
+        raise UnprocessableEntityException("The month range is empty.")
+    if len(months) > MAX_REPORT_MONTHS:
+        raise UnprocessableEntityException(
+            f"The month range cannot exceed {MAX_REPORT_MONTHS} months."
+        )
+    return months
+
+
+async def get_payment_report(
+    session: AsyncSession,
+    from_month: int,
+    from_year: int,
+    to_month: int,
+    to_year: int,
+    formation_id: Optional[int] = None,
+    status: Optional[str] = None,
+):
+    """
+    Computes the payment status of every student (or every student enrolled in
+    `formation_id`) for each month of a range, in a single query.
+
+    Attendance counts read from the monthly rollup and payment sums over the
+    range are joined to the (student, month) grid in SQL. The result is
+    returned column by column, optionally keeping only `paid` or `unpaid` rows.
+    """
+    if status not in (None, "paid", "unpaid"):
+        raise UnprocessableEntityException("Status must be `paid` or `unpaid`.")
+
+    months = _month_range(from_month, from_year, to_month, to_year)
+
+    month_grid = union_all(
+        *(
+            select(literal(y).label("year"), literal(m).label("month"))
+            for y, m in months
+        )
+    ).subquery("month_grid")
+
+    students = select(Student.id.label("student_id"), Student.name)
+    if formation_id is not None:
+        students = students.join(Enrollment, Enrollment.student_id == Student.id).where(
+            Enrollment.formation_id == formation_id
+        )
+    students = students.subquery("students")
+
+    attendance = (
+        select(
+            StudentMonthStats.student_id,
+            StudentMonthStats.year,
+            StudentMonthStats.month,
+            StudentMonthStats.attended_days,
+        )
+        .where(
+            tuple_(StudentMonthStats.year, StudentMonthStats.month) >= months[0],
+            tuple_(StudentMonthStats.year, StudentMonthStats.month) <= months[-1],
+        )
+        .subquery("attendance")
+    )
+
+    payments = (
+        select(
+            Payment.student_id,
+            Payment.year,
+            Payment.month,
+            func.sum(Payment.amount).label("amount"),
+            func.max(Payment.payment_date).label("payment_date"),
+        )
+        .where(
+            tuple_(Payment.year, Payment.month) >= months[0],
+            tuple_(Payment.year, Payment.month) <= months[-1],
+        )
+        .group_by(Payment.student_id, Payment.year, Payment.month)
+        .subquery("payments")
+    )
+
+    stmt = (
+        select(
+            students.c.student_id,
+            students.c.name,
+            month_grid.c.year,
+            month_grid.c.month,
+            func.coalesce(attendance.c.attended_days, 0),
+            payments.c.amount,
+            payments.c.payment_date,
+            payments.c.student_id.is_not(None),
+        )
+        .select_from(students)
+        .join(month_grid, true())
+        .outerjoin(
+            attendance,
+            (attendance.c.student_id == students.c.student_id)
+            & (attendance.c.year == month_grid.c.year)
+            & (attendance.c.month == month_grid.c.month),
+        )
+        .outerjoin(
+            payments,
+            (payments.c.student_id == students.c.student_id)
+            & (payments.c.year == month_grid.c.year)
+            & (payments.c.month == month_grid.c.month),
+        )
+        .order_by(students.c.student_id, month_grid.c.year, month_grid.c.month)
+    )
+    if status == "paid":
+        stmt = stmt.where(payments.c.student_id.is_not(None))
+    elif status == "unpaid":
+        stmt = stmt.where(payments.c.student_id.is_(None))
+
+    result = await session.execute(stmt)
+    rows = result.all()
+
+    names = [
+        "student_id",
+        "name",
+        "year",
+        "month",
+        "attended_days",
+        "amount",
+        "payment_date",
+        "paid",
+    ]
+    columns = list(zip(*rows)) if rows else [() for _ in names]
+    report: Dict[str, Any] = {"count": len(rows)}
+    for name, values in zip(names, columns):
+        report[name] = list(values)
+    report["paid"] = [bool(v) for v in report["paid"]]
+    report["attended_days"] = [int(v) for v in report["attended_days"]]
+    return report
+
+
 async def edit_payment(model: PaymentModel, session: AsyncSession):
     student = await session.get(Student, model.student_id)
     if not student:
         raise NotFoundException("Student not found.")
 
-    payment = await session.get(Payment, (model.student_id, model.month, model.year))
+    payment = await session.get(
+        Payment, (model.student_id, model.month, model.year), with_for_update=True
+    )
     if not payment:
         raise NotFoundException("No payment found on this month and year.")
 
+    if model.amount != payment.amount:
+        await record_revenue(
+            session, payment.year, payment.month, model.amount - payment.amount
+        )
     payment.amount = model.amount
     payment.payment_date = model.payment_date
 
     session.add(payment)
+    await session.flush()
+    record_change(session, "payment", model.student_id, "update")
     await session.commit()
+    invalidate_stats()
 
     return {"Success": "Payment updated."}
 
@@ -154,7 +518,15 @@ async def delete_payment(payment: PaymentModel, session: AsyncSession):
     if not payment:
         raise NotFoundException("No payment found on this month and year.")
 
+    await record_payments(
+        session,
+        [(payment.student_id, payment.year, payment.month, payment.amount)],
+        -1,
+    )
     await session.delete(payment)
+    await session.flush()
+    record_change(session, "payment", payment.student_id, "update")
     await session.commit()
+    invalidate_stats()
 
     return {"Success": "Payment deleted."}
@@ -0,0 +1,96 @@
+import asyncio
+from typing import Any, Dict, Optional
+
+from sqlmodel import select
+
+from api.v1.exceptions import NotFoundException
+from api.v1.models.image import Image
+from api.v1.models.qrcode import QRCode
+from api.v1.models.student import Student
+from api.v1.services.attendance_service import get_attendances
+from api.v1.services.formation_services import (
+    get_student_enrolled_formations,
+    get_available_formations_for_student,
+)
+from api.v1.services.payment_service import get_payment_status
+from api.v1.utils import file_etag
+from db.session import async_session
+
+API_PREFIX = "/api/v1"
+
+
+async def _in_session(fn, *args):
+    """
+    Runs `fn(session, *args)` on a session of its own, so that the profile
+    queries can use separate pooled connections at the same time.
+    """
+    async with async_session() as session:
+        return await fn(session, *args)
+
+
+async def _student_row(session, student_id: int) -> Optional[Dict[str, Any]]:
+    stmt = (
+        select(
+            Student.id,
+            Student.name,
+            Student.birth_date,
+            Student.tel1,
+            Student.tel2,
+            Student.email,
+            Image.url.label("image_path"),
+            QRCode.url.label("qrcode_path"),
+        )
+        .outerjoin(Image, Student.image == Image.id)
+        .outerjoin(QRCode, Student.qrcode == QRCode.id)
+        .where(Student.id == student_id)
+    )
+    res = await session.execute(stmt)
+    row = res.mappings().first()
+    return dict(row) if row else None
+
+
+async def _attendances(session, student_id: int):
+    try:
+        return await get_attendances(student_id, session)
+    except NotFoundException:
+        return []
+
+
+def _file_link(url: str, path: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not path:
+        return None
+    return {"url": url, "etag": file_etag(path)}
+
+
+async def get_student_profile(student_id: int) -> Dict[str, Any]:
+    """
+    Returns a student with their enrollments, available formations, payment
+    status and attendances in one document.
+
+    The queries are independent of each other, so they run concurrently, each
+    on its own session. Image and QR code are returned as URLs with the ETag of
+    the current file, for the client to fetch them through its cache.
+    """
+    student, enrollments, available, payments, attendances = await asyncio.gather(
+        _in_session(_student_row, student_id),
+        _in_session(get_student_enrolled_formations, student_id),
+        _in_session(get_available_formations_for_student, student_id),
+        _in_session(lambda s: get_payment_status(student_id, s)),
+        _in_session(_attendances, student_id),
+    )
+    if not student:
+        raise NotFoundException("This student was not found.")
+
+    image_path = student.pop("image_path")
+    qrcode_path = student.pop("qrcode_path")
+    base = f"{API_PREFIX}/students/{student_id}"
+
+    return {
+        "student": student,
+        "image": _file_link(f"{base}/image", image_path),
+        "qrcode": _file_link(f"{base}/code", qrcode_path),
+        "enrollments": enrollments,
+        "available_formations": available,
+        "payment_status": payments,
+        "attendances": attendances,
+    }
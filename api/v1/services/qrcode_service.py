@@ -2,12 +2,16 @@
 Module for handling QR Code generation and scanning.
 """
 
+import asyncio
 import base64
 import hashlib
+import multiprocessing
 import os
 import time
+from concurrent.futures import ProcessPoolExecutor
 from os.path import exists
 from random import randint
+from typing import Dict, Iterable, Optional
 
 import cv2
 import numpy as np
@@ -31,6 +35,33 @@ from api.v1.models.student import Student
 from api.v1.utils import compress_img
 from envconfig import EnvFile
 
+_qr_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_qr_pool() -> ProcessPoolExecutor:
+    """
+    Returns the worker pool used for bulk QR Code generation, creating it on
+    first use. Its size is set by `QR_WORKERS` (0 means one per CPU).
+    """
+    global _qr_pool
+    if _qr_pool is None:
+        _qr_pool = ProcessPoolExecutor(
+            max_workers=EnvFile.QR_WORKERS or None,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _qr_pool
+
+
+def shutdown_qr_pool():
+    """
+    Shuts the QR Code worker pool down, waiting for the pending generations.
+    Called when the application stops.
+    """
+    global _qr_pool
+    if _qr_pool is not None:
+        _qr_pool.shutdown(wait=True)
+        _qr_pool = None
+
 
 def get_key() -> bytes:
     """
@@ -127,6 +158,23 @@ def generate_qrcode(data: str, student_id: int) -> str:
     return comp_qr_path
 
 
+async def generate_qrcodes(student_ids: Iterable[int]) -> Dict[int, str]:
+    """
+    Generates the QR Codes of many students in parallel on the worker pool.
+
+    Returns a mapping of student id to QR Code path, students whose generation
+    failed are left out.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_qr_pool()
+    ids = list(student_ids)
+    paths = await asyncio.gather(
+        *(loop.run_in_executor(pool, generate_qrcode, str(i), i) for i in ids),
+        return_exceptions=True,
+    )
+    return {i: path for i, path in zip(ids, paths) if isinstance(path, str)}
+
+
 async def delete_qr(id: int, session: AsyncSession):
     """
     Handles deletion of a qr code
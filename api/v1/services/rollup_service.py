@@ -0,0 +1,539 @@
+"""
+Module for maintaining the rollup tables.
+
+The write paths apply their changes to `student_month_stats` and to the
+dashboard rollups as increments, in their own transaction: `record_checkins`
+for recorded or deleted attendances, `record_payments` and `record_revenue` for
+payments, and `remove_student_figures` for a deleted student. Only the rows of
+the days, months and student-months they touch are updated.
+
+Full recomputations, `refresh_month_stats`, `refresh_day_stats` and
+`refresh_month_totals`, are left to the statistics reconciler, the command
+line and the rare writes whose exact rows are not known, while
+`refresh_stats_counters` recounts the named totals. The whole
+`student_month_stats` table is backfilled by `init_db` when it is empty, e.g.
+on the first deploy after it was added, and can be rebuilt or verified from the
+command line:
+
+    python -m api.v1.services.rollup_service rebuild
+    python -m api.v1.services.rollup_service verify
+"""
+
+import asyncio
+import sys
+from collections import Counter
+from datetime import date
+from typing import Iterable, List, Dict, Any, Optional, Tuple
+
+from sqlalchemy import and_, delete, exists, func, literal, tuple_, union_all, update
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select, extract
+
+from api.v1.models.attendance import Attendance
+from api.v1.models.dashboard_stats import DayStats, MonthStats, StatsCounter
+from api.v1.models.enrollment import Enrollment
+from api.v1.models.formation import Formation
+from api.v1.models.payment import Payment
+from api.v1.models.student import Student
+from api.v1.models.student_month_stats import StudentMonthStats
+
+
+def _month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def _next_month_start(d: date) -> date:
+    return date(d.year + 1, 1, 1) if d.month == 12 else date(d.year, d.month + 1, 1)
+
+
+def _attendance_counts(
+    student_ids: Optional[Iterable[int]] = None,
+    first_day: Optional[date] = None,
+    after_last_day: Optional[date] = None,
+):
+    att_year = extract("year", Attendance.attend_date)
+    att_month = extract("month", Attendance.attend_date)
+    stmt = select(
+        Attendance.student_id,
+        att_year.label("year"),
+        att_month.label("month"),
+        func.count().label("attended_days"),
+    ).group_by(Attendance.student_id, att_year, att_month)
+
+    if student_ids is not None:
+        stmt = stmt.where(Attendance.student_id.in_(student_ids))
+    if first_day is not None:
+        stmt = stmt.where(Attendance.attend_date >= first_day)
+    if after_last_day is not None:
+        stmt = stmt.where(Attendance.attend_date < after_last_day)
+    return stmt
+
+
+async def refresh_month_stats(
+    session: AsyncSession,
+    student_ids: Optional[Iterable[int]],
+    first_day: date,
+    last_day: date,
+):
+    """
+    Recomputes the rollup rows of `student_ids` (all students when None) for
+    every month between `first_day` and `last_day`. Does not commit, so it is
+    part of the caller's transaction.
+    """
+    if student_ids is not None:
+        student_ids = set(student_ids)
+        if not student_ids:
+            return
+
+    start = _month_start(first_day)
+    end = _next_month_start(last_day)
+
+    stmt = delete(StudentMonthStats).where(
+        tuple_(StudentMonthStats.year, StudentMonthStats.month)
+        >= (start.year, start.month),
+        tuple_(StudentMonthStats.year, StudentMonthStats.month) < (end.year, end.month),
+    )
+    if student_ids is not None:
+        stmt = stmt.where(StudentMonthStats.student_id.in_(student_ids))
+    await session.execute(stmt)
+    await session.execute(
+        insert(StudentMonthStats).from_select(
+            ["student_id", "year", "month", "attended_days"],
+            _attendance_counts(student_ids, start, end),
+        )
+    )
+
+
+async def refresh_day_stats(session: AsyncSession, first_day: date, last_day: date):
+    """
+    Recomputes the check-ins of every day between `first_day` and `last_day`.
+    Does not commit.
+    """
+    await session.execute(
+        delete(DayStats).where(DayStats.day >= first_day, DayStats.day <= last_day)
+    )
+    await session.execute(
+        insert(DayStats).from_select(
+            ["day", "checkins"],
+            select(Attendance.attend_date, func.count())
+            .where(
+                Attendance.attend_date >= first_day,
+                Attendance.attend_date <= last_day,
+            )
+            .group_by(Attendance.attend_date),
+        )
+    )
+
+
+async def refresh_month_totals(session: AsyncSession, first_day: date, last_day: date):
+    """
+    Recomputes the revenue and unpaid student count of every month between
+    `first_day` and `last_day`. The unpaid count is read from
+    `student_month_stats`, so this runs after `refresh_month_stats`. Does not
+    commit.
+    """
+    start = _month_start(first_day)
+    end = _next_month_start(last_day)
+
+    def in_range(year, month):
+        return (
+            tuple_(year, month) >= (start.year, start.month),
+            tuple_(year, month) < (end.year, end.month),
+        )
+
+    revenue = select(
+        Payment.year.label("year"),
+        Payment.month.label("month"),
+        Payment.amount.label("revenue"),
+        literal(0).label("unpaid"),
+    ).where(*in_range(Payment.year, Payment.month))
+    unpaid = select(
+        StudentMonthStats.year,
+        StudentMonthStats.month,
+        literal(0),
+        literal(1),
+    ).where(
+        *in_range(StudentMonthStats.year, StudentMonthStats.month),
+        StudentMonthStats.attended_days > 0,
+        ~exists().where(
+            Payment.student_id == StudentMonthStats.student_id,
+            Payment.year == StudentMonthStats.year,
+            Payment.month == StudentMonthStats.month,
+        ),
+    )
+    figures = union_all(revenue, unpaid).subquery("figures")
+
+    await session.execute(
+        delete(MonthStats).where(*in_range(MonthStats.year, MonthStats.month))
+    )
+    await session.execute(
+        insert(MonthStats).from_select(
+            ["year", "month", "revenue", "unpaid_count"],
+            select(
+                figures.c.year,
+                figures.c.month,
+                func.sum(figures.c.revenue),
+                func.sum(figures.c.unpaid),
+            ).group_by(figures.c.year, figures.c.month),
+        )
+    )
+
+
+async def refresh_stats_counters(session: AsyncSession):
+    """
+    Recounts the students and the active formations, the ones started with at
+    least one student enrolled. Does not commit.
+    """
+    active_formations = (
+        select(func.count())
+        .select_from(Formation)
+        .where(
+            Formation.start_date <= date.today(),
+            exists().where(Enrollment.formation_id == Formation.id),
+        )
+        .scalar_subquery()
+    )
+    stmt = insert(StatsCounter).values(
+        [
+            {
+                "name": "students",
+                "value": select(func.count()).select_from(Student).scalar_subquery(),
+            },
+            {"name": "active_formations", "value": active_formations},
+        ]
+    )
+    await session.execute(stmt.on_duplicate_key_update(value=stmt.inserted.value))
+
+
+async def refresh_attendance_rollups(
+    session: AsyncSession,
+    student_ids: Iterable[int],
+    first_day: date,
+    last_day: date,
+):
+    """
+    Recomputes every rollup fed by the attendances of `student_ids` between
+    `first_day` and `last_day`, for writes whose exact rows are not known.
+    Does not commit.
+    """
+    await refresh_month_stats(session, student_ids, first_day, last_day)
+    await refresh_month_totals(session, first_day, last_day)
+    await refresh_day_stats(session, first_day, last_day)
+
+
+async def _increment(session: AsyncSession, model, rows: List[Dict[str, Any]]):
+    """
+    Adds the values of `rows` to the matching rows of `model`, by primary key,
+    inserting the missing ones.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    keys = {c.name for c in table.primary_key.columns}
+    columns = [c for c in rows[0] if c not in keys]
+
+    stmt = insert(model).values(rows)
+    await session.execute(
+        stmt.on_duplicate_key_update(
+            {c: table.c[c] + stmt.inserted[c] for c in columns}
+        )
+    )
+
+
+async def _increment_months(
+    session: AsyncSession,
+    revenue: Dict[Tuple[int, int], float],
+    unpaid: Dict[Tuple[int, int], int],
+):
+    months = sorted(
+        m for m in set(revenue) | set(unpaid) if revenue.get(m) or unpaid.get(m)
+    )
+    await _increment(
+        session,
+        MonthStats,
+        [
+            {
+                "year": year,
+                "month": month,
+                "revenue": revenue.get((year, month), 0),
+                "unpaid_count": unpaid.get((year, month), 0),
+            }
+            for year, month in months
+        ],
+    )
+
+
+async def record_checkins(
+    session: AsyncSession, rows: Iterable[Tuple[int, date]], sign: int = 1
+):
+    """
+    Applies (student_id, attend_date) attendances to the rollups, as recorded
+    ones with `sign` 1 or deleted ones with -1. Every row must have been
+    inserted or deleted by the caller. Does not commit.
+
+    The student-month rows are updated first, so a concurrent payment of the
+    same month, which locks them before its own write, waits for this
+    transaction or is seen by it.
+    """
+    rows = list(rows)
+    per_day = Counter(day for _, day in rows)
+    per_month = Counter((student_id, day.year, day.month) for student_id, day in rows)
+    if not per_month:
+        return
+
+    await _increment(
+        session,
+        StudentMonthStats,
+        [
+            {"student_id": s, "year": y, "month": m, "attended_days": n * sign}
+            for (s, y, m), n in sorted(per_month.items())
+        ],
+    )
+
+    # A student-month turns unpaid when its first attendance is recorded, and
+    # no longer is once its last one is deleted
+    res = await session.execute(
+        select(
+            StudentMonthStats.student_id,
+            StudentMonthStats.year,
+            StudentMonthStats.month,
+            StudentMonthStats.attended_days,
+            Payment.student_id.is_not(None),
+        )
+        .outerjoin(
+            Payment,
+            and_(
+                Payment.student_id == StudentMonthStats.student_id,
+                Payment.year == StudentMonthStats.year,
+                Payment.month == StudentMonthStats.month,
+            ),
+        )
+        .where(
+            tuple_(
+                StudentMonthStats.student_id,
+                StudentMonthStats.year,
+                StudentMonthStats.month,
+            ).in_(per_month)
+        )
+        .with_for_update(read=True)
+    )
+    unpaid: Dict[Tuple[int, int], int] = Counter()
+    for student_id, year, month, after, paid in res.all():
+        before = after - per_month[(student_id, year, month)] * sign
+        if not paid and (before > 0) != (after > 0):
+            unpaid[(year, month)] += 1 if after > 0 else -1
+    await _increment_months(session, {}, unpaid)
+
+    await _increment(
+        session,
+        DayStats,
+        [{"day": day, "checkins": n * sign} for day, n in sorted(per_day.items())],
+    )
+
+
+async def record_payments(
+    session: AsyncSession,
+    rows: Iterable[Tuple[int, int, int, float]],
+    sign: int = 1,
+):
+    """
+    Applies (student_id, year, month, amount) payments to the month rollups,
+    as recorded ones with `sign` 1 or deleted ones with -1. Does not commit.
+
+    Called before the payments are written, as it locks the student-month rows
+    their unpaid count depends on, see `record_checkins`.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+
+    res = await session.execute(
+        select(
+            StudentMonthStats.student_id,
+            StudentMonthStats.year,
+            StudentMonthStats.month,
+        )
+        .where(
+            tuple_(
+                StudentMonthStats.student_id,
+                StudentMonthStats.year,
+                StudentMonthStats.month,
+            ).in_({(s, y, m) for s, y, m, _ in rows}),
+            StudentMonthStats.attended_days > 0,
+        )
+        .with_for_update()
+    )
+    attended = {tuple(r) for r in res.all()}
+
+    revenue: Dict[Tuple[int, int], float] = Counter()
+    unpaid: Dict[Tuple[int, int], int] = Counter()
+    for student_id, year, month, amount in rows:
+        revenue[(year, month)] += amount * sign
+        if (student_id, year, month) in attended:
+            unpaid[(year, month)] -= sign
+    await _increment_months(session, revenue, unpaid)
+
+
+async def record_revenue(session: AsyncSession, year: int, month: int, amount: float):
+    """Adds `amount` to the revenue of a month. Does not commit."""
+    await _increment_months(session, {(year, month): amount}, {})
+
+
+async def remove_student_figures(session: AsyncSession, student_id: int):
+    """
+    Removes the attendances and payments of a student from the dashboard
+    rollups, before the student is deleted. Does not commit.
+    """
+    await session.execute(
+        update(DayStats)
+        .where(
+            DayStats.day == Attendance.attend_date,
+            Attendance.student_id == student_id,
+        )
+        .values(checkins=DayStats.checkins - 1)
+    )
+    await session.execute(
+        update(MonthStats)
+        .where(
+            MonthStats.year == StudentMonthStats.year,
+            MonthStats.month == StudentMonthStats.month,
+            StudentMonthStats.student_id == student_id,
+            StudentMonthStats.attended_days > 0,
+            ~exists().where(
+                Payment.student_id == student_id,
+                Payment.year == StudentMonthStats.year,
+                Payment.month == StudentMonthStats.month,
+            ),
+        )
+        .values(unpaid_count=MonthStats.unpaid_count - 1)
+    )
+    await session.execute(
+        update(MonthStats)
+        .where(
+            MonthStats.year == Payment.year,
+            MonthStats.month == Payment.month,
+            Payment.student_id == student_id,
+        )
+        .values(revenue=MonthStats.revenue - Payment.amount)
+    )
+
+
+async def rebuild_month_stats(session: AsyncSession) -> int:
+    """
+    Rebuilds the whole rollup table from `Attendance`. Returns the row count.
+    """
+    await session.execute(delete(StudentMonthStats))
+    await session.execute(
+        insert(StudentMonthStats).from_select(
+            ["student_id", "year", "month", "attended_days"],
+            _attendance_counts(),
+        )
+    )
+    await session.commit()
+
+    res = await session.execute(select(func.count()).select_from(StudentMonthStats))
+    return res.scalar_one()
+
+
+async def backfill_month_stats(session: AsyncSession) -> int:
+    """
+    Fills the rollup table from `Attendance` when it is empty and attendances
+    exist. Returns the number of rows inserted.
+
+    Several workers may start at once and all find the table empty, so rows
+    are inserted with `INSERT IGNORE`: the ones another worker inserted first
+    hold the same counts.
+    """
+    res = await session.execute(select(exists(select(StudentMonthStats.student_id))))
+    if res.scalar():
+        return 0
+
+    res = await session.execute(
+        insert(StudentMonthStats)
+        .prefix_with("IGNORE")
+        .from_select(
+            ["student_id", "year", "month", "attended_days"],
+            _attendance_counts(),
+        )
+    )
+    await session.commit()
+    return res.rowcount
+
+
+async def verify_month_stats(session: AsyncSession) -> List[Dict[str, Any]]:
+    """
+    Compares the rollup table with `Attendance` and returns the mismatching
+    (student, year, month) rows.
+    """
+    live = _attendance_counts().subquery("live")
+
+    missing_or_wrong = (
+        select(
+            live.c.student_id,
+            live.c.year,
+            live.c.month,
+            live.c.attended_days.label("expected"),
+            StudentMonthStats.attended_days.label("stored"),
+        )
+        .select_from(live)
+        .outerjoin(
+            StudentMonthStats,
+            (StudentMonthStats.student_id == live.c.student_id)
+            & (StudentMonthStats.year == live.c.year)
+            & (StudentMonthStats.month == live.c.month),
+        )
+        .where(
+            StudentMonthStats.attended_days.is_(None)
+            | (StudentMonthStats.attended_days != live.c.attended_days)
+        )
+    )
+    stale = (
+        select(
+            StudentMonthStats.student_id,
+            StudentMonthStats.year,
+            StudentMonthStats.month,
+            func.coalesce(live.c.attended_days, 0).label("expected"),
+            StudentMonthStats.attended_days.label("stored"),
+        )
+        .select_from(StudentMonthStats)
+        .outerjoin(
+            live,
+            (StudentMonthStats.student_id == live.c.student_id)
+            & (StudentMonthStats.year == live.c.year)
+            & (StudentMonthStats.month == live.c.month),
+        )
+        .where(live.c.student_id.is_(None), StudentMonthStats.attended_days != 0)
+    )
+
+    mismatches = []
+    for stmt in (missing_or_wrong, stale):
+        res = await session.execute(stmt)
+        mismatches.extend(dict(r) for r in res.mappings().all())
+    return mismatches
+
+
+async def _main(command: str) -> int:
+    from db.session import async_session
+
+    async with async_session() as session:
+        if command == "rebuild":
+            count = await rebuild_month_stats(session)
+            print(f"Rebuilt student_month_stats: {count} rows.")
+            return 0
+
+        mismatches = await verify_month_stats(session)
+        for m in mismatches:
+            print(
+                f"student {m['student_id']} {m['year']}-{m['month']:02d}: "
+                f"expected {m['expected']}, stored {m['stored']}"
+            )
+        print(f"{len(mismatches)} mismatching rows.")
+        return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in ("rebuild", "verify"):
+        print("Usage: python -m api.v1.services.rollup_service rebuild|verify")
+        sys.exit(2)
+    sys.exit(asyncio.run(_main(sys.argv[1])))
@@ -0,0 +1,175 @@
+"""
+Module for the admin dashboard statistics.
+
+Figures are read in one round trip from the small rollup tables of
+`api.v1.models.dashboard_stats`, which the write paths update by increments,
+and the revenue series from a grouped query over `Payment`. Results are cached
+in memory for `STATS_CACHE_TTL` seconds under the "stats" tag, dropped by the
+write paths with `invalidate_stats`.
+
+A periodic reconciler recomputes the current month and day of the rollups,
+catching up with the figures that change with the date alone, such as
+formations becoming active.
+"""
+
+import asyncio
+import logging
+from datetime import date, datetime
+from typing import Dict, Any
+
+from sqlalchemy import func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from api.v1.cache import AsyncCache, cached, invalidate
+from api.v1.models.dashboard_stats import DayStats, MonthStats, StatsCounter
+from api.v1.models.payment import Payment
+from api.v1.models.student import Student
+from api.v1.services.rollup_service import (
+    refresh_day_stats,
+    refresh_month_stats,
+    refresh_month_totals,
+    refresh_stats_counters,
+)
+from envconfig import EnvFile
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_LOCK = "stats_reconciler"
+RECONCILE_CHUNK_SIZE = 500
+
+stats_cache = AsyncCache("stats", EnvFile.STATS_CACHE_TTL)
+
+
+def invalidate_stats():
+    """Drops the cached statistics, called by the write paths after a commit."""
+    invalidate("stats")
+
+
+def _months_back(today: date, count: int):
+    year, month = today.year, today.month
+    for _ in range(count - 1):
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return year, month
+
+
+async def _compute_stats(session: AsyncSession, months: int) -> Dict[str, Any]:
+    today = date.today()
+
+    def counter(name: str):
+        return func.coalesce(
+            select(StatsCounter.value)
+            .where(StatsCounter.name == name)
+            .scalar_subquery(),
+            0,
+        )
+
+    def this_month(column):
+        return func.coalesce(
+            select(column)
+            .where(MonthStats.year == today.year, MonthStats.month == today.month)
+            .scalar_subquery(),
+            0,
+        )
+
+    figures = await session.execute(
+        select(
+            counter("students"),
+            counter("active_formations"),
+            this_month(MonthStats.revenue),
+            this_month(MonthStats.unpaid_count),
+            func.coalesce(
+                select(DayStats.checkins)
+                .where(DayStats.day == today)
+                .scalar_subquery(),
+                0,
+            ),
+        )
+    )
+    total_students, active, revenue, unpaid_count, checkins = figures.one()
+
+    start = _months_back(today, months)
+    series = await session.execute(
+        select(Payment.year, Payment.month, func.sum(Payment.amount).label("revenue"))
+        .where(
+            tuple_(Payment.year, Payment.month) >= start,
+            tuple_(Payment.year, Payment.month) <= (today.year, today.month),
+        )
+        .group_by(Payment.year, Payment.month)
+        .order_by(Payment.year, Payment.month)
+    )
+
+    return {
+        "total_students": total_students,
+        "active_formations": active,
+        "monthly_revenue": float(revenue),
+        "unpaid_count": unpaid_count,
+        "today_checkins": checkins,
+        "revenue_by_month": [
+            {"year": y, "month": m, "revenue": float(r)} for y, m, r in series.all()
+        ],
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+@cached(stats_cache, tags=("stats",))
+async def get_stats(session: AsyncSession, months: int = 12):
+    return await _compute_stats(session, months)
+
+
+async def reconcile_stats():
+    """
+    Recomputes the current month of the rollups and drops the cached
+    statistics.
+
+    Runs in a single worker at a time, under a MySQL named lock, and refreshes
+    `student_month_stats` by chunks of `RECONCILE_CHUNK_SIZE` students, each in
+    a transaction of its own.
+    """
+    from db.engine import user_engine
+
+    today = date.today()
+    async with user_engine.connect() as conn:
+        res = await conn.execute(select(func.get_lock(RECONCILE_LOCK, 0)))
+        if not res.scalar():
+            return
+        # The lock outlives transactions, the session runs its own
+        await conn.commit()
+        try:
+            async with AsyncSession(bind=conn, expire_on_commit=False) as session:
+                last_id = 0
+                while True:
+                    res = await session.execute(
+                        select(Student.id)
+                        .where(Student.id > last_id)
+                        .order_by(Student.id)
+                        .limit(RECONCILE_CHUNK_SIZE)
+                    )
+                    student_ids = res.scalars().all()
+                    if not student_ids:
+                        break
+                    await refresh_month_stats(session, student_ids, today, today)
+                    await session.commit()
+                    last_id = student_ids[-1]
+
+                await refresh_month_totals(session, today, today)
+                await refresh_day_stats(session, today, today)
+                await refresh_stats_counters(session)
+                await session.commit()
+        finally:
+            await conn.execute(select(func.release_lock(RECONCILE_LOCK)))
+            await conn.commit()
+    invalidate_stats()
+
+
+async def run_stats_reconciler(interval: float):
+    """
+    Runs `reconcile_stats` at startup, which fills the rollups on the first
+    deploy, then every `interval` seconds until cancelled.
+    """
+    while True:
+        try:
+            await reconcile_stats()
+        except Exception:
+            logger.exception("Statistics reconciliation failed.")
+        await asyncio.sleep(interval)
@@ -1,29 +1,56 @@
+import csv
+import io
+import json
+import logging
 import os.path
-from typing import Optional
+from typing import Optional, List, Dict, Any, Iterator, Set, Tuple
 
-from fastapi import BackgroundTasks
-from sqlalchemy import delete, func
+from fastapi import BackgroundTasks, UploadFile
+from pydantic import ValidationError
+from sqlalchemy import delete, exists, func, literal, text, update
+from sqlalchemy.dialects.mysql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select
-from starlette import status
 from starlette.concurrency import run_in_threadpool
-from starlette.responses import FileResponse
 
+from api.v1.cache import invalidate
 from api.v1.exceptions import (
     StudentImageDeleteError,
     NotFoundException,
     QRCodeDeletionError,
     AlreadyExists,
+    AppException,
+    UnprocessableEntityException,
 )
-from api.v1.models.enrollment import Enrollment
+from api.v1.models.enrollment import Enrollment, BulkEnrollmentModel
 from api.v1.models.formation import Formation
 from api.v1.models.image import Image
 from api.v1.models.qrcode import QRCode
 from api.v1.models.student import Student, StudentCreate
+from api.v1.services.change_service import (
+    record_change,
+    record_changes,
+    changed_since,
+    check_since,
+)
 from api.v1.services.qrcode_service import (
     generate_qrcode,
+    generate_qrcodes,
+)
+from api.v1.services.rollup_service import (
+    refresh_stats_counters,
+    remove_student_figures,
 )
-from api.v1.utils import clean_spaces
+from api.v1.services.stats_service import invalidate_stats
+from api.v1.services.teacher_service import invalidate_teacher_activity
+from api.v1.utils import clean_spaces, cached_file_response
+from db.session import async_session
+from envconfig import EnvFile
+
+logger = logging.getLogger(__name__)
+
+# Students whose QR Code is being generated in the background
+_qrcodes_pending: Set[int] = set()
 
 
 async def add_student(
@@ -57,17 +84,227 @@ async def add_student(
     db_student.qrcode = qr_code.id
 
     session.add(db_student)
+    record_change(session, "student", db_student.id, "insert")
 
+    await refresh_stats_counters(session)
     await session.commit()
+    invalidate("students")
+    invalidate_stats()
 
     return {"Success": "Student created", "id": db_student.id}
 
 
+def _read_student_rows(file: UploadFile) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Yields the (row number, row) pairs of an uploaded CSV or NDJSON file one at
+    a time, so the file is never fully loaded in memory.
+    """
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    name = (file.filename or "").lower()
+
+    if name.endswith(".csv") or file.content_type == "text/csv":
+        for row_no, row in enumerate(csv.DictReader(stream), start=1):
+            # The fields beyond the header are kept under None
+            yield row_no, {
+                k: (v.strip() or None) if isinstance(v, str) else v
+                for k, v in row.items()
+            }
+        return
+
+    for row_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if line:
+            try:
+                yield row_no, json.loads(line)
+            except ValueError:
+                yield row_no, {}
+
+
+def _schedule_qrcodes(bgt: BackgroundTasks, student_ids: List[int]):
+    _qrcodes_pending.update(student_ids)
+    bgt.add_task(_attach_qrcodes, student_ids)
+
+
+async def _attach_qrcodes(student_ids: List[int]):
+    """
+    Background task: generates the QR Codes of imported students on the worker
+    pool, then links them to the students. Students whose generation failed
+    are left without one, see `regenerate_missing_qrcodes`.
+    """
+    try:
+        paths = await generate_qrcodes(student_ids)
+        failed = [student_id for student_id in student_ids if student_id not in paths]
+        if failed:
+            logger.error(
+                "QR Code generation failed for %d students, retry with "
+                "POST /students/qrcodes/regenerate: %s",
+                len(failed),
+                failed,
+            )
+        if not paths:
+            return
+
+        async with async_session() as session:
+            codes = {student_id: QRCode(url=path) for student_id, path in paths.items()}
+            session.add_all(codes.values())
+            await session.flush()
+            await session.execute(
+                update(Student),
+                [
+                    {"id": student_id, "qrcode": qr.id}
+                    for student_id, qr in codes.items()
+                ],
+            )
+            await session.commit()
+    finally:
+        _qrcodes_pending.difference_update(student_ids)
+
+
+async def get_students_without_qrcode(session: AsyncSession) -> List[int]:
+    """
+    Returns the ids of the students without a QR Code, whose generation failed
+    or is still running.
+    """
+    res = await session.execute(
+        select(Student.id).where(Student.qrcode.is_(None)).order_by(Student.id)
+    )
+    return list(res.scalars().all())
+
+
+async def regenerate_missing_qrcodes(session: AsyncSession, bgt: BackgroundTasks):
+    """
+    Generates, in the background, the QR Codes of the students left without
+    one, except the ones already being generated.
+    """
+    ids = [
+        student_id
+        for student_id in await get_students_without_qrcode(session)
+        if student_id not in _qrcodes_pending
+    ]
+    if ids:
+        _schedule_qrcodes(bgt, ids)
+    return {"Success": "QR Code generation started.", "ids": ids}
+
+
+# auto_increment_increment when multi-row inserts get consecutive ids, 0 when
+# they may not, None until checked
+_autoinc_step: Optional[int] = None
+
+
+async def _consecutive_autoinc_step(session: AsyncSession) -> int:
+    """
+    Returns the step between the ids of a multi-row INSERT, or 0 when they may
+    not be consecutive, i.e. with `innodb_autoinc_lock_mode` set to 2
+    ("interleaved"), where concurrent inserts can take ids in between.
+    """
+    global _autoinc_step
+    if _autoinc_step is None:
+        res = await session.execute(
+            text("SELECT @@innodb_autoinc_lock_mode, @@auto_increment_increment")
+        )
+        lock_mode, increment = res.one()
+        _autoinc_step = int(increment) if int(lock_mode) < 2 else 0
+    return _autoinc_step
+
+
+async def _insert_student_chunk(chunk: List[Dict[str, Any]], session: AsyncSession):
+    """
+    Inserts a chunk of students and returns their ids.
+
+    The ids are taken from the INSERT itself. When the server hands consecutive
+    ids to a multi-row INSERT, the chunk goes in one statement and its ids are
+    the range starting at its `lastrowid`. Otherwise rows are inserted one by
+    one, each returning its own id.
+    """
+    students = Student.__table__
+    step = await _consecutive_autoinc_step(session)
+
+    if step:
+        res = await session.execute(insert(students).values(chunk))
+        ids = [res.lastrowid + i * step for i in range(res.rowcount)]
+    else:
+        ids = []
+        for row in chunk:
+            res = await session.execute(insert(students).values(row))
+            ids.append(res.lastrowid)
+
+    await record_changes(session, "student", ids, "insert")
+    await refresh_stats_counters(session)
+    await session.commit()
+    invalidate("students")
+    invalidate_stats()
+    return ids
+
+
+async def import_students(
+    file: UploadFile, session: AsyncSession, bgt: BackgroundTasks
+):
+    """
+    Imports students from a CSV or NDJSON file.
+
+    Rows are streamed and validated one by one with `StudentCreate`, then
+    inserted in chunks of `STUDENT_IMPORT_CHUNK_SIZE`. QR Code generation for
+    each inserted chunk is handed to the worker pool in the background.
+    """
+    chunk: List[Dict[str, Any]] = []
+    errors: List[Dict[str, Any]] = []
+    created = 0
+
+    async def flush():
+        nonlocal created
+        ids = await _insert_student_chunk(chunk, session)
+        created += len(ids)
+        _schedule_qrcodes(bgt, ids)
+        chunk.clear()
+
+    try:
+        for row_no, row in _read_student_rows(file):
+            if None in row:
+                errors.append({"row": row_no, "error": "Too many fields."})
+                continue
+            if row.get("") is not None:
+                errors.append({"row": row_no, "error": "A column has no name."})
+                continue
+            try:
+                student = StudentCreate.model_validate(row)
+            except ValidationError as exc:
+                errors.append({"row": row_no, "error": exc.errors()[0]["msg"]})
+                continue
+            except AppException as exc:
+                errors.append({"row": row_no, "error": exc.message})
+                continue
+
+            data = student.model_dump()
+            data["name"] = clean_spaces(data["name"]).title()
+            if data["email"]:
+                data["email"] = data["email"].lower()
+            chunk.append(data)
+
+            if len(chunk) >= EnvFile.STUDENT_IMPORT_CHUNK_SIZE:
+                await flush()
+    except (UnicodeDecodeError, csv.Error):
+        raise UnprocessableEntityException("The file could not be read.")
+
+    if chunk:
+        await flush()
+
+    return {"Success": "Students imported", "created": created, "errors": errors}
+
+
 async def get_all_students(
     session: AsyncSession,
     order_by: Optional[str] = "-id",
     name_search: Optional[str] = None,
+    since: Optional[str] = None,
+    as_rows: bool = False,
 ):
+    """
+    Returns all students, or with `since` only the ones changed after that
+    change feed token.
+
+    With `as_rows`, only the public columns are selected and returned as plain
+    dicts, ready for `FastJSONResponse`.
+    """
     order_columns = {
         "id": Student.id,
         "name": Student.name,
@@ -86,7 +323,21 @@ async def get_all_students(
 
     order_column = order_columns.get(col_key, Student.id)
 
-    stmt = select(Student)
+    if as_rows:
+        stmt = select(
+            Student.id,
+            Student.name,
+            Student.birth_date,
+            Student.tel1,
+            Student.tel2,
+            Student.email,
+        )
+    else:
+        stmt = select(Student)
+
+    if since:
+        await check_since(session, since)
+        stmt = stmt.where(Student.id.in_(changed_since("student", since)))
 
     if name_search:
         stmt = stmt.where(
@@ -99,6 +350,8 @@ async def get_all_students(
         stmt = stmt.order_by(order_column.asc())
 
     query = await session.execute(stmt)
+    if as_rows:
+        return [dict(row) for row in query.mappings()]
     results = query.scalars().all()
     return results
 
@@ -117,45 +370,66 @@ async def get_student_by_id(student_id: int, session: AsyncSession):
 async def delete_student(student_id: int, session: AsyncSession):
     """
     Deletes a student and his QRCode by his ID.
+    The student and the paths of his files are read with a single query.
     """
-    student = await session.get(Student, student_id)
+    stmt = (
+        select(
+            Student.image,
+            Student.qrcode,
+            Image.url.label("image_path"),
+            QRCode.url.label("qrcode_path"),
+        )
+        .outerjoin(Image, Student.image == Image.id)
+        .outerjoin(QRCode, Student.qrcode == QRCode.id)
+        .where(Student.id == student_id)
+    )
+    res = await session.execute(stmt)
+    student = res.mappings().first()
     if not student:
         raise NotFoundException("This student was not found.")
 
-    img_id = student.image
-    qr_id = student.qrcode
-
-    await session.delete(student)
-
-    if not qr_id:
-        raise NotFoundException("QR Code was not found in DB.")
+    img_id = student["image"]
+    qr_id = student["qrcode"]
 
-    qr = await session.get(QRCode, qr_id)
-    try:
-        if os.path.exists(qr.url):
-            os.remove(qr.url)
-        else:
+    # Students whose QR Code generation failed or is pending have none
+    if qr_id:
+        try:
+            if os.path.exists(student["qrcode_path"]):
+                os.remove(student["qrcode_path"])
+            else:
+                raise QRCodeDeletionError()
+        except:
             raise QRCodeDeletionError()
-    except:
-        raise QRCodeDeletionError()
-
-    stmt_del_qr = delete(QRCode).where(QRCode.id == qr_id)
-    await session.execute(stmt_del_qr)
 
     if img_id:
-        img = await session.get(Image, img_id)
         try:
-            if os.path.exists(img.url):
-                os.remove(img.url)
+            if os.path.exists(student["image_path"]):
+                os.remove(student["image_path"])
             else:
                 raise StudentImageDeleteError()
         except:
             raise StudentImageDeleteError()
 
+    # Payments and attendances are deleted along with the student
+    await remove_student_figures(session, student_id)
+    await session.execute(delete(Student).where(Student.id == student_id))
+
+    if qr_id:
+        stmt_del_qr = delete(QRCode).where(QRCode.id == qr_id)
+        await session.execute(stmt_del_qr)
+
+    if img_id:
         stmt_del_img = delete(Image).where(Image.id == img_id)
         await session.execute(stmt_del_img)
 
+    record_change(session, "payment", student_id, "delete")
+    record_change(session, "enrollment", student_id, "delete")
+    record_change(session, "student", student_id, "delete")
+    await refresh_stats_counters(session)
     await session.commit()
+    invalidate("formations", "students")
+    invalidate_teacher_activity()
+    invalidate_stats()
     return {"Success": "Student deleted"}
 
 
@@ -177,19 +451,27 @@ async def update_student(student_id: int, data: StudentCreate, session: AsyncSes
         setattr(student, key, value)
 
     session.add(student)
+    record_change(session, "student", student.id, "update")
     await session.commit()
+    invalidate("students")
 
     return {"Success": "Student updated."}
 
 
-async def get_qr_code(student_id: int, session: AsyncSession):
+async def get_qr_code(
+    student_id: int, session: AsyncSession, if_none_match: Optional[str] = None
+):
     """
     Retrieves the QR Code of a student and returns it.
+    Answers 304 when `if_none_match` holds the code's current ETag.
     """
     student = await session.get(Student, student_id)
     if not student:
         raise NotFoundException("This student was not found.")
 
+    if student.qrcode is None:
+        raise NotFoundException("This student has no QR Code yet.")
+
     qrcode = await session.get(QRCode, student.qrcode)
     if not qrcode:
         raise NotFoundException("This student was not found.")
@@ -197,49 +479,144 @@ async def get_qr_code(student_id: int, session: AsyncSession):
     if not os.path.exists(qrcode.url):
         raise NotFoundException("QR Code image was not found.")
 
-    return FileResponse(
-        status_code=status.HTTP_200_OK,
-        media_type="image/webp",
-        path=qrcode.url,
-    )
+    return cached_file_response(qrcode.url, "image/webp", if_none_match)
 
 
-async def enroll(student_id, formation_id, session: AsyncSession):
-    st = await session.get(Student, student_id)
-    if not st:
+async def _check_enrollment_pair(student_id, formation_id, session: AsyncSession):
+    """
+    Raises `NotFoundException` if the student or the formation does not exist,
+    checking both with one query.
+    """
+    res = await session.execute(
+        select(
+            exists().where(Student.id == student_id),
+            exists().where(Formation.id == formation_id),
+        )
+    )
+    student_exists, formation_exists = res.one()
+    if not student_exists:
         raise NotFoundException("This student was not found.")
-
-    f = await session.get(Formation, formation_id)
-    if not f:
+    if not formation_exists:
         raise NotFoundException("This formation was not found.")
 
-    enr = await session.get(Enrollment, (student_id, formation_id))
-    if enr:
+
+async def enroll(student_id, formation_id, session: AsyncSession):
+    """
+    Enrolls a student in a formation with a single `INSERT ... SELECT`, which
+    inserts nothing if either is missing or the enrollment already exists.
+    Only then is the cause looked up.
+    """
+    stmt = (
+        insert(Enrollment)
+        .prefix_with("IGNORE")
+        .from_select(
+            ["student_id", "formation_id"],
+            select(Student.id, literal(formation_id)).where(
+                Student.id == student_id,
+                exists().where(Formation.id == formation_id),
+            ),
+        )
+    )
+    res = await session.execute(stmt)
+    if res.rowcount == 0:
+        await _check_enrollment_pair(student_id, formation_id, session)
         raise AlreadyExists("This enrollment was already created.")
 
-    enrollment: Enrollment = Enrollment()
-    enrollment.student_id = student_id
-    enrollment.formation_id = formation_id
-    session.add(enrollment)
+    record_change(session, "enrollment", student_id, "update")
+    await refresh_stats_counters(session)
     await session.commit()
+    invalidate("formations")
+    invalidate_teacher_activity()
+    invalidate_stats()
     return {"Success": "Enrollment created"}
 
 
+async def enroll_bulk(data: BulkEnrollmentModel, session: AsyncSession):
+    """
+    Enrolls many (student, formation) pairs at once.
+
+    Students and formations are checked with one set query each and the valid
+    pairs are inserted in a single statement; pairs that are already enrolled
+    are ignored.
+    """
+    pairs = list(dict.fromkeys(data.to_pairs()))
+    if not pairs:
+        return {"Success": "Enrollments created", "created": 0, "errors": []}
+
+    res = await session.execute(
+        select(Student.id).where(Student.id.in_({s for s, _ in pairs}))
+    )
+    students = set(res.scalars().all())
+    res = await session.execute(
+        select(Formation.id).where(Formation.id.in_({f for _, f in pairs}))
+    )
+    formations = set(res.scalars().all())
+
+    rows = []
+    errors = []
+    for student_id, formation_id in pairs:
+        if student_id not in students:
+            errors.append(
+                {
+                    "student_id": student_id,
+                    "formation_id": formation_id,
+                    "error": "This student was not found.",
+                }
+            )
+        elif formation_id not in formations:
+            errors.append(
+                {
+                    "student_id": student_id,
+                    "formation_id": formation_id,
+                    "error": "This formation was not found.",
+                }
+            )
+        else:
+            rows.append({"student_id": student_id, "formation_id": formation_id})
+
+    created = 0
+    if rows:
+        result = await session.execute(
+            insert(Enrollment).prefix_with("IGNORE").values(rows)
+        )
+        created = result.rowcount
+        await record_changes(
+            session, "enrollment", {row["student_id"] for row in rows}, "update"
+        )
+        await refresh_stats_counters(session)
+        await session.commit()
+        invalidate("formations")
+        invalidate_teacher_activity()
+        invalidate_stats()
+
+    return {
+        "Success": "Enrollments created",
+        "created": created,
+        "already_enrolled": len(rows) - created,
+        "errors": errors,
+    }
+
+
 async def remove_enrollment_from_student(
     student_id, formation_id, session: AsyncSession
 ):
-    st = await session.get(Student, student_id)
-    if not st:
-        raise NotFoundException("This student was not found.")
-
-    f = await session.get(Formation, formation_id)
-    if not f:
-        raise NotFoundException("This formation was not found.")
-
-    enr = await session.get(Enrollment, (student_id, formation_id))
-    if not enr:
+    """
+    Deletes an enrollment, looking up why only when there was none to delete.
+    """
+    res = await session.execute(
+        delete(Enrollment).where(
+            Enrollment.student_id == student_id,
+            Enrollment.formation_id == formation_id,
+        )
+    )
+    if res.rowcount == 0:
+        await _check_enrollment_pair(student_id, formation_id, session)
         raise AlreadyExists("This enrollment was not found.")
 
-    await session.delete(enr)
+    record_change(session, "enrollment", student_id, "update")
+    await refresh_stats_counters(session)
     await session.commit()
+    invalidate("formations")
+    invalidate_teacher_activity()
+    invalidate_stats()
     return {"Success": "Enrollment deleted"}
@@ -1,11 +1,35 @@
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlmodel import select
+from datetime import date
 
-from api.v1.exceptions import AlreadyExists, NotFoundException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select, extract
+
+from api.v1.cache import AsyncCache, cached, invalidate
+from api.v1.exceptions import (
+    AlreadyExists,
+    NotFoundException,
+    UnprocessableEntityException,
+)
+from api.v1.models.enrollment import Enrollment
 from api.v1.models.formation import Formation
+from api.v1.models.formation_type import FormationType
 from api.v1.models.sessions import Session, SessionModel
 from api.v1.models.teacher import TeacherModel, Teacher
-from api.v1.utils import clean_spaces, remove_spaces
+from api.v1.services.change_service import (
+    record_change,
+    record_changes,
+    record_changes_from,
+    changed_since,
+    check_since,
+)
+from api.v1.utils import clean_spaces, remove_spaces, decode_cursor
+from envconfig import EnvFile
+
+activity_cache = AsyncCache("teacher_activity", EnvFile.TEACHER_ACTIVITY_CACHE_TTL)
+
+
+def invalidate_teacher_activity():
+    """Drops the cached teacher activity, called by the write paths after a commit."""
+    invalidate("teacher_activity")
 
 
 async def add_teacher(teacher_model: TeacherModel, session: AsyncSession):
@@ -26,7 +50,11 @@ async def add_teacher(teacher_model: TeacherModel, session: AsyncSession):
         teacher.email = teacher.email.lower()
 
     session.add(teacher)
+    await session.flush()
+    record_change(session, "teacher", teacher.id, "insert")
     await session.commit()
+    invalidate("teachers")
+    invalidate_teacher_activity()
     return {"id": teacher.id}
 
 
@@ -36,15 +64,30 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 
 async def get_teachers(
-    session: AsyncSession, search: Optional[str] = None, order_by: Optional[str] = "-id"
+    session: AsyncSession,
+    search: Optional[str] = None,
+    order_by: Optional[str] = "-id",
+    since: Optional[str] = None,
+    as_rows: bool = False,
 ):
+    """
+    Returns all teachers, or with `since` only the ones changed after that
+    change feed token. With `as_rows`, rows are returned as plain dicts.
+    """
     order_columns = {
         "id": Teacher.id,
         "name": Teacher.name,
         "cin": Teacher.cin,
     }
 
-    stmt = select(Teacher)
+    if as_rows:
+        stmt = select(*Teacher.__table__.columns)
+    else:
+        stmt = select(Teacher)
+
+    if since:
+        await check_since(session, since)
+        stmt = stmt.where(Teacher.id.in_(changed_since("teacher", since)))
 
     if search:
         cleaned_search = remove_spaces(search)
@@ -73,6 +116,8 @@ async def get_teachers(
         stmt = stmt.order_by(order_column.asc())
 
     query = await session.execute(stmt)
+    if as_rows:
+        return [dict(row) for row in query.mappings()]
     results = query.scalars().all()
     return results
 
@@ -89,9 +134,13 @@ async def delete_teacher(teacher_id: int, session: AsyncSession):
             for f in res:
                 f.teacher_id = None
         session.add_all(res)
+        await record_changes(session, "formation", [f.id for f in res], "update")
         await session.commit()
         await session.delete(teacher)
+        record_change(session, "teacher", teacher_id, "delete")
         await session.commit()
+        invalidate("formations", "teachers")
+        invalidate_teacher_activity()
         return {"Teacher deleted."}
 
 
@@ -113,7 +162,17 @@ async def update_teacher(teacher_id: int, data: TeacherModel, session: AsyncSess
         setattr(teacher, key, value)
 
     session.add(teacher)
+    record_change(session, "teacher", teacher.id, "update")
+    # Formation listings show the teacher's name
+    await record_changes_from(
+        session,
+        "formation",
+        select(Formation.id).where(Formation.teacher_id == teacher_id),
+        "update",
+    )
     await session.commit()
+    invalidate("formations", "teachers")
+    invalidate_teacher_activity()
 
     return {"Success": "Teacher updated."}
 
@@ -126,22 +185,68 @@ async def get_teacher_by_id(teacher_id: int, session: AsyncSession):
         return teacher
 
 
-async def get_sessions(id: int, session: AsyncSession):
+async def get_sessions(
+    id: int,
+    session: AsyncSession,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+):
     teacher = await session.get(Teacher, id)
     if not teacher:
         raise NotFoundException("Teacher not found.")
 
-    stmt = (
-        select(Session.session_date)
-        .where(Session.teacher_id == id)
-        .order_by(Session.session_date.desc())
-    )
+    stmt = select(Session.session_date).where(Session.teacher_id == id)
+    if date_from:
+        stmt = stmt.where(Session.session_date >= date_from)
+    if date_to:
+        stmt = stmt.where(Session.session_date <= date_to)
+    if cursor:
+        (last_date,) = decode_cursor(cursor, 1)
+        try:
+            last_date = date.fromisoformat(last_date)
+        except ValueError:
+            raise UnprocessableEntityException("Invalid cursor.")
+        stmt = stmt.where(Session.session_date < last_date)
+    stmt = stmt.order_by(Session.session_date.desc())
+    if limit:
+        stmt = stmt.limit(limit)
+
     query = await session.execute(stmt)
     res = query.scalars().all()
 
     return res
 
 
+async def get_sessions_summary(
+    id: int,
+    session: AsyncSession,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+):
+    """
+    Returns a teacher's number of sessions per month, newest first.
+    """
+    teacher = await session.get(Teacher, id)
+    if not teacher:
+        raise NotFoundException("Teacher not found.")
+
+    year = extract("year", Session.session_date)
+    month = extract("month", Session.session_date)
+    stmt = select(
+        year.label("year"), month.label("month"), func.count().label("sessions")
+    ).where(Session.teacher_id == id)
+    if date_from:
+        stmt = stmt.where(Session.session_date >= date_from)
+    if date_to:
+        stmt = stmt.where(Session.session_date <= date_to)
+    stmt = stmt.group_by(year, month).order_by(year.desc(), month.desc())
+
+    query = await session.execute(stmt)
+    return [dict(r) for r in query.mappings().all()]
+
+
 async def add_session(session_model: SessionModel, session: AsyncSession):
     teacher = await session.get(Teacher, session_model.teacher_id)
     if not teacher:
@@ -158,6 +263,8 @@ async def add_session(session_model: SessionModel, session: AsyncSession):
 
     session.add(entry)
     await session.commit()
+    invalidate("formations")
+    invalidate_teacher_activity()
 
     return {"Success": "Session added."}
 
@@ -174,5 +281,101 @@ async def remove_session(session_model: SessionModel, session: AsyncSession):
 
     await session.delete(sess)
     await session.commit()
+    invalidate("formations")
+    invalidate_teacher_activity()
 
     return {"Success": "Session removed."}
+
+
+async def _compute_teacher_activity(
+    session: AsyncSession, date_from: Optional[date], date_to: Optional[date]
+):
+    year = extract("year", Session.session_date)
+    month = extract("month", Session.session_date)
+    counts = select(
+        Session.teacher_id,
+        year.label("year"),
+        month.label("month"),
+        func.count().label("sessions"),
+    )
+    if date_from:
+        counts = counts.where(Session.session_date >= date_from)
+    if date_to:
+        counts = counts.where(Session.session_date <= date_to)
+    counts = counts.group_by(Session.teacher_id, year, month).subquery("counts")
+
+    stmt = (
+        select(
+            Teacher.id,
+            Teacher.name,
+            counts.c.year,
+            counts.c.month,
+            counts.c.sessions,
+        )
+        .outerjoin(counts, counts.c.teacher_id == Teacher.id)
+        .order_by(Teacher.id, counts.c.year, counts.c.month)
+    )
+    query = await session.execute(stmt)
+
+    teachers = {}
+    for teacher_id, name, y, m, sessions in query:
+        entry = teachers.setdefault(
+            teacher_id,
+            {
+                "teacher_id": teacher_id,
+                "name": name,
+                "total_sessions": 0,
+                "sessions_by_month": [],
+                "formations": [],
+            },
+        )
+        if sessions:
+            entry["total_sessions"] += sessions
+            entry["sessions_by_month"].append(
+                {"year": int(y), "month": int(m), "sessions": sessions}
+            )
+
+    headcounts = (
+        select(
+            Formation.teacher_id,
+            Formation.id,
+            FormationType.label,
+            Formation.start_date,
+            func.count(Enrollment.student_id).label("enrolled"),
+        )
+        .join(FormationType, Formation.formation_type == FormationType.id)
+        .outerjoin(Enrollment, Enrollment.formation_id == Formation.id)
+        .where(Formation.teacher_id.is_not(None))
+        .group_by(
+            Formation.teacher_id,
+            Formation.id,
+            FormationType.label,
+            Formation.start_date,
+        )
+    )
+    query = await session.execute(headcounts)
+    for teacher_id, formation_id, label, start_date, enrolled in query:
+        if teacher_id in teachers:
+            teachers[teacher_id]["formations"].append(
+                {
+                    "formation_id": formation_id,
+                    "label": label,
+                    "start_date": start_date,
+                    "enrolled": enrolled,
+                }
+            )
+
+    return list(teachers.values())
+
+
+@cached(activity_cache, tags=("teacher_activity",))
+async def get_teacher_activity(
+    session: AsyncSession,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+):
+    """
+    Returns, for every teacher, the number of sessions per month in the date
+    range and the assigned formations with their enrolled headcount.
+    """
+    return await _compute_teacher_activity(session, date_from, date_to)
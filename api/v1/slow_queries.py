@@ -0,0 +1,174 @@
+"""
+Slow-query log module.
+
+Records the statements of an engine that take longer than
+`SLOW_QUERY_THRESHOLD` seconds. Entries are deduplicated by SQL fingerprint
+and keep the shapes of their bound parameters, never their values. Up to
+`SLOW_QUERY_LOG_SIZE` fingerprints are kept, the one with the lowest total time
+being dropped first.
+
+The first time a SELECT is recorded, its `EXPLAIN FORMAT=JSON` plan is
+captured in a background task, on a connection of its own. A failed EXPLAIN is
+retried on the next occurrences, up to `MAX_EXPLAIN_ATTEMPTS` times.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from api.v1.query_budget import fingerprint
+from envconfig import EnvFile
+
+logger = logging.getLogger(__name__)
+
+MAX_EXPLAIN_ATTEMPTS = 3
+
+_entries: Dict[str, "SlowQuery"] = {}
+_background: Set[asyncio.Task] = set()
+# Set while running an EXPLAIN, so that it is not recorded itself
+_explaining: ContextVar[bool] = ContextVar("explaining", default=False)
+_engine: Optional[AsyncEngine] = None
+_explain_slots = asyncio.Semaphore(1)
+
+
+def parameter_shapes(parameters, many: bool) -> Any:
+    """Describes bound parameters by type, e.g. `["int", "str(12)", "None"]`."""
+    if many:
+        rows = list(parameters or ())
+        return (
+            {"executemany": len(rows), "row": parameter_shapes(rows[0], False)}
+            if rows
+            else []
+        )
+    if isinstance(parameters, dict):
+        return {k: parameter_shapes((v,), False)[0] for k, v in parameters.items()}
+    shapes = []
+    for value in parameters or ():
+        if value is None:
+            shapes.append("None")
+        elif isinstance(value, (str, bytes)):
+            shapes.append(f"{type(value).__name__}({len(value)})")
+        else:
+            shapes.append(type(value).__name__)
+    return shapes
+
+
+class SlowQuery:
+    """A statement shape that ran slower than the threshold."""
+
+    def __init__(self, shape: str, statement: str, parameters: Any):
+        self.fingerprint = shape
+        self.statement = statement
+        self.parameters = parameters
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_seen: Optional[float] = None
+        self.plan: Any = None
+        self.explain_attempts = 0
+        self.explain_failed = False
+
+    def add(self, elapsed: float):
+        self.count += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.last_seen = time.time()
+
+    def needs_plan(self) -> bool:
+        return self.explain_attempts == 0 or (
+            self.explain_failed and self.explain_attempts < MAX_EXPLAIN_ATTEMPTS
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "fingerprint": self.fingerprint,
+            "statement": self.statement,
+            "parameters": self.parameters,
+            "count": self.count,
+            "total_time": round(self.total_time, 4),
+            "max_time": round(self.max_time, 4),
+            "mean_time": round(self.total_time / self.count, 4),
+            "last_seen": self.last_seen,
+            "plan": self.plan,
+        }
+
+
+def _record(statement: str, parameters, many: bool, elapsed: float):
+    shape = fingerprint(statement)
+    entry = _entries.get(shape)
+    if entry is None:
+        if len(_entries) >= EnvFile.SLOW_QUERY_LOG_SIZE:
+            least = min(_entries.values(), key=lambda e: e.total_time)
+            del _entries[least.fingerprint]
+        entry = SlowQuery(shape, statement, parameter_shapes(parameters, many))
+        _entries[shape] = entry
+        logger.warning("Slow query (%.3f s): %s", elapsed, shape)
+    entry.add(elapsed)
+    if entry.needs_plan() and shape.upper().startswith("SELECT") and not many:
+        _explain_later(entry, statement, parameters)
+
+
+def _explain_later(entry: SlowQuery, statement: str, parameters):
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    entry.explain_attempts += 1
+    entry.explain_failed = False
+    entry.plan = "pending"
+    task = loop.create_task(_explain(entry, statement, parameters))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def _explain(entry: SlowQuery, statement: str, parameters):
+    token = _explaining.set(True)
+    try:
+        async with _explain_slots:
+            async with _engine.connect() as conn:
+                res = await conn.exec_driver_sql(
+                    f"EXPLAIN FORMAT=JSON {statement}", parameters
+                )
+                entry.plan = json.loads(res.scalar())
+    except Exception as e:
+        entry.explain_failed = True
+        entry.plan = f"EXPLAIN failed: {e}"
+    finally:
+        _explaining.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    conn.info["slow_query_start"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    start = conn.info.pop("slow_query_start", None)
+    if start is None or _explaining.get():
+        return
+    elapsed = time.perf_counter() - start
+    if elapsed >= EnvFile.SLOW_QUERY_THRESHOLD:
+        _record(statement, parameters, many, elapsed)
+
+
+def watch_slow_queries(engine: AsyncEngine):
+    """Records the slow statements of `engine`."""
+    global _engine
+    _engine = engine
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def get_slow_queries() -> List[Dict[str, Any]]:
+    """Returns the recorded statements, the most time consuming first."""
+    entries = sorted(_entries.values(), key=lambda e: e.total_time, reverse=True)
+    return [entry.to_dict() for entry in entries]
+
+
+def clear_slow_queries():
+    _entries.clear()
@@ -2,17 +2,28 @@
 Module for common helper functions used across the application.
 """
 
+import base64
+import hashlib
+import hmac
 import io
 import os
 import time
 from datetime import date
+from typing import List, Optional
 
 from PIL import Image
 from PIL import Image as PILImage
-from fastapi import HTTPException, UploadFile
+from fastapi import Header, HTTPException, Request, UploadFile
 from starlette import status
+from starlette.responses import FileResponse, Response
 
-from api.v1.exceptions import StudentImageSaveError
+from api.v1.cache import tag_version
+from api.v1.exceptions import (
+    FeatureNotAvailable,
+    ForbiddenException,
+    StudentImageSaveError,
+    UnprocessableEntityException,
+)
 from envconfig import EnvFile
 
 
@@ -138,6 +149,110 @@ def valid_year(year: int) -> bool:
     today = date.today()
     if not isinstance(year, int):
         return False
-    if year > today.year + 1:
+    # Dates start at year 1
+    if year < 1 or year > today.year + 1:
         return False
     return True
+
+
+def file_etag(path: str) -> Optional[str]:
+    """
+    Returns the ETag `FileResponse` sends for the file at `path`, or None if the
+    file does not exist.
+    """
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
+    etag_base = str(stat_result.st_mtime) + "-" + str(stat_result.st_size)
+    return f'"{hashlib.md5(etag_base.encode(), usedforsecurity=False).hexdigest()}"'
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return etag.removeprefix("W/") in tags
+
+
+def cached_file_response(
+    path: str, media_type: str, if_none_match: Optional[str] = None
+) -> Response:
+    """
+    Serves a file, or an empty 304 response when the client already holds the
+    current version of it.
+    """
+    etag = file_etag(path)
+    headers = {"Cache-Control": "private, no-cache"}
+    if etag and etag_matches(etag, if_none_match):
+        headers["ETag"] = etag
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return FileResponse(
+        status_code=status.HTTP_200_OK,
+        media_type=media_type,
+        path=path,
+        headers=headers,
+    )
+
+
+def collection_not_modified(
+    tag: str, request: Request, response: Response, extra: str = ""
+) -> Optional[Response]:
+    """
+    Sets the ETag of a list endpoint on `response`, built from the version of the
+    collection's cache tag, the query parameters and `extra`, for listings that
+    also change without writes, e.g. with the date. Returns a 304 response when
+    the client's `If-None-Match` already holds it, before any query is run.
+    """
+    params = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    params += f"#{extra}"
+    digest = hashlib.md5(params.encode(), usedforsecurity=False).hexdigest()[:16]
+    etag = f'W/"{tag_version(tag)}-{digest}"'
+
+    if etag_matches(etag, request.headers.get("if-none-match")):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+    response.headers["ETag"] = etag
+    return None
+
+
+def encode_cursor(*values) -> str:
+    """
+    Encodes the sort key of the last returned row into an opaque pagination cursor.
+    """
+    raw = "|".join(v.isoformat() if isinstance(v, date) else str(v) for v in values)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, size: int) -> List[str]:
+    """
+    Decodes a pagination cursor back into its `size` sort key values.
+    """
+    try:
+        values = base64.urlsafe_b64decode(cursor.encode("ascii")).decode().split("|")
+    except (ValueError, UnicodeError):
+        raise UnprocessableEntityException("Invalid cursor.")
+    if len(values) != size:
+        raise UnprocessableEntityException("Invalid cursor.")
+    return values
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    if not EnvFile.ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), EnvFile.ADMIN_TOKEN.encode())
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """
+    Dependency guarding the admin routes: the `X-Admin-Token` header must hold
+    `ADMIN_TOKEN`. Admin routes are disabled while it is not set.
+    """
+    if not EnvFile.ADMIN_TOKEN:
+        raise FeatureNotAvailable("Admin endpoints are disabled.")
+    if not is_admin_token(x_admin_token):
+        raise ForbiddenException("Invalid admin token.")
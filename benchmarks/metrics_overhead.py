@@ -0,0 +1,134 @@
+"""
+Request metrics overhead benchmark.
+
+Serves the same request through two copies of a small application:
+
+- bare: no middleware, no cursor event listeners;
+- metrics: `MetricsMiddleware` sampling `--sample-rate` of the requests (the
+  `METRICS_SAMPLE_RATE` default), and an engine instrumented by
+  `instrument_engine`.
+
+The endpoint returns a list of rows and fires the cursor events of a few
+statements on the engine, as a handler running queries would. The database
+itself is left out, it would only add the same time to both sides, so the
+overhead is also given as a share of typical request durations.
+
+Run it from the repository root, with a configured `.env`:
+
+    python -m benchmarks.metrics_overhead --requests 20000 --queries 3
+
+The garbage collector is paused while timing, and the fastest round of each
+side is kept, as the difference is small next to the machine's noise.
+"""
+
+import argparse
+import asyncio
+import gc
+import time
+
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from api.v1.metrics import instrument_engine
+from api.v1.middleware.metrics import MetricsMiddleware
+from api.v1.responses import FastJSONResponse
+
+ROWS = [{"id": i, "name": f"Student Number {i}", "tel1": "20000000"} for i in range(50)]
+
+
+def make_app(queries: int, instrumented: bool, sample_rate: float = 0.1) -> FastAPI:
+    engine = create_async_engine("mysql+asyncmy://bench@localhost/bench")
+    if instrumented:
+        instrument_engine(engine)
+    dispatch = engine.sync_engine.dispatch
+    info = {}
+
+    class Conn:
+        pass
+
+    conn = Conn()
+    conn.info = info
+
+    app = FastAPI()
+
+    @app.get("/students/{student_id}")
+    async def endpoint(student_id: int):
+        for _ in range(queries):
+            dispatch.before_cursor_execute(conn, None, "SELECT 1", (), None, False)
+            dispatch.after_cursor_execute(conn, None, "SELECT 1", (), None, False)
+        return FastJSONResponse(ROWS)
+
+    if instrumented:
+        app.add_middleware(MetricsMiddleware, sample_rate=sample_rate)
+    return app
+
+
+async def call(app, path: str):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "client": ("127.0.0.1", 1),
+        "server": ("127.0.0.1", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+
+async def timed(label: str, app, requests: int) -> float:
+    for i in range(200):  # warm-up
+        await call(app, f"/students/{i}")
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for i in range(requests):
+            await call(app, f"/students/{i}")
+        per_call = (time.perf_counter() - start) / requests * 1e6
+    finally:
+        gc.enable()
+    print(f"{label:>8}: {per_call:8.1f} us per request")
+    return per_call
+
+
+async def main(requests: int, queries: int, rounds: int, sample_rate: float):
+    bare_app = make_app(queries, instrumented=False)
+    metrics_app = make_app(queries, instrumented=True, sample_rate=sample_rate)
+
+    print(
+        f"{requests} requests x {rounds} rounds, {queries} statements each, "
+        f"sample rate {sample_rate}"
+    )
+    bare, metrics = [], []
+    # Rounds alternate, so that both sides see the same machine load
+    for _ in range(rounds):
+        bare.append(await timed("bare", bare_app, requests))
+        metrics.append(await timed("metrics", metrics_app, requests))
+    overhead = min(metrics) - min(bare)
+    print(f"overhead: {overhead:.1f} us per request")
+    for request_ms in (1, 5, 20):
+        share = overhead / (request_ms * 1000) * 100
+        print(f"  {share:5.2f}% of a {request_ms} ms request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--sample-rate", type=float, default=0.1)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.queries, args.rounds, args.sample_rate))
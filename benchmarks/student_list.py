@@ -0,0 +1,82 @@
+"""
+Student list serialization benchmark.
+
+Compares the two ways `GET /students/` can turn `get_all_students` results
+into a response body:
+
+- model: `Student` objects validated against `List[StudentRead]` by FastAPI's
+  `serialize_response`, then rendered by `JSONResponse`;
+- fast: plain row dicts rendered by `FastJSONResponse`.
+
+The database is left out, both paths start from rows already in memory.
+
+Run it from the repository root, with a configured `.env`:
+
+    python -m benchmarks.student_list --rows 5000 --repeat 20
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import date, timedelta
+from typing import List
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from starlette.responses import JSONResponse
+
+from api.v1.models.student import Student, StudentRead
+from api.v1.responses import FastJSONResponse, orjson
+
+
+def make_rows(count: int) -> List[dict]:
+    first = date(2010, 1, 1)
+    return [
+        {
+            "id": i,
+            "name": f"Student Number {i}",
+            "birth_date": first + timedelta(days=i % 3000),
+            "tel1": f"{20000000 + i}",
+            "tel2": None,
+            "email": f"student{i}@example.com",
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+async def model_path(students: List[Student], field) -> bytes:
+    content = await serialize_response(field=field, response_content=students)
+    return JSONResponse(content).body
+
+
+async def fast_path(rows: List[dict]) -> bytes:
+    return FastJSONResponse(rows).body
+
+
+async def timed(label: str, repeat: int, fn, *args) -> float:
+    await fn(*args)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        body = await fn(*args)
+    per_call = (time.perf_counter() - start) / repeat * 1000
+    print(f"{label:>6}: {per_call:8.2f} ms per response, {len(body)} bytes")
+    return per_call
+
+
+async def main(count: int, repeat: int):
+    rows = make_rows(count)
+    students = [Student(**row) for row in rows]
+    field = create_model_field(name="Response", type_=List[StudentRead])
+
+    print(f"{count} students, {repeat} runs, orjson {'on' if orjson else 'off'}")
+    model = await timed("model", repeat, model_path, students, field)
+    fast = await timed("fast", repeat, fast_path, rows)
+    print(f"speed-up: {model / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
@@ -8,19 +8,25 @@ tables are created in the database if they do not exist. .
 from sqlmodel import SQLModel
 
 from api.v1.models.attendance import Attendance
+from api.v1.models.change_log import ChangeLog
 from api.v1.models.cvfile import CVFile
+from api.v1.models.dashboard_stats import DayStats, MonthStats, StatsCounter
 from api.v1.models.enrollment import Enrollment
 from api.v1.models.formation import Formation
 from api.v1.models.formation_type import FormationType
 from api.v1.models.image import Image
+from api.v1.models.kiosk import KioskCursor
 from api.v1.models.payment import Payment
 
 # Import models to ensure they are registered with SQLModel.metadata
 from api.v1.models.qrcode import QRCode
 from api.v1.models.sessions import Session
 from api.v1.models.student import Student
+from api.v1.models.student_month_stats import StudentMonthStats
 from api.v1.models.teacher import Teacher
+from api.v1.services.rollup_service import backfill_month_stats
 from .engine import creator_engine
+from .session import async_session
 
 # To keep formatters from removing their imports
 _models = (
@@ -35,6 +41,12 @@ _models = (
     FormationType,
     Enrollment,
     Session,
+    KioskCursor,
+    StudentMonthStats,
+    ChangeLog,
+    MonthStats,
+    DayStats,
+    StatsCounter,
 )
 
 
@@ -42,7 +54,13 @@ async def init_db():
     """
     Initialize the database using the dedicated engine for table definition.
     After creation, the engine is disposed of to clean up resources.
+
+    The `student_month_stats` rollup is then backfilled from the attendances
+    if it is still empty.
     """
     async with creator_engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
     await creator_engine.dispose()
+
+    async with async_session() as session:
+        await backfill_month_stats(session)
@@ -8,11 +8,17 @@ for schema management, responsible for creating non-existing tables on app start
 - `user_engine`: Connects using a user restricted to data operations (SELECT,
 INSERT, UPDATE, DELETE).
 
-Configuration is loaded via `EnvFile`.
+Configuration is loaded via `EnvFile`. When metrics are enabled, `user_engine`
+times its pool checkouts and its statements for the request metrics, and in
+development or CI its statements are checked against the query budgets. Its
+slow statements can also be logged.
 """
 
 from sqlalchemy.ext.asyncio import create_async_engine
 
+from api.v1.metrics import TimedQueuePool, instrument_engine
+from api.v1.query_budget import watch_engine
+from api.v1.slow_queries import watch_slow_queries
 from envconfig import EnvFile
 
 # Database URLs
@@ -27,4 +33,14 @@ DB_URL_CREATOR = (
 
 # Engine Creation
 creator_engine = create_async_engine(DB_URL_CREATOR, echo=False)
-user_engine = create_async_engine(DB_URL_USER, echo=False)
+if EnvFile.METRICS_ENABLED:
+    user_engine = create_async_engine(DB_URL_USER, echo=False, poolclass=TimedQueuePool)
+    instrument_engine(user_engine)
+else:
+    user_engine = create_async_engine(DB_URL_USER, echo=False)
+
+if EnvFile.QUERY_DETECTOR_ENABLED:
+    watch_engine(user_engine)
+
+if EnvFile.SLOW_QUERY_LOG_ENABLED:
+    watch_slow_queries(user_engine)
@@ -25,6 +25,49 @@ class EnvFile(BaseSettings):
 
     ENCRYPTION_KEY: str
 
+    KIOSK_INGEST_BATCH_SIZE: int = 1000
+    STUDENT_IMPORT_CHUNK_SIZE: int = 500
+    QR_WORKERS: int = 0
+    EXPORT_PARTITION_SIZE: int = 5000
+
+    STATS_CACHE_TTL: float = 60
+    STATS_RECONCILE_INTERVAL: float = 900
+    TEACHER_ACTIVITY_CACHE_TTL: float = 300
+    FORMATIONS_CACHE_TTL: float = 300
+    CACHE_MAX_ENTRIES: int = 1024
+
+    BATCH_MAX_CONNECTIONS: int = 4
+
+    EVENT_BROKER_URL: str = ""
+    EVENT_QUEUE_SIZE: int = 100
+    SSE_HEARTBEAT_INTERVAL: float = 15
+    CHANGE_GAP_TIMEOUT: float = 30
+    CHANGE_RETENTION_DAYS: int = 30
+    CHANGE_PRUNE_INTERVAL: float = 3600
+
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_THREAD_THRESHOLD: int = 1000000
+
+    METRICS_ENABLED: bool = False
+    METRICS_SAMPLE_RATE: float = 0.1
+
+    QUERY_DETECTOR_ENABLED: bool = False
+
+    SLOW_QUERY_LOG_ENABLED: bool = False
+    SLOW_QUERY_THRESHOLD: float = 0.5
+    SLOW_QUERY_LOG_SIZE: int = 50
+
+    LOOP_MONITOR_ENABLED: bool = False
+    LOOP_LAG_THRESHOLD: float = 0.1
+    LOOP_MONITOR_INTERVAL: float = 0.05
+    LOOP_MONITOR_LOG: bool = False
+
+    PROFILING_ENABLED: bool = False
+    PROFILE_DIR: str = "profiles"
+    PROFILE_KEEP: int = 20
+
+    ADMIN_TOKEN: str = ""
+
     class Config:
         env_file = ".env"
 
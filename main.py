@@ -4,14 +4,28 @@ Main application module.
 This module initializes the FastAPI app, sets up the database connection
 on startup,includes the versioned API routes."""
 
+import asyncio
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
+from starlette.concurrency import run_in_threadpool
 
 from api.v1 import router
+from api.v1.cache import start_invalidation_listener, stop_invalidation_listener
+from api.v1.events import checkins
 from api.v1.exception_handler import custom_app_exception_handler
 from api.v1.exceptions import AppException
+from api.v1.loop_monitor import loop_monitor
+from api.v1.middleware.compression import CompressionMiddleware
+from api.v1.middleware.metrics import MetricsMiddleware, metrics_endpoint
+from api.v1.middleware.profiling import ProfilingMiddleware
+from api.v1.middleware.query_budget import QueryBudgetMiddleware
+from api.v1.services.change_service import run_change_log_pruner
+from api.v1.services.qrcode_service import shutdown_qr_pool
+from api.v1.services.stats_service import run_stats_reconciler
+from api.v1.utils import require_admin
 from db.db_initializer import init_db
+from envconfig import EnvFile
 
 
 @asynccontextmanager
@@ -19,14 +33,64 @@ async def lifespan(app: FastAPI):
     """
     Handle the application's lifespan events.
 
-    Initializes the database before the application starts accepting requests.
+    Initializes the database before the application starts accepting requests,
+    and runs the statistics reconciler, the change log pruner, the check-in
+    broadcaster and the cache invalidation listener while the application is
+    up, along with the event loop monitor when it is enabled. The QR Code
+    worker pool is shut down on exit.
     """
+    if EnvFile.LOOP_MONITOR_ENABLED:
+        await loop_monitor.start()
     await init_db()
+    await checkins.start()
+    await start_invalidation_listener()
+
+    reconciler = None
+    if EnvFile.STATS_RECONCILE_INTERVAL > 0:
+        reconciler = asyncio.create_task(
+            run_stats_reconciler(EnvFile.STATS_RECONCILE_INTERVAL)
+        )
+    pruner = None
+    if EnvFile.CHANGE_PRUNE_INTERVAL > 0:
+        pruner = asyncio.create_task(
+            run_change_log_pruner(EnvFile.CHANGE_PRUNE_INTERVAL)
+        )
     yield
+    if reconciler:
+        reconciler.cancel()
+    if pruner:
+        pruner.cancel()
+    await checkins.stop()
+    await stop_invalidation_listener()
+    await loop_monitor.stop()
+    await run_in_threadpool(shutdown_qr_pool)
 
 
 app = FastAPI(lifespan=lifespan, docs_url=None, redoc_url=None, openapi_url=None)
 
 app.add_exception_handler(AppException, custom_app_exception_handler)
 
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=EnvFile.COMPRESSION_MIN_SIZE,
+    thread_threshold=EnvFile.COMPRESSION_THREAD_THRESHOLD,
+)
+
+if EnvFile.QUERY_DETECTOR_ENABLED:
+    app.add_middleware(QueryBudgetMiddleware)
+
+# Not installed at all when disabled, so that it costs nothing
+if EnvFile.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+if EnvFile.METRICS_ENABLED:
+    # Added last so it wraps the others and times the whole request
+    app.add_middleware(MetricsMiddleware, sample_rate=EnvFile.METRICS_SAMPLE_RATE)
+    app.add_api_route(
+        "/metrics",
+        metrics_endpoint,
+        include_in_schema=False,
+        dependencies=[Depends(require_admin)],
+    )
+
 app.include_router(router.router)
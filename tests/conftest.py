@@ -0,0 +1,62 @@
+"""
+Test configuration.
+
+The tests run against the MySQL database configured in `.env` and write to
+it, so it must be a disposable one. They need pytest and httpx, and are
+skipped when the database cannot be reached.
+
+Each test runs in an event loop of its own, see `run`, and the pooled
+connections of `user_engine` are dropped at the end of every test.
+"""
+
+import asyncio
+from typing import Awaitable, Callable
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.exc import OperationalError
+
+from api.v1.query_budget import watch_engine
+from db.db_initializer import init_db
+from db.engine import user_engine
+from envconfig import EnvFile
+from main import app
+
+if not EnvFile.QUERY_DETECTOR_ENABLED:
+    # Otherwise already watched by `db.engine`
+    watch_engine(user_engine)
+
+
+async def _init():
+    try:
+        await init_db()
+    finally:
+        await user_engine.dispose()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    try:
+        asyncio.run(_init())
+    except (OSError, OperationalError) as exc:
+        pytest.skip(f"Database unavailable: {exc}")
+
+
+@pytest.fixture
+def run() -> Callable[[Callable[[AsyncClient], Awaitable[None]]], None]:
+    """Runs a scenario with a client of the application, in a new event loop."""
+
+    def runner(scenario: Callable[[AsyncClient], Awaitable[None]]):
+        async def main():
+            transport = ASGITransport(app=app)
+            try:
+                async with AsyncClient(
+                    transport=transport, base_url="http://test"
+                ) as c:
+                    await scenario(c)
+            finally:
+                await user_engine.dispose()
+
+        asyncio.run(main())
+
+    return runner
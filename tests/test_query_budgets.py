@@ -0,0 +1,138 @@
+"""
+Query budget tests.
+
+Every route of `QUERY_BUDGETS` is called under `assert_query_budget`, which
+fails with the list of statements when the route runs more than its budget.
+Rows are set up directly in the database, outside the measured block.
+"""
+
+from datetime import date
+
+from api.v1.models.attendance import Attendance
+from api.v1.models.enrollment import Enrollment
+from api.v1.models.formation import Formation
+from api.v1.models.formation_type import FormationType
+from api.v1.models.payment import Payment
+from api.v1.models.qrcode import QRCode
+from api.v1.models.student import Student
+from api.v1.models.teacher import Teacher
+from api.v1.query_budget import assert_query_budget
+from db.session import async_session
+
+ENROLL = "/api/v1/students/{student_id}/enroll/{formation_id}"
+REMOVE = "/api/v1/students/{student_id}/enrollments/{formation_id}/remove"
+DELETE = "/api/v1/students/{id}/delete"
+ASSIGN = "/api/v1/formations/assign/{teacher_id}"
+UNASSIGN = "/api/v1/formations/unassign/{teacher_id}"
+
+
+async def _add(row):
+    async with async_session() as session:
+        session.add(row)
+        await session.commit()
+    return row
+
+
+async def _student(qr_path: str) -> Student:
+    qrcode = await _add(QRCode(url=qr_path))
+    return await _add(
+        Student(name="Budget Student", birth_date=date(2015, 1, 1), qrcode=qrcode.id)
+    )
+
+
+async def _formation(teacher_id: int = None) -> Formation:
+    formation_type = await _add(FormationType(label="Budget"))
+    return await _add(
+        Formation(
+            formation_type=formation_type.id,
+            start_date=date.today(),
+            teacher_id=teacher_id,
+        )
+    )
+
+
+def test_enroll(run, tmp_path):
+    async def scenario(client):
+        student = await _student(str(tmp_path / "qr.webp"))
+        formation = await _formation()
+
+        with assert_query_budget(method="POST", route=ENROLL):
+            res = await client.post(
+                f"/api/v1/students/{student.id}/enroll/{formation.id}"
+            )
+        assert res.status_code == 201
+
+    run(scenario)
+
+
+def test_remove_enrollment(run, tmp_path):
+    async def scenario(client):
+        student = await _student(str(tmp_path / "qr.webp"))
+        formation = await _formation()
+        await _add(Enrollment(student_id=student.id, formation_id=formation.id))
+
+        with assert_query_budget(method="DELETE", route=REMOVE):
+            res = await client.delete(
+                f"/api/v1/students/{student.id}/enrollments/{formation.id}/remove"
+            )
+        assert res.status_code == 200
+
+    run(scenario)
+
+
+def test_delete_student(run, tmp_path):
+    async def scenario(client):
+        qr_path = tmp_path / "qr.webp"
+        qr_path.write_bytes(b"")
+        student = await _student(str(qr_path))
+        formation = await _formation()
+        await _add(Enrollment(student_id=student.id, formation_id=formation.id))
+        # Attendances and payments make it refresh the dashboard rollups too
+        today = date.today()
+        await _add(Attendance(student_id=student.id, attend_date=today))
+        await _add(
+            Payment(
+                student_id=student.id,
+                month=today.month,
+                year=today.year,
+                payment_date=today,
+                amount=50,
+            )
+        )
+
+        with assert_query_budget(method="DELETE", route=DELETE):
+            res = await client.delete(f"/api/v1/students/{student.id}/delete")
+        assert res.status_code == 200
+        assert not qr_path.exists()
+
+    run(scenario)
+
+
+def test_assign_formation(run):
+    async def scenario(client):
+        teacher = await _add(Teacher(name="Budget Teacher"))
+        formation = await _formation()
+
+        with assert_query_budget(method="PATCH", route=ASSIGN):
+            res = await client.patch(
+                f"/api/v1/formations/assign/{teacher.id}",
+                json={"formation_id": formation.id},
+            )
+        assert res.status_code == 200
+
+    run(scenario)
+
+
+def test_unassign_formation(run):
+    async def scenario(client):
+        teacher = await _add(Teacher(name="Budget Teacher"))
+        formation = await _formation(teacher.id)
+
+        with assert_query_budget(method="PATCH", route=UNASSIGN):
+            res = await client.patch(
+                f"/api/v1/formations/unassign/{teacher.id}",
+                json={"formation_id": formation.id},
+            )
+        assert res.status_code == 200
+
+    run(scenario)